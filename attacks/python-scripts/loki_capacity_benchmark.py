@@ -0,0 +1,528 @@
+#!/usr/bin/env python3
+"""
+================================================================================
+LOKI INGESTION CAPACITY BENCHMARK - SIEM CAPACITY PLANNING
+================================================================================
+
+Measures how much log volume our Loki limits (config/siem/loki-config.yaml:
+ingestion_rate_mb, ingestion_burst_size_mb, max_streams_per_user) really
+let through, using the push client of loki_cardinality_attack.py
+(LokiAttackClient._build_payload / push_payload).
+
+Traffic
+    Realistic lines of our four shippers, with the labels their Fluent Bit
+    pipelines set (config/fluent-bit/*/pipelines):
+
+        webapp       JSON log (LOG_FORMAT=json)     job, host, level, module
+        nftables     parsed NFLOG record            job, host, action, protocol, rule_name
+        modsecurity  audit log transaction          job, host, status, client
+        suricata     eve.json (alert lifted)        job, host, event, action, priority
+
+    The label values come from fixed lists, so the stream count is bounded
+    and printed at start (modsecurity labels the client IP; --modsec-clients
+    sets how many distinct clients are simulated). Lines come from a
+    pre-generated corpus so generating them does not limit the push rate.
+
+Load
+    Stepped open-loop rate in MB/s of log line bytes (what ingestion_rate_mb
+    counts): --start-mb, --step-mb, up to --max-mb, --step-seconds each.
+    Every --flush-interval each shipper pushes its share of the rate in one
+    request, like Fluent Bit's Flush. Latency is measured from the scheduled
+    send time, so a backlog on the client side shows up as latency.
+
+Report (per step)
+    offered/accepted MB/s, pushes, 429 share, push latency p50/p95/p99/max,
+    and from Loki's /metrics: resident memory, Go heap in use, streams in
+    memory and samples discarded for rate limiting. Summary: highest step
+    without 429, the 429 onset and the headroom over --current-mb.
+
+Local Loki with our config (the config binds 127.0.0.1 inside the container):
+
+    docker run --rm -p 3100:3100 \\
+        -v "$PWD/config/siem/loki-config.yaml:/etc/loki/config.yml:ro" \\
+        grafana/loki:latest -config.file=/etc/loki/config.yml -server.http-listen-address=0.0.0.0
+
+    python3 attacks/python-scripts/loki_capacity_benchmark.py --host 127.0.0.1 --max-mb 4
+
+Only run this against a Loki you own: every step writes real data.
+
+Date: 2026-10-17
+================================================================================
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import random
+import re
+import statistics
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from loki_cardinality_attack import LokiAttackClient, LokiTarget
+
+# ==============================================================================
+# TRAFFIC MODEL
+# ==============================================================================
+
+CLIENT_NET = "203.0.113."
+DMZ_HOSTS = ["10.10.10.3", "10.10.10.4"]
+INTERNAL_HOSTS = ["10.10.20.2", "10.10.30.2", "10.10.30.3", "10.10.30.4", "10.10.40.2"]
+
+
+def _iso_now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f+0000")
+
+
+def _client_ip() -> str:
+    return CLIENT_NET + str(random.randint(1, 254))
+
+
+def _labels(fixed: Dict[str, str], **choices: List[str]) -> List[Dict[str, str]]:
+    """All label sets: fixed labels x every combination of the choices."""
+    keys = list(choices)
+    return [dict(fixed, **dict(zip(keys, combo))) for combo in itertools.product(*choices.values())]
+
+
+WEBAPP_EVENTS = [
+    ("INFO", "SIGNIN_SUCCESS", "User '{user}' logged in from {ip}."),
+    ("WARNING", "SIGNIN_FAILED", "Invalid credentials attempt for username '{user}' from {ip}."),
+    ("INFO", "CAPTCHA_FAIL", "Incorrect code from {ip}"),
+    ("WARNING", "RATE_LIMITED", "POST /signin from {ip} exceeded policy 'signin'. Returning 429."),
+    ("WARNING", "HOST_CHECK_FAILED", "Missing Host header from {ip}. Blocking."),
+    ("INFO", "ACCESS_GRANTED", "User '{user}' accessed dashboard."),
+    ("ERROR", "DB_ERROR", "(2013, 'Lost connection to MySQL server during query')"),
+]
+
+
+def webapp_line(labels: Dict[str, str]) -> str:
+    level = labels["level"]
+    _, event, template = random.choice([e for e in WEBAPP_EVENTS if e[0] == level] or WEBAPP_EVENTS)
+    user, ip = f"user{random.randint(1, 5000)}", _client_ip()
+    return json.dumps({
+        "time": _iso_now(), "level": level, "module": labels["module"], "event": event,
+        "message": f"{event}: " + template.format(user=user, ip=ip),
+        "client_ip": ip, "path": random.choice(["/signin", "/signup", "/dashboard", "/captcha/image"]),
+        "user": user, "latency_ms": round(random.uniform(2, 400), 2), "request_id": uuid.uuid4().hex,
+    }, separators=(",", ":"))
+
+
+NFT_RULES = {
+    "FWE_ALLOW_WEB_DMZ": "ALLOW", "FWE_DROP_INPUT": "DROP", "FWE_DROP_FORWARD": "DROP",
+    "FWI_ALLOW_DB": "ALLOW", "FWI_ALLOW_SIEM": "ALLOW", "FWI_DROP_FORWARD": "DROP",
+    "FWI_REJECT_MGMT": "REJECT",
+}
+
+
+def nftables_line(labels: Dict[str, str]) -> str:
+    proto = {"TCP": 6, "UDP": 17, "ICMP": 1}[labels["protocol"]]
+    record = {
+        "oob.prefix": labels["rule_name"] + ": ", "oob.time.sec": int(time.time()), "oob.time.usec": random.randint(0, 999999),
+        "oob.in": random.choice(["eth1", "eth2", "eth3"]), "oob.out": random.choice(["", "eth2"]),
+        "ip.saddr": random.choice([_client_ip()] + INTERNAL_HOSTS), "ip.daddr": random.choice(DMZ_HOSTS + INTERNAL_HOSTS),
+        "ip.protocol": proto, "ip.ttl": random.choice([63, 64, 127]), "ip.totlen": random.randint(40, 1500),
+        "rule_name": labels["rule_name"], "action": labels["action"], "protocol": labels["protocol"],
+    }
+    if proto != 1:
+        record["dest_port"] = random.choice([22, 53, 80, 123, 443, 3025, 3100, 3306])
+        record["src_port"] = random.randint(1024, 65535)
+    return json.dumps(record, separators=(",", ":"))
+
+
+MODSEC_RULES = [
+    ("942100", "SQL Injection Attack Detected via libinjection", "attack-sqli"),
+    ("941100", "XSS Attack Detected via libinjection", "attack-xss"),
+    ("930110", "Path Traversal Attack (/../) or (/.. /)", "attack-lfi"),
+    ("920350", "Host header is a numeric IP address", "protocol-violation"),
+    ("949110", "Inbound Anomaly Score Exceeded (Total Score: 15)", "anomaly-evaluation"),
+]
+
+
+def modsecurity_line(labels: Dict[str, str]) -> str:
+    status = labels["status"]
+    messages = []
+    if status != "ALLOWED":
+        for rule_id, message, tag in random.sample(MODSEC_RULES, random.randint(1, 3)):
+            messages.append({"message": message, "details": {
+                "match": "Matched Operator `Rx' against variable `ARGS:username'", "reference": "o0,10v21,10",
+                "ruleId": rule_id, "file": f"/etc/modsecurity/crs/rules/REQUEST-{rule_id[:3]}.conf",
+                "lineNumber": str(random.randint(40, 900)), "data": "Matched Data: ' or 1=1 found",
+                "severity": "2", "ver": "OWASP_CRS/4.0.0", "rev": "", "tags": ["application-multi", tag, "paranoia-level/3"],
+                "maturity": "0", "accuracy": "0"}})
+    return json.dumps({
+        "client_ip": labels["client"], "time_stamp": time.strftime("%a %b %d %H:%M:%S %Y"),
+        "server_id": uuid.uuid4().hex[:40], "client_port": random.randint(1024, 65535),
+        "host_ip": "10.10.10.3", "host_port": 443, "unique_id": str(time.time_ns()),
+        "request": {"method": random.choice(["GET", "POST"]), "http_version": 1.1,
+                    "uri": random.choice(["/signin", "/signup", "/", "/captcha/image", "/dashboard"]),
+                    "headers": {"Host": "web.sun.dmz", "User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:128.0)",
+                                "Accept": "text/html,application/xhtml+xml", "Content-Type": "application/x-www-form-urlencoded"}},
+        "response": {"body": "", "headers": {"Server": "nginx", "Content-Type": "text/html; charset=utf-8"}},
+        "http_code": 403 if status == "BLOCKED" else 200,
+        "producer": {"modsecurity": "ModSecurity v3.0.12 (Linux)", "connector": "ModSecurity-nginx v1.0.3",
+                     "secrules_engine": "Enabled", "components": ["OWASP_CRS/4.0.0\""]},
+        "messages": messages, "status": status,
+    }, separators=(",", ":"))
+
+
+SURICATA_SIGNATURES = [
+    (2100498, "GPL ATTACK_RESPONSE id check returned root", "Potentially Bad Traffic"),
+    (2001219, "ET SCAN Potential SSH Scan", "Attempted Information Leak"),
+    (2010935, "ET SCAN Suspicious inbound to MSSQL port 1433", "Potentially Bad Traffic"),
+    (2024364, "ET SCAN Possible Nmap User-Agent Observed", "Web Application Attack"),
+]
+
+
+def suricata_line(labels: Dict[str, str]) -> str:
+    record = {
+        "timestamp": _iso_now(), "flow_id": random.getrandbits(50), "in_iface": "eth1", "event": labels["event"],
+        "src_ip": _client_ip(), "src_port": random.randint(1024, 65535), "dest_ip": random.choice(DMZ_HOSTS),
+        "dest_port": random.choice([80, 443, 22]), "proto": "TCP", "community_id": "1:" + uuid.uuid4().hex[:27] + "=",
+    }
+    if labels["event"] == "alert":
+        sid, signature, category = random.choice(SURICATA_SIGNATURES)
+        record.update(action=labels["action"], gid=1, signature_id=sid, rev=random.randint(1, 9), signature=signature,
+                      category=category, alert_priority=int(labels["priority"]), app_proto="http")
+    elif labels["event"] == "flow":
+        record["flow"] = {"pkts_toserver": random.randint(1, 40), "pkts_toclient": random.randint(0, 40),
+                          "bytes_toserver": random.randint(60, 9000), "bytes_toclient": random.randint(0, 90000),
+                          "start": _iso_now(), "end": _iso_now(), "age": random.randint(0, 30), "state": "closed",
+                          "reason": "timeout", "alerted": False}
+    elif labels["event"] == "http":
+        record["http"] = {"hostname": "web.sun.dmz", "url": random.choice(["/", "/signin", "/signup"]),
+                          "http_user_agent": "Mozilla/5.0", "http_method": "GET", "protocol": "HTTP/1.1",
+                          "status": random.choice([200, 302, 403, 429]), "length": random.randint(100, 5000)}
+    else:
+        record["dns"] = {"type": "query", "id": random.randint(1, 65535), "rrname": "web.sun.dmz", "rrtype": "A"}
+    return json.dumps(record, separators=(",", ":"))
+
+
+@dataclass
+class Source:
+    """One shipper: its label sets, a line generator and its share of the total rate."""
+    name: str
+    weight: float
+    label_sets: List[Dict[str, str]]
+    make_line: Callable[[Dict[str, str]], str]
+    corpus: List[Tuple[int, str]] = field(default_factory=list)  # (label set index, line)
+    cursor: int = 0
+
+    def build_corpus(self, size: int):
+        self.corpus = []
+        for _ in range(size):
+            index = random.randrange(len(self.label_sets))
+            self.corpus.append((index, self.make_line(self.label_sets[index])))
+
+    def take(self, line_bytes: int) -> Tuple[Dict[int, List[str]], int]:
+        """Next lines from the corpus, grouped by label set, totalling at least `line_bytes`."""
+        streams: Dict[int, List[str]] = {}
+        taken = 0
+        while taken < line_bytes:
+            index, line = self.corpus[self.cursor]
+            self.cursor = (self.cursor + 1) % len(self.corpus)
+            streams.setdefault(index, []).append(line)
+            taken += len(line)
+        return streams, taken
+
+
+def build_sources(modsec_clients: int, mix: Dict[str, float]) -> List[Source]:
+    clients = [CLIENT_NET + str(i) for i in range(1, modsec_clients + 1)]
+    suricata_alerts = _labels({"job": "suricata"}, host=["edge_router_debian", "webserver_alpine"],
+                              event=["alert"], action=["allowed", "blocked"], priority=["1", "2", "3"])
+    suricata_other = _labels({"job": "suricata"}, host=["edge_router_debian", "webserver_alpine"],
+                             event=["flow", "http", "dns"])
+    sources = [
+        Source("webapp", mix.get("webapp", 0), _labels({"job": "webapp", "host": "webserver_alpine"},
+               level=["INFO", "WARNING", "ERROR"], module=["app"]), webapp_line),
+        Source("nftables", mix.get("nftables", 0), [
+            dict(labels, action=NFT_RULES[labels["rule_name"]])
+            for labels in _labels({"job": "nftables"}, host=["edge_router_debian", "internal_router_debian"],
+                                  protocol=["TCP", "UDP", "ICMP"], rule_name=list(NFT_RULES))
+            if labels["rule_name"].startswith("FWE" if labels["host"].startswith("edge") else "FWI")], nftables_line),
+        Source("modsecurity", mix.get("modsecurity", 0), _labels({"job": "modsecurity", "host": "waf_debian"},
+               status=["ALLOWED", "SUSPICIOUS", "BLOCKED"], client=clients), modsecurity_line),
+        Source("suricata", mix.get("suricata", 0), suricata_alerts + suricata_other, suricata_line),
+    ]
+    return [s for s in sources if s.weight > 0]
+
+
+# ==============================================================================
+# LOKI METRICS
+# ==============================================================================
+
+METRIC_LINE = re.compile(r'^(?P<name>[a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(?P<labels>[^}]*)\})?\s+(?P<value>\S+)')
+
+
+def scrape_metrics(client: LokiAttackClient) -> Optional[Dict[str, float]]:
+    """The few Loki metrics the report needs (summed over all series), None if /metrics is unavailable."""
+    try:
+        resp = client.session.get(f"{client.base_url}/metrics", timeout=client.timeout)
+    except Exception:
+        return None
+    if resp.status_code != 200:
+        return None
+    result = {"rss_bytes": 0.0, "heap_inuse_bytes": 0.0, "memory_streams": 0.0, "memory_chunks": 0.0,
+              "discarded_rate_limited": 0.0, "discarded_stream_limit": 0.0, "received_bytes": 0.0}
+    wanted = {
+        "process_resident_memory_bytes": "rss_bytes",
+        "go_memstats_heap_inuse_bytes": "heap_inuse_bytes",
+        "loki_ingester_memory_streams": "memory_streams",
+        "loki_ingester_memory_chunks": "memory_chunks",
+        "loki_distributor_bytes_received_total": "received_bytes",
+    }
+    for line in resp.text.splitlines():
+        match = METRIC_LINE.match(line)
+        if not match:
+            continue
+        name, labels = match["name"], match["labels"] or ""
+        try:
+            value = float(match["value"])
+        except ValueError:
+            continue
+        if name in wanted:
+            result[wanted[name]] += value
+        elif name == "loki_discarded_samples_total":
+            if 'reason="rate_limited"' in labels:
+                result["discarded_rate_limited"] += value
+            elif 'reason="per_stream_rate_limit"' in labels or 'reason="stream_limit"' in labels:
+                result["discarded_stream_limit"] += value
+    return result
+
+
+# ==============================================================================
+# BENCHMARK
+# ==============================================================================
+
+@dataclass
+class StepResult:
+    target_mb: float
+    seconds: float = 0.0
+    offered_bytes: int = 0
+    accepted_bytes: int = 0
+    pushes: int = 0
+    rejected_429: int = 0
+    errors: int = 0
+    latencies: List[float] = field(default_factory=list)
+    metrics: Optional[Dict[str, float]] = None
+    metrics_delta: Dict[str, float] = field(default_factory=dict)
+
+    def percentile(self, p: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    def as_dict(self) -> Dict:
+        mb = 1024 * 1024
+        return {
+            "target_mb_s": self.target_mb,
+            "offered_mb_s": round(self.offered_bytes / mb / self.seconds, 3) if self.seconds else 0,
+            "accepted_mb_s": round(self.accepted_bytes / mb / self.seconds, 3) if self.seconds else 0,
+            "pushes": self.pushes,
+            "rejected_429": self.rejected_429,
+            "errors": self.errors,
+            "latency_ms": {f"p{p}": round(self.percentile(p) * 1000, 1) for p in (50, 95, 99)}
+            | {"max": round(max(self.latencies, default=0) * 1000, 1)},
+            "loki": self.metrics,
+            "loki_delta": self.metrics_delta,
+        }
+
+
+class CapacityBenchmark:
+    def __init__(self, client: LokiAttackClient, sources: List[Source], flush_interval: float, senders: int):
+        self.client = client
+        self.sources = sources
+        self.flush_interval = flush_interval
+        self.executor = ThreadPoolExecutor(max_workers=senders)
+        self._lock = threading.Lock()
+
+    def _push(self, result: StepResult, payload: Dict, line_bytes: int, scheduled: float):
+        status = self.client.push_payload(payload)
+        latency = time.perf_counter() - scheduled
+        with self._lock:
+            result.pushes += 1
+            result.latencies.append(latency)
+            if status in (200, 204):
+                result.accepted_bytes += line_bytes
+            elif status == 429:
+                result.rejected_429 += 1
+            else:
+                result.errors += 1
+
+    def _payload(self, source: Source, line_bytes: int) -> Tuple[Dict, int]:
+        """One push request of a shipper: all its streams in one payload, like Fluent Bit's flush."""
+        streams, taken = source.take(line_bytes)
+        ts = time.time_ns()
+        payload = {"streams": []}
+        for index, lines in streams.items():
+            entries = [{"ts": str(ts + i), "line": line} for i, line in enumerate(lines)]
+            payload["streams"] += self.client._build_payload(source.label_sets[index], entries)["streams"]
+        return payload, taken
+
+    def run_step(self, rate_mb: float, seconds: float) -> StepResult:
+        result = StepResult(target_mb=rate_mb)
+        before = scrape_metrics(self.client)
+        bytes_per_flush = rate_mb * 1024 * 1024 * self.flush_interval
+        total_weight = sum(s.weight for s in self.sources)
+        futures = []
+        start = time.perf_counter()
+        ticks = max(1, int(round(seconds / self.flush_interval)))
+        for tick in range(ticks):
+            scheduled = start + tick * self.flush_interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            for source in self.sources:
+                payload, taken = self._payload(source, int(bytes_per_flush * source.weight / total_weight))
+                result.offered_bytes += taken
+                futures.append(self.executor.submit(self._push, result, payload, taken, scheduled))
+        for future in futures:
+            future.result()
+        result.seconds = max(time.perf_counter() - start, ticks * self.flush_interval)
+        result.metrics = scrape_metrics(self.client)
+        if before and result.metrics:
+            result.metrics_delta = {key: result.metrics[key] - before[key] for key in
+                                    ("discarded_rate_limited", "discarded_stream_limit", "received_bytes")}
+        return result
+
+
+def format_step(step: Dict) -> str:
+    loki = step["loki"] or {}
+    delta = step["loki_delta"] or {}
+    share = step["rejected_429"] / step["pushes"] * 100 if step["pushes"] else 0
+    lat = step["latency_ms"]
+    memory = (f"rss {loki['rss_bytes'] / 2 ** 20:7.1f}MiB heap {loki['heap_inuse_bytes'] / 2 ** 20:7.1f}MiB "
+              f"streams {int(loki['memory_streams']):5d} discarded {int(delta.get('discarded_rate_limited', 0)):7d}"
+              if loki else "no /metrics")
+    return (f"  {step['target_mb_s']:6.2f} {step['offered_mb_s']:8.2f} {step['accepted_mb_s']:9.2f} "
+            f"{step['pushes']:6d} {share:5.1f}% {step['errors']:4d} "
+            f"{lat['p50']:7.1f} {lat['p95']:7.1f} {lat['p99']:7.1f} {lat['max']:7.1f}  {memory}")
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Loki ingestion capacity benchmark with the lab's shipper traffic",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="EXAMPLE:\n  python3 %(prog)s --host 127.0.0.1 --start-mb 0.5 --step-mb 0.5 --max-mb 4 --json capacity.json",
+    )
+    target_group = parser.add_argument_group("Target")
+    target_group.add_argument("--host", default="127.0.0.1", help="Loki host (default: 127.0.0.1)")
+    target_group.add_argument("--port", type=int, default=3100, help="Loki port (default: 3100)")
+    target_group.add_argument("--user", help="HTTP Basic Auth user (Loki behind the SIEM nginx)")
+    target_group.add_argument("--passwd", help="HTTP Basic Auth password")
+    target_group.add_argument("--tenant", help="X-Scope-OrgID (only with auth_enabled: true)")
+
+    load_group = parser.add_argument_group("Load")
+    load_group.add_argument("--start-mb", type=float, default=0.25, help="first step in MB/s of line bytes (default: 0.25)")
+    load_group.add_argument("--step-mb", type=float, default=0.25, help="increase per step (default: 0.25)")
+    load_group.add_argument("--max-mb", type=float, default=4.0, help="last step (default: 4)")
+    load_group.add_argument("--step-seconds", type=float, default=20, help="duration of a step (default: 20)")
+    load_group.add_argument("--flush-interval", type=float, default=1.0, help="seconds between pushes per shipper (Fluent Bit Flush, default: 1)")
+    load_group.add_argument("--mix", type=parse_mix, default=parse_mix("webapp=0.2,nftables=0.3,modsecurity=0.3,suricata=0.2"),
+                            help="share of the rate per shipper (default: webapp=0.2,nftables=0.3,modsecurity=0.3,suricata=0.2)")
+    load_group.add_argument("--modsec-clients", type=int, default=20, help="distinct client IPs in the modsecurity 'client' label (default: 20)")
+    load_group.add_argument("--corpus", type=int, default=4000, help="pre-generated lines per shipper (default: 4000)")
+    load_group.add_argument("--senders", type=int, default=8, help="concurrent push requests (default: 8)")
+    load_group.add_argument("--stop-rejected", type=float, default=0.5, help="stop once this share of pushes gets 429 (default: 0.5)")
+    load_group.add_argument("--settle", type=float, default=5, help="pause between steps in seconds, lets the rate limiter refill (default: 5)")
+
+    parser.add_argument("--current-mb", type=float, help="today's shipper volume in MB/s, for the headroom figure")
+    parser.add_argument("--json", metavar="FILE", help="write all steps as JSON")
+    parser.add_argument("--seed", type=int, default=1, help="random seed of the corpus (default: 1)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Enable verbose output")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format="%(message)s")
+    random.seed(args.seed)
+
+    target = LokiTarget(host=args.host, port=args.port, path="/loki/api/v1/push", labels={},
+                        tenant_id=args.tenant, http_user=args.user, http_passwd=args.passwd)
+    client = LokiAttackClient(target)
+
+    sources = build_sources(args.modsec_clients, args.mix)
+    if not sources:
+        parser.error("--mix selects no shipper")
+    logging.info("[*] Building traffic corpus")
+    for source in sources:
+        source.build_corpus(args.corpus)
+        avg = statistics.fmean(len(line) for _, line in source.corpus)
+        logging.info(f"    {source.name:12} {len(source.label_sets):4d} streams, share {source.weight:.2f}, "
+                     f"avg line {avg:.0f} bytes")
+    streams = sum(len(s.label_sets) for s in sources)
+    logging.info(f"    Total: {streams} possible streams")
+
+    try:
+        resp = client.session.get(f"{client.base_url}/ready", timeout=client.timeout)
+        if resp.status_code != 200:
+            logging.error(f"[!] Loki not ready: HTTP {resp.status_code} {resp.text.strip()}")
+            sys.exit(1)
+    except Exception as e:
+        logging.error(f"[!] Cannot reach Loki at {client.base_url}: {e}")
+        sys.exit(1)
+    if scrape_metrics(client) is None:
+        logging.warning("[!] /metrics not reachable: memory and discard figures are missing")
+
+    bench = CapacityBenchmark(client, sources, args.flush_interval, args.senders)
+    steps = []
+    logging.info(f"\n  {'target':>6} {'offered':>8} {'accepted':>9} {'pushes':>6} {'429':>6} {'err':>4} "
+                 f"{'p50ms':>7} {'p95ms':>7} {'p99ms':>7} {'maxms':>7}  loki")
+    rate = args.start_mb
+    try:
+        while rate <= args.max_mb + 1e-9:
+            step = bench.run_step(rate, args.step_seconds).as_dict()
+            steps.append(step)
+            logging.info(format_step(step))
+            if step["pushes"] and step["rejected_429"] / step["pushes"] >= args.stop_rejected:
+                logging.info(f"[*] {step['rejected_429']}/{step['pushes']} pushes rejected, stopping")
+                break
+            rate = round(rate + args.step_mb, 6)
+            time.sleep(args.settle)
+    except KeyboardInterrupt:
+        logging.info("[*] Interrupted")
+    finally:
+        bench.executor.shutdown(wait=False)
+
+    clean = [s for s in steps if s["rejected_429"] == 0 and s["errors"] == 0]
+    onset = next((s for s in steps if s["rejected_429"]), None)
+    summary = {
+        "max_clean_mb_s": max((s["accepted_mb_s"] for s in clean), default=None),
+        "first_429_target_mb_s": onset["target_mb_s"] if onset else None,
+        "peak_accepted_mb_s": max((s["accepted_mb_s"] for s in steps), default=None),
+        "streams": streams,
+    }
+    logging.info("\n" + "=" * 60)
+    logging.info("CAPACITY SUMMARY")
+    logging.info("=" * 60)
+    logging.info(f"  Highest step without 429:  {summary['max_clean_mb_s']} MB/s accepted")
+    logging.info(f"  429 onset:                 {summary['first_429_target_mb_s'] or 'not reached'}"
+                 f"{' MB/s offered' if onset else ''}")
+    logging.info(f"  Peak accepted:             {summary['peak_accepted_mb_s']} MB/s")
+    if args.current_mb and summary["max_clean_mb_s"]:
+        summary["headroom"] = round(summary["max_clean_mb_s"] / args.current_mb, 2)
+        logging.info(f"  Headroom over {args.current_mb} MB/s:    x{summary['headroom']}")
+    logging.info("=" * 60)
+
+    if args.json:
+        with open(args.json, "w") as fh:
+            # Never write the Basic Auth credentials into the report
+            report_args = {k: v for k, v in vars(args).items() if k not in ("user", "passwd")}
+            json.dump({"args": report_args, "summary": summary, "steps": steps}, fh, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -316,17 +316,19 @@ class LokiAttackClient:
     
     def push_logs(self, labels: Dict[str, str], entries: List[Dict]) -> bool:
         """Push log entries to Loki with given labels."""
-        payload = self._build_payload(labels, entries)
-        
+        return self.push_payload(self._build_payload(labels, entries)) in (200, 204)
+    
+    def push_payload(self, payload: Dict) -> int:
+        """Push a ready-built payload; returns the HTTP status (0 if the request failed)."""
         try:
             resp = self.session.post(
                 self.push_url,
                 data=json.dumps(payload),
                 timeout=self.timeout
             )
-            return resp.status_code in (200, 204)
+            return resp.status_code
         except requests.RequestException:
-            return False
+            return 0
     
     def _build_payload(self, labels: Dict[str, str], entries: List[Dict]) -> Dict:
         """
@@ -1,13 +1,34 @@
 import logging
+import math
 import os
 import secrets
-from flask import Flask, render_template, request, redirect, session, url_for, send_file, abort
+import ipaddress
+import threading
+import time
+import uuid
+from flask import Flask, render_template, request, redirect, session, url_for, abort, g, jsonify, Response, after_this_request, has_request_context
+from flask import before_render_template, template_rendered
+from flask.ctx import RequestContext
 from flask_session import Session
-from captcha.image import ImageCaptcha
-from functools import wraps
+from werkzeug.test import EnvironBuilder
+from functools import wraps, partial
 import pymysql
-import bcrypt
-import io
+from db_pool import ConnectionPool, PoolExhausted
+from db_health import CircuitBreaker, DBHealthMonitor
+from db_router import ReadRouter, split_host
+from hash_pool import HashPool, HashPoolBusy
+from captcha_pool import CaptchaPool
+from page_cache import PageCache
+from profiling import Profiler
+from memory_diag import MemoryDiagnostics
+from rate_limit import RateLimiter, parse_policies
+import captcha_tokens
+import schema
+from username_filter import UsernameFilter
+from log_pipeline import BatchingFileHandler, DedupFilter, JsonFormatter, RequestContextFilter
+from tracing import Tracer, server_timing
+from metrics import Metrics
+from session_backends import ShardedMemoryStore, MemorySessionInterface, TimedSessionInterface, redis_session_interface
 
 app = Flask(__name__)
 
@@ -22,21 +43,143 @@ app.config["SESSION_FILE_DIR"] = "./flask_session"
 app.config["SESSION_PERMANENT"] = False
 app.config["SESSION_USE_SIGNER"] = True
 app.config["SESSION_COOKIE_SAMESITE"] = "Lax"
-Session(app)
+
+# Session-Backend: "filesystem" (Standard), "memory" (Shards im Prozess, TTL + LRU,
+# nur Single-Node) oder "redis" (Redis-kompatibler Server, von allen Workern geteilt)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "filesystem")
+SESSION_TTL = int(os.getenv("SESSION_TTL", "7200"))
+session_store = None
+if SESSION_BACKEND == "memory":
+    session_store = ShardedMemoryStore(shards=int(os.getenv("SESSION_SHARDS", "16")),
+                                       max_entries=int(os.getenv("SESSION_MAX_ENTRIES", "100000")))
+    app.session_interface = MemorySessionInterface(app, session_store, SESSION_TTL, use_signer=True)
+elif SESSION_BACKEND == "redis":
+    app.session_interface = redis_session_interface(app, os.getenv("SESSION_REDIS_URL", "redis://127.0.0.1:6379/0"),
+                                                    SESSION_TTL, use_signer=True)
+else:
+    Session(app)
 
 # 2. Allowed Host Header (Must match WAF config)
 
 # Hostkonfiguration
 ALLOWED_HOST = "web.sun.dmz"
 
+# Management-Netz: interne Endpunkte (z.B. /internal/stats) sind nur von hier erreichbar
+MGMT_NETWORKS = [ipaddress.ip_network(n.strip()) for n in os.getenv("MGMT_NETWORKS", "10.10.60.0/28,127.0.0.1/32").split(",") if n.strip()]
+
 # Database Configuration
 DB_HOST = os.getenv("DB_HOST", "10.10.40.2")
 DB_USER = os.getenv("DB_USER", "webuser")
 DB_PASS = os.getenv("DB_PASS", "webpass")
 DB_NAME = os.getenv("DB_NAME", "webapp")
 
+# Connection pool (one per gunicorn worker)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "2"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "3"))
+# Socket-Timeouts pro Abfrage: ein DB-Host, der nicht mehr antwortet, blockiert
+# einen Thread (inkl. Pre-Ping) höchstens so lange statt bis zum Gunicorn-Timeout
+DB_READ_TIMEOUT = int(os.getenv("DB_READ_TIMEOUT", "10"))
+DB_WRITE_TIMEOUT = int(os.getenv("DB_WRITE_TIMEOUT", "10"))
+
+# Read-Replicas (komma-getrennt, optional host:port). Leer = alles über DB_HOST.
+# Replicas mit mehr als DB_REPLICA_MAX_LAG Sekunden Verzögerung werden übersprungen.
+DB_REPLICA_HOSTS = [h.strip() for h in os.getenv("DB_REPLICA_HOSTS", "").split(",") if h.strip()]
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "5"))
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "2"))
+
+# DB health prober and circuit breaker
+DB_HEALTH_INTERVAL = float(os.getenv("DB_HEALTH_INTERVAL", "2"))
+DB_HEALTH_TTL = float(os.getenv("DB_HEALTH_TTL", "6"))
+DB_BREAKER_THRESHOLD = int(os.getenv("DB_BREAKER_THRESHOLD", "3"))
+DB_BREAKER_RESET = float(os.getenv("DB_BREAKER_RESET", "10"))
+DB_BREAKER_HALF_OPEN_MAX = int(os.getenv("DB_BREAKER_HALF_OPEN_MAX", "1"))
+
+# bcrypt process pool (one per gunicorn worker)
+HASH_POOL_WORKERS = int(os.getenv("HASH_POOL_WORKERS", "1"))
+HASH_POOL_QUEUE = int(os.getenv("HASH_POOL_QUEUE", "4"))
+HASH_POOL_TIMEOUT = float(os.getenv("HASH_POOL_TIMEOUT", "10"))
+# bcrypt-Kosten; passenden Wert pro Host mit `python hash_pool.py --target-ms 150` ermitteln.
+# Bestehende Hashes werden beim nächsten Login im Hintergrund angepasst.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Pre-rendered CAPTCHA buffer (one per gunicorn worker)
+CAPTCHA_POOL_SIZE = int(os.getenv("CAPTCHA_POOL_SIZE", "64"))
+CAPTCHA_POOL_MIN = int(os.getenv("CAPTCHA_POOL_MIN", "8"))
+CAPTCHA_POOL_HORIZON = float(os.getenv("CAPTCHA_POOL_HORIZON", "5"))
+
+# CAPTCHA-Modus: "session" (Antwort in der Server-Session) oder "token"
+# (HMAC-signiertes Token im Cookie, kein Session-Schreibzugriff pro Bild)
+CAPTCHA_MODE = os.getenv("CAPTCHA_MODE", "session")
+CAPTCHA_TOKEN_TTL = int(os.getenv("CAPTCHA_TOKEN_TTL", "300"))
+CAPTCHA_TOKEN_COOKIE = "captcha_token"
+CAPTCHA_NONCE_FILE = os.getenv("CAPTCHA_NONCE_FILE", "/dev/shm/webapp-captcha-nonces")
+# Höchste erwartete Rate eingelöster Tokens pro Knoten (alle Worker, pro Sekunde).
+# Bestimmt die Größe des Nonce-Caches (TTL x Rate); ist er voll, werden Tokens
+# abgelehnt statt benutzte Nonces zu verdrängen.
+CAPTCHA_TOKEN_MAX_RATE = float(os.getenv("CAPTCHA_TOKEN_MAX_RATE", "500"))
+
+# Username-Bloom-Filter (geteilt von allen Workern eines Knotens, tmpfs)
+USERNAME_FILTER = os.getenv("USERNAME_FILTER", "1") == "1"
+USERNAME_FILTER_FILE = os.getenv("USERNAME_FILTER_FILE", "/dev/shm/webapp-usernames")
+USERNAME_FILTER_CAPACITY = int(os.getenv("USERNAME_FILTER_CAPACITY", "1000000"))
+USERNAME_FILTER_ERROR = float(os.getenv("USERNAME_FILTER_ERROR", "0.01"))
+USERNAME_FILTER_SYNC = float(os.getenv("USERNAME_FILTER_SYNC", "5"))
+# Anzahl Webapp-Instanzen hinter der WAF. Der Filter ist pro Knoten und lernt
+# Namen anderer Knoten erst beim nächsten Sync (über ein Replica, ggf. mit
+# Verzögerung). Nur auf einem einzelnen Knoten ohne Replicas ist "sicher
+# unbekannt" daher verlässlich genug, um die Anmeldung ohne DB-Abfrage abzulehnen.
+WEBAPP_NODES = int(os.getenv("WEBAPP_NODES", "1"))
+
+# Rate-Limit pro Client (X-Real-IP) als zweite Stufe nach der WAF. Token-Buckets
+# im Shared Memory (tmpfs), gemeinsam für alle Worker. Policies: name=rate/burst
+# (Requests pro Sekunde / Burst). "signup" entspricht der WAF-Zone signup_limit.
+RATE_LIMIT = os.getenv("RATE_LIMIT", "1") == "1"
+RATE_LIMIT_FILE = os.getenv("RATE_LIMIT_FILE", "/dev/shm/webapp-ratelimit")
+RATE_LIMIT_POLICIES = parse_policies(os.getenv("RATE_LIMIT_POLICIES", "signin=2/10,signup=1/5,captcha=5/20"))
+
+# Profiling (opt-in): cProfile für einzelne Requests mit Header X-Profile: 1 aus
+# dem Management-Netz, Sampler per `kill -USR2 <Worker-PID>` oder POST
+# /internal/profile. Dateien: PROFILE_DIR/{request,sample}-<pid>-<Zeit>...
+PROFILING = os.getenv("PROFILING", "0") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/var/log/webapp-profiles")
+PROFILE_HEADER = "X-Profile"
+PROFILE_SAMPLE_SECONDS = float(os.getenv("PROFILE_SAMPLE_SECONDS", "30"))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+
+# Speicher-Diagnose: RSS-Verlauf pro Worker (/internal/memory), tracemalloc-
+# Snapshots auf Anfrage (MEMORY_DIAG=1: Tracing ab Worker-Start) und Recycling
+# eines Workers, sobald sein RSS MEMORY_RSS_LIMIT_MB (+ Jitter) überschreitet.
+MEMORY_DIAG = os.getenv("MEMORY_DIAG", "0") == "1"
+MEMORY_TRACE_FRAMES = int(os.getenv("MEMORY_TRACE_FRAMES", "10"))
+MEMORY_RSS_INTERVAL = float(os.getenv("MEMORY_RSS_INTERVAL", "10"))
+MEMORY_RSS_HISTORY = int(os.getenv("MEMORY_RSS_HISTORY", "360"))
+MEMORY_RSS_LIMIT_MB = float(os.getenv("MEMORY_RSS_LIMIT_MB", "0"))
+MEMORY_RSS_JITTER = float(os.getenv("MEMORY_RSS_JITTER", "0.1"))
+
+# Vorgerenderte Seiten (index, auth, Login-/Registrierungsformular, Fehlerseiten)
+# mit ETag und optionaler gzip-Variante ab PAGE_CACHE_GZIP_MIN Bytes (0 = aus)
+PAGE_CACHE = os.getenv("PAGE_CACHE", "1") == "1"
+PAGE_CACHE_GZIP_MIN = int(os.getenv("PAGE_CACHE_GZIP_MIN", "256"))
+
+# Request-Tracing: Spans pro Request, eine Zusammenfassungszeile (REQUEST_TRACE)
+# und optional ein Server-Timing-Header in der Antwort
+TRACE_REQUESTS = os.getenv("TRACE_REQUESTS", "0") == "1"
+TRACE_SERVER_TIMING = os.getenv("TRACE_SERVER_TIMING", "0") == "1"
+
+# Metriken: /metrics (nur Management-Netz) im Prometheus-Textformat, über alle
+# Gunicorn-Worker aggregiert (Dateien pro Worker in METRICS_DIR, tmpfs)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"
+METRICS_DIR = os.getenv("METRICS_DIR", "/dev/shm/webapp-metrics")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "1.0"))
+
 # --- LOGGING SETUP ---
-LOG_FILE = "/var/log/webapp.log"
+# LOG_FORMAT=text: klassisches Textformat (python_webapp-Parser in Fluent Bit)
+# LOG_FORMAT=json: ein JSON-Objekt pro Zeile mit Event, IP, Pfad, User, Latenz, Request-ID
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_FILE = os.getenv("LOG_FILE", "/var/log/webapp.json" if LOG_FORMAT == "json" else "/var/log/webapp.log")
 
 # Ensure log directory exists (important for container environments)
 log_dir = os.path.dirname(LOG_FILE)
@@ -50,79 +193,479 @@ if not os.path.exists(log_dir):
 logging.basicConfig(level=logging.INFO)
 
 # File handler for the security log file
-file_handler = logging.FileHandler(LOG_FILE)
+# LOG_ASYNC=1: Records gehen in eine begrenzte Queue, ein Writer-Thread pro Worker
+# schreibt sie gebündelt. LOG_ASYNC=0: synchroner FileHandler wie bisher.
+LOG_ASYNC = os.getenv("LOG_ASYNC", "1") == "1"
+if LOG_ASYNC:
+    file_handler = BatchingFileHandler(LOG_FILE,
+                                       max_queue=int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+                                       batch_size=int(os.getenv("LOG_BATCH_SIZE", "256")),
+                                       flush_interval=float(os.getenv("LOG_FLUSH_INTERVAL", "0.5")),
+                                       policy=os.getenv("LOG_QUEUE_POLICY", "drop"),
+                                       block_timeout=float(os.getenv("LOG_BLOCK_TIMEOUT", "0.05")))
+else:
+    # delay=True: Datei erst beim ersten Record öffnen, nicht schon beim Import
+    file_handler = logging.FileHandler(LOG_FILE, delay=True)
 file_handler.setLevel(logging.INFO)
 
 # Define a robust format for security logging
-file_handler.setFormatter(logging.Formatter(
-    '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
-))
+if LOG_FORMAT == "json":
+    file_handler.setFormatter(JsonFormatter())
+else:
+    file_handler.setFormatter(logging.Formatter(
+        '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
+    ))
+
+def log_context():
+    """Request-Felder für strukturierte Logs (leer außerhalb eines Requests)."""
+    if not has_request_context():
+        return {}
+    # dict.get statt session.get: das Lesen soll die Session nicht als 'accessed' markieren
+    user = g.get("log_user") or dict.get(session._get_current_object(), "user")
+    start = g.get("request_start")
+    return {
+        "request_id": g.get("request_id"),
+        "client_ip": request.headers.get("X-Real-IP") or request.remote_addr,
+        "method": request.method,
+        "path": request.path,
+        "user": user,
+        "latency_ms": round((time.perf_counter() - start) * 1000, 2) if start is not None else None,
+    }
+
+# Flood-Schutz: pro (Event, Client-IP) und Fenster nur die ersten N Zeilen schreiben,
+# den Rest zählen und am Fensterende als eine zusammengefasste Zeile ausgeben.
+LOG_DEDUP = os.getenv("LOG_DEDUP", "1") == "1"
+LOG_DEDUP_WINDOW = float(os.getenv("LOG_DEDUP_WINDOW", "10"))
+LOG_DEDUP_EVENT_BUDGET = int(os.getenv("LOG_DEDUP_EVENT_BUDGET", "50"))
+LOG_DEDUP_BUDGETS = {
+    "HOST_CHECK_FAILED": 1,
+    "UNAUTHORIZED_ACCESS": 3,
+    "HTTP_ERROR": 5,
+    "CAPTCHA_FAIL": 3,
+    "SECURITY": 3,
+    "DB_CHECK_FAILED": 1,
+    "DB_POOL_EXHAUSTED": 1,
+    "DB_REPLICA_UNAVAILABLE": 1,
+    "HASH_POOL_BUSY": 1,
+    "RATE_LIMITED": 1,
+}
+# Override/extend via LOG_DEDUP_BUDGETS="EVENT=n,EVENT=n"
+for item in filter(None, os.getenv("LOG_DEDUP_BUDGETS", "").split(",")):
+    event, _, budget = item.partition("=")
+    LOG_DEDUP_BUDGETS[event.strip()] = int(budget)
+
+def log_client_ip(record):
+    return request.headers.get("X-Real-IP") or request.remote_addr if has_request_context() else None
+
+log_dedup = None
+if LOG_DEDUP:
+    log_dedup = DedupFilter(log_client_ip, LOG_DEDUP_BUDGETS, file_handler.handle, window=LOG_DEDUP_WINDOW,
+                            event_budget=LOG_DEDUP_EVENT_BUDGET)
+    file_handler.addFilter(log_dedup)
+
+if LOG_FORMAT == "json":
+    file_handler.addFilter(RequestContextFilter(log_context))
 
 # Add the file handler to the Flask application logger
 app.logger.addHandler(file_handler)
+if LOG_ASYNC:
+    # Nicht zusätzlich an den Root-Handler von basicConfig weiterreichen: der
+    # schreibt synchron (und ungefiltert) nach stderr, im Request-Thread
+    app.logger.propagate = False
 app.logger.info("Application logging initialized and outputting to %s.", LOG_FILE)
 
 # --- END LOGGING SETUP ---
 
-def get_db_conn():
-    return pymysql.connect(host=DB_HOST, user=DB_USER, password=DB_PASS, database=DB_NAME, cursorclass=pymysql.cursors.DictCursor, autocommit=True)
+def get_db_conn(host=None):
+    host, port = split_host(host or DB_HOST)
+    with tracer.span("db_connect"):
+        return pymysql.connect(host=host, port=port, user=DB_USER, password=DB_PASS, database=DB_NAME, cursorclass=pymysql.cursors.DictCursor, autocommit=True, connect_timeout=DB_CONNECT_TIMEOUT,
+                               read_timeout=DB_READ_TIMEOUT, write_timeout=DB_WRITE_TIMEOUT)
+
+# --- CONNECTION POOL ---
+# Der Pool wird lazy pro Worker-Prozess angelegt. ConnectionPool erkennt einen
+# fork() selbst, damit keine Sockets zwischen Master und Worker geteilt werden.
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+def get_db_pool():
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                _db_pool = ConnectionPool(get_db_conn, max_size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT,
+                                          recycle=DB_POOL_RECYCLE, pre_ping=DB_POOL_PRE_PING)
+    return _db_pool
+
+_read_router = None
+
+def get_read_router():
+    """Verteilt Lesezugriffe auf die Replicas (Fallback: Primary). Lazy pro Worker wie der Pool."""
+    global _read_router
+    if _read_router is None:
+        primary = get_db_pool()
+        with _db_pool_lock:
+            if _read_router is None:
+                replicas = {host: ConnectionPool(partial(get_db_conn, host), max_size=DB_POOL_SIZE,
+                                                 timeout=DB_POOL_TIMEOUT, recycle=DB_POOL_RECYCLE,
+                                                 pre_ping=DB_POOL_PRE_PING)
+                            for host in DB_REPLICA_HOSTS}
+                _read_router = ReadRouter(primary, replicas, max_lag=DB_REPLICA_MAX_LAG,
+                                          interval=DB_REPLICA_CHECK_INTERVAL)
+    return _read_router
+
+def get_request_conn(read=False):
+    """
+    Gibt die Pool-Verbindung des aktuellen Requests zurück (einmal pro Request aus dem Pool geholt).
+    read=True: Verbindung für reine Lesezugriffe, von einem Replica falls konfiguriert und aktuell genug.
+    """
+    if read and DB_REPLICA_HOSTS:
+        if "db_read" not in g:
+            name, pool = get_read_router().read_pool()
+            if name == "primary":
+                return get_request_conn()
+            try:
+                g.db_read = (pool, pool.acquire())
+            except (PoolExhausted, pymysql.err.OperationalError) as e:
+                # Replica nicht erreichbar: nicht den Breaker des Primary auslösen, dort lesen
+                app.logger.warning(f"DB_REPLICA_UNAVAILABLE: Reading from the primary instead of {name}: {e}")
+                return get_request_conn()
+        return g.db_read[1]
+    if "db_conn" not in g:
+        g.db_conn = get_db_pool().acquire()
+    return g.db_conn
+
+def request_reads_replica():
+    """True, wenn die Lese-Verbindung dieses Requests zu einem Replica gehört."""
+    return "db_read" in g
+
+@app.teardown_appcontext
+def release_request_conn(exc):
+    # Nach einer unbehandelten Exception ist der Verbindungszustand unklar -> verwerfen
+    conn = g.pop("db_conn", None)
+    if conn is not None:
+        get_db_pool().release(conn, discard=exc is not None)
+    read = g.pop("db_read", None)
+    if read is not None:
+        read[0].release(read[1], discard=exc is not None)
+
+# --- DB HEALTH / CIRCUIT BREAKER ---
+# Ein Hintergrund-Thread pro Worker prüft die DB und hält das Ergebnis vor.
+# Ist der Breaker offen, beantworten wir Requests sofort mit 503, statt jeden
+# einzelnen Request in den Connect-Timeout laufen zu lassen.
+def _probe_db():
+    pool = get_db_pool()
+    conn = pool.acquire()
+    pool.release(conn)
+
+db_breaker = CircuitBreaker(failure_threshold=DB_BREAKER_THRESHOLD, reset_timeout=DB_BREAKER_RESET,
+                            half_open_max=DB_BREAKER_HALF_OPEN_MAX)
+db_health = DBHealthMonitor(_probe_db, db_breaker, interval=DB_HEALTH_INTERVAL, ttl=DB_HEALTH_TTL,
+                            inconclusive=(PoolExhausted,))
 
 def init_db():
     """
-    Initialisiert das Datenbankschema. 
-    Wird vom externen Setup-Skript aufgerufen, um sicherzustellen, dass die Tabellen existieren.
+    Initialisiert das Datenbankschema.
+    Der Container-Start nutzt dafür `python schema.py` (ohne Flask-Import);
+    diese Funktion bleibt für bestehende Aufrufer erhalten.
     """
-    app.logger.info("INIT_DB_START: Executing Database Schema Initialization.")
-    conn = None
+    schema.init_db(get_db_conn, app.logger)
+
+
+# --- BCRYPT PROCESS POOL ---
+# bcrypt läuft in eigenen Prozessen. Ist die Warteschlange voll, antworten wir
+# sofort mit 429 + Retry-After, statt den Worker-Thread warten zu lassen.
+# Bewusst kein 503: nginx wertet 503 als Backend-Fehler (proxy_next_upstream,
+# max_fails) und würde einen Knoten, der nur Last abwirft, aus dem Upstream nehmen.
+hash_pool = HashPool(workers=HASH_POOL_WORKERS, max_queue=HASH_POOL_QUEUE, timeout=HASH_POOL_TIMEOUT,
+                     rounds=BCRYPT_ROUNDS)
+
+def store_rehash(username, old_hash, new_hash):
+    """Schreibt einen neu gehashten Passwort-Hash, sofern sich der gespeicherte nicht inzwischen geändert hat."""
+    pool = get_db_pool()
+    try:
+        conn = pool.acquire()
+    except Exception as e:
+        app.logger.error(f"REHASH_ERROR: No DB connection to update hash of '{username}': {e}")
+        return
     try:
-        conn = get_db_conn()
         with conn.cursor() as cur:
-            # Erstellt die Benutzertabelle, falls sie noch nicht existiert
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    username VARCHAR(50) UNIQUE NOT NULL,
-                    password_hash VARCHAR(255) NOT NULL
-                )
-            """)
-        app.logger.info("INIT_DB_SUCCESS: Database schema successfully verified/created.")
-    except pymysql.err.OperationalError as e:
-        app.logger.critical(f"INIT_DB_FAILURE: Could not initialize database schema. Connection failed: {e}")
-        raise
+            cur.execute("UPDATE users SET password_hash=%s WHERE username=%s AND password_hash=%s",
+                        (new_hash.decode('utf-8'), username, old_hash.decode('utf-8')))
+        pool.release(conn)
+        app.logger.info(f"PASSWORD_REHASHED: Hash of '{username}' updated to cost {BCRYPT_ROUNDS}.")
     except Exception as e:
-        app.logger.error(f"INIT_DB_FAILURE: An unexpected error occurred during DB schema initialization: {e}")
+        pool.release(conn, discard=True)
+        app.logger.error(f"REHASH_ERROR: Could not update hash of '{username}': {e}")
+
+def hash_pool_busy(template):
+    app.logger.warning(f"HASH_POOL_BUSY: bcrypt pool busy (queue full, timeout or restart), shedding {request.path} from {request.headers.get('X-Real-IP')}.")
+    resp = app.make_response((render_template(template, error="Server busy. Please try again in a moment."), 429))
+    resp.headers["Retry-After"] = str(hash_pool.retry_after())
+    return resp
+
+
+# --- METRICS ---
+metrics = None
+if METRICS_ENABLED:
+    metrics = Metrics(METRICS_DIR, flush_interval=METRICS_FLUSH_INTERVAL)
+    metrics.counter("webapp_requests_total", "HTTP requests by route, method and status.")
+    metrics.histogram("webapp_request_duration_seconds", "Request latency by route.")
+    metrics.histogram("webapp_bcrypt_seconds", "bcrypt hash/verify time including hash pool queueing.")
+    metrics.histogram("webapp_db_connect_seconds", "Time to open a new MariaDB connection.")
+    metrics.histogram("webapp_db_query_seconds", "SQL query time.")
+    metrics.histogram("webapp_captcha_render_seconds", "CAPTCHA image render time.")
+    metrics.histogram("webapp_session_seconds", "Session load/save time.")
+    metrics.counter("webapp_rate_limit_total", "Rate limiter decisions by policy and result (allowed/limited).")
+    metrics.histogram("webapp_log_queue_depth", "Records waiting in the async log queue, sampled per request.",
+                      buckets=(0, 1, 10, 50, 100, 500, 1000, 5000, 10000))
+    app.session_interface = TimedSessionInterface(
+        app.session_interface, lambda op, seconds: metrics.observe("webapp_session_seconds", seconds, (("op", op),)))
+
+# Tracer-Spans, die zusätzlich als Histogramme exportiert werden
+SPAN_METRICS = {
+    "bcrypt_hash": ("webapp_bcrypt_seconds", (("op", "hash"),)),
+    "bcrypt_verify": ("webapp_bcrypt_seconds", (("op", "verify"),)),
+    "db_connect": ("webapp_db_connect_seconds", ()),
+    "db_query": ("webapp_db_query_seconds", ()),
+}
+
+def observe_span(name, duration_ns):
+    target = SPAN_METRICS.get(name)
+    if target is not None:
+        metrics.observe(target[0], duration_ns / 1e9, target[1])
+
+# --- USERNAME FILTER ---
+# Bloom-Filter über alle Benutzernamen: "sicher nicht vorhanden" spart bei der
+# Anmeldung die DB-Abfrage und bei der Registrierung den bcrypt-Hash für
+# vergebene Namen. Die Unique-Constraint der DB bleibt maßgeblich.
+def _fetch_usernames(last_id, limit):
+    pool = get_read_router().read_pool()[1] if DB_REPLICA_HOSTS else get_db_pool()
+    conn = pool.acquire()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id, username FROM users WHERE id > %s ORDER BY id LIMIT %s", (last_id, limit))
+            return [(row["id"], row["username"]) for row in cur.fetchall()]
+    except Exception:
+        pool.release(conn, discard=True)
+        conn = None
         raise
     finally:
-        if conn:
-            conn.close()
+        if conn is not None:
+            pool.release(conn)
+
+username_filter = None
+if USERNAME_FILTER:
+    username_filter = UsernameFilter(USERNAME_FILTER_FILE, _fetch_usernames, capacity=USERNAME_FILTER_CAPACITY,
+                                     error_rate=USERNAME_FILTER_ERROR, sync_interval=USERNAME_FILTER_SYNC)
+
+USERNAME_FILTER_AUTHORITATIVE = WEBAPP_NODES == 1 and not DB_REPLICA_HOSTS
+
+def username_may_exist(username):
+    return username_filter is None or username_filter.might_contain(username)
+
+# --- REQUEST TRACING ---
+tracer = Tracer(enabled=TRACE_REQUESTS, observer=observe_span if METRICS_ENABLED else None)
+
+if TRACE_REQUESTS:
+    # render_template-Zeit über Flask-Signale messen (nur verbunden, wenn Tracing an ist)
+    def _render_started(sender, template, context, **extra):
+        g.render_start = time.perf_counter_ns()
+
+    def _render_finished(sender, template, context, **extra):
+        start = g.pop("render_start", None)
+        if start is not None:
+            tracer.mark(f"render_{template.name.rsplit('.', 1)[0]}", start)
+
+    before_render_template.connect(_render_started, app)
+    template_rendered.connect(_render_finished, app)
+
+# --- CAPTCHA POOL ---
+# Ein Producer-Thread hält vorgerenderte (Antwort, PNG)-Paare bereit; die Route
+# entnimmt nur noch ein Paar. Jedes Paar wird genau einmal ausgeliefert.
+captcha_pool = CaptchaPool(capacity=max(CAPTCHA_POOL_SIZE, 1), min_fill=CAPTCHA_POOL_MIN,
+                           horizon=CAPTCHA_POOL_HORIZON,
+                           on_render=(lambda seconds: metrics.observe("webapp_captcha_render_seconds", seconds))
+                           if METRICS_ENABLED else None)
+
+
+# --- PROFILING ---
+# Der Signal-Handler des Samplers wird in gunicorn.conf.py (post_worker_init)
+# im Haupt-Thread jedes Workers installiert.
+profiler = Profiler(PROFILE_DIR, interval=PROFILE_SAMPLE_INTERVAL, default_seconds=PROFILE_SAMPLE_SECONDS,
+                    logger=app.logger) if PROFILING else None
+
+def finish_request_profile():
+    profile = g.pop("profile", None)
+    return profiler.finish_request_profile(profile, request.endpoint) if profile is not None else None
+
+
+# --- MEMORY DIAGNOSTICS ---
+# Recycling übernimmt der post_request-Hook in gunicorn.conf.py.
+memory_diag = MemoryDiagnostics(interval=MEMORY_RSS_INTERVAL, history=MEMORY_RSS_HISTORY, trace=MEMORY_DIAG,
+                                trace_frames=MEMORY_TRACE_FRAMES,
+                                rss_limit=int(MEMORY_RSS_LIMIT_MB * 2 ** 20) or None, jitter=MEMORY_RSS_JITTER,
+                                logger=app.logger)
+
+
+# --- PAGE CACHE ---
+# Seiten, deren Inhalt nicht vom Request abhängt, werden einmal gerendert und
+# danach als Bytes ausgeliefert. Der Gunicorn-Master rendert sie vor dem Fork
+# (warm_page_cache), die Worker teilen sie copy-on-write.
+page_cache = PageCache(render_template, gzip_min_size=PAGE_CACHE_GZIP_MIN or None)
+
+ERROR_INTERNAL = "An internal server error has occurred."
+ERROR_DB_CHECK = "Internal error during database check."
+ERROR_UNAVAILABLE = "Webserver currently not available"
+
+STATIC_PAGES = (
+    ("index.html", {}),
+    ("auth_choice.html", {}),
+    ("signin.html", {}),
+    ("signup.html", {}),
+    ("error_init.html", {}),
+    ("error_init.html", {"error_message": ERROR_UNAVAILABLE}),
+    ("error_404.html", {}),
+    ("error_500.html", {"error_message": ERROR_INTERNAL}),
+    ("error_500.html", {"error_message": ERROR_DB_CHECK}),
+)
+
+def render_page(template, status=200, **context):
+    """
+    Wie render_template, aber aus dem Seiten-Cache: strong ETag, 304 bei passendem
+    If-None-Match (nur für 200er) und gzip, wenn der Client es akzeptiert.
+    Nur für Seiten ohne Benutzer- oder Formulardaten im Kontext!
+    """
+    if not PAGE_CACHE:
+        return app.make_response((render_template(template, **context), status))
+    page = page_cache.get(template, **context)
+    use_gzip = page.gzip_body is not None and request.accept_encodings["gzip"] > 0
+    body, etag = (page.gzip_body, page.gzip_etag) if use_gzip else (page.body, page.etag)
+    if status == 200 and request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, status=status, mimetype="text/html")
+        if use_gzip:
+            response.headers["Content-Encoding"] = "gzip"
+    response.set_etag(etag)
+    # Jedes Mal revalidieren: index leitet angemeldete Benutzer weiter
+    response.headers["Cache-Control"] = "private, no-cache"
+    if page.gzip_body is not None:
+        response.vary.add("Accept-Encoding")
+    return response
+
+def warm_page_cache():
+    """Rendert STATIC_PAGES vorab (Gunicorn-Master, vor dem Fork)."""
+    if not PAGE_CACHE:
+        return
+    environ = EnvironBuilder("/", base_url=f"http://{ALLOWED_HOST}").get_environ()
+    # Mit Null-Session: die Seiten brauchen keine, und der Master soll den Session-Store nicht anfassen
+    with RequestContext(app, environ, session=app.session_interface.make_null_session(app)):
+        page_cache.warm(STATIC_PAGES)
+
+
+# --- CAPTCHA TOKENS ---
+captcha_nonces = captcha_tokens.NonceCache(CAPTCHA_NONCE_FILE,
+                                           slots=captcha_tokens.slots_for(CAPTCHA_TOKEN_TTL, CAPTCHA_TOKEN_MAX_RATE))
+captcha_signer = captcha_tokens.CaptchaTokenSigner(app.secret_key, captcha_nonces, ttl=CAPTCHA_TOKEN_TTL)
+
+def consume_captcha(user_answer):
+    """Prüft die CAPTCHA-Antwort genau einmal. Liefert captcha_tokens.OK/WRONG/MISSING/REPLAYED."""
+    if CAPTCHA_MODE == "token":
+        token = request.cookies.get(CAPTCHA_TOKEN_COOKIE)
+        if token:
+            @after_this_request
+            def clear_token(response):
+                response.delete_cookie(CAPTCHA_TOKEN_COOKIE)
+                return response
+        return captcha_signer.verify(token, user_answer)
+
+    # Retrieve the answer and IMMEDIATELY remove it from the session.
+    real_answer = session.pop("captcha_answer", None)
+    if not real_answer:
+        return captcha_tokens.MISSING
+    # Use constant time comparison to prevent timing attacks
+    if not secrets.compare_digest(real_answer, user_answer):
+        return captcha_tokens.WRONG
+    return captcha_tokens.OK
 
 
 # --- DEKORATOR ZUR PRÜFUNG DER DB-VERFÜGBARKEIT (Dynamische Prüfung) ---
-def check_db_availability(f):
-    """Prüft die DB-Verbindung dynamisch vor jedem geschützten Request."""
+def check_db_availability(f=None, read=False):
+    """
+    Prüft die DB-Verbindung dynamisch vor jedem geschützten Request.
+    read=True (@check_db_availability(read=True)) für Routen, die nur lesen: geprüft
+    wird dann die Lese-Verbindung, die die Route anschließend nutzt (Replica, falls
+    konfiguriert), statt zusätzlich eine Primary-Verbindung zu belegen.
+    """
+    if f is None:
+        return partial(check_db_availability, read=read)
+
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        conn = None
+        db_health.ensure_started()
+        if not db_breaker.allow_request():
+            # Breaker offen: DB ist bekanntermaßen nicht erreichbar -> sofort 503
+            return render_page("error_init.html", 503)
         try:
-            conn = get_db_conn()
-            with conn.cursor() as cur:
-                cur.execute("SELECT 1") 
-            # Wenn erfolgreich, fahre mit der Route fort
-            return f(*args, **kwargs)
+            # Holt die Request-Verbindung aus dem Pool. Der Pre-Ping des Pools
+            # ersetzt das frühere "SELECT 1" auf einer eigenen Verbindung; die
+            # Route nutzt anschließend dieselbe Verbindung über get_request_conn().
+            with tracer.span("db_check"):
+                get_request_conn(read=read)
+            # Der Breaker steht für den Primary; eine Replica-Verbindung sagt darüber nichts
+            if not request_reads_replica():
+                db_breaker.record_success()
+        except PoolExhausted:
+            # Alle Verbindungen dieses Workers sind belegt - kein Fehler der DB selbst,
+            # daher 429 (Last abwerfen) statt 503 (Knoten gilt für nginx als ausgefallen)
+            app.logger.warning(f"DB_POOL_EXHAUSTED: No pooled connection available for request to {request.path}. Returning 429.")
+            response = render_page("error_init.html", 429)
+            response.headers["Retry-After"] = "1"
+            return response
         except pymysql.err.OperationalError as e:
             # Fängt Fehler bei Verbindung, Authentifizierung oder Netzwerk
+            db_breaker.record_failure()
             app.logger.warning(f"DB_CHECK_FAILED: Database connection failed during request to {request.path}. Returning 503.")
-            return render_template("error_init.html"), 503 
+            return render_page("error_init.html", 503) 
         except Exception as e:
             # Fängt andere unerwartete Fehler
             app.logger.error(f"DB_CHECK_ERROR: An unexpected error occurred during DB check for {request.path}: {e}")
-            return render_template("error_500.html", error_message="Internal error during database check."), 500
+            return render_page("error_500.html", 500, error_message=ERROR_DB_CHECK)
         finally:
-            if conn:
-                conn.close() # Stelle sicher, dass die Verbindung geschlossen wird
+            # Ohne Ergebnis (Pool erschöpft, unerwarteter Fehler) den Half-Open-Slot freigeben
+            db_breaker.release()
+        # Wenn erfolgreich, fahre mit der Route fort
+        return f(*args, **kwargs)
     return decorated_function
 
 
+# --- RATE LIMIT ---
+# Entscheidung vor DB-Check, bcrypt und CAPTCHA-Rendering; abgelehnte Requests
+# kosten nur einen Tabellenzugriff und eine kurze 429-Antwort.
+rate_limiter = RateLimiter(RATE_LIMIT_FILE, RATE_LIMIT_POLICIES) if RATE_LIMIT else None
+
+def rate_limited(policy, methods=("POST",)):
+    """Begrenzt die Route pro Client nach RATE_LIMIT_POLICIES[policy] (unbekannte Policy: kein Limit)."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if rate_limiter is None or policy not in rate_limiter.policies or request.method not in methods:
+                return f(*args, **kwargs)
+            client = request.headers.get("X-Real-IP") or request.remote_addr
+            with tracer.span("rate_limit"):
+                allowed, retry_after = rate_limiter.hit(policy, client)
+            if metrics is not None:
+                metrics.inc("webapp_rate_limit_total", (("policy", policy), ("result", "allowed" if allowed else "limited")))
+            if allowed:
+                return f(*args, **kwargs)
+            app.logger.warning(f"RATE_LIMITED: {request.method} {request.path} from {client} exceeded policy '{policy}'. Returning 429.")
+            return Response("Too many requests. Please try again later.\n", status=429, mimetype="text/plain",
+                            headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+        return decorated_function
+    return decorator
+
+
 # --- DEKORATOR ZUR PRÜFUNG DER AUTHENTIFIZIERUNG ---
 def login_required(f):
     """Leitet zu signin um, wenn der Benutzer nicht in der Session ist."""
@@ -135,76 +678,234 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# --- DEKORATOR FÜR MANAGEMENT-ENDPUNKTE ---
+def is_management_request():
+    try:
+        addr = ipaddress.ip_address(request.remote_addr)
+    except (TypeError, ValueError):
+        return False
+    return any(addr in net for net in MGMT_NETWORKS)
+
+def management_only(f):
+    """Erlaubt den Zugriff nur direkt aus dem Management-Netz (nicht über die WAF)."""
+    f.management_endpoint = True
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not is_management_request():
+            abort(404)
+        return f(*args, **kwargs)
+    return decorated_function
+
 # --- BEFORE REQUEST ---
 
+@app.before_request
+def start_request():
+    # Request-ID von der WAF übernehmen oder selbst erzeugen
+    g.request_start = time.perf_counter()
+    g.request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    tracer.begin()
+    if MEMORY_DIAG or MEMORY_RSS_LIMIT_MB:
+        # Sonst startet der RSS-Sampler erst mit dem ersten /internal/memory*-Aufruf
+        memory_diag.ensure_started()
+    if profiler is not None and request.headers.get(PROFILE_HEADER) == "1" and is_management_request():
+        profile = profiler.request_profile()
+        if profile is not None:
+            g.profile = profile
+
+@app.after_request
+def finish_request(response):
+    response.headers["X-Request-ID"] = g.get("request_id", "")
+    if metrics is not None:
+        # Routen-Template statt Pfad, damit die Label-Anzahl begrenzt bleibt
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        metrics.inc("webapp_requests_total", (("route", route), ("method", request.method),
+                                              ("status", str(response.status_code))))
+        if "request_start" in g:
+            metrics.observe("webapp_request_duration_seconds", time.perf_counter() - g.request_start,
+                            (("route", route),))
+        if LOG_ASYNC:
+            metrics.observe("webapp_log_queue_depth", file_handler.stats()["queued"])
+    if tracer.enabled:
+        total_ms, spans = tracer.end()
+        if total_ms is not None:
+            app.logger.info(
+                f"REQUEST_TRACE: {request.method} {request.path} -> {response.status_code} in {total_ms:.2f}ms "
+                f"[{', '.join(f'{name}={ms:.2f}ms' for name, ms in spans)}] id={g.request_id}",
+                extra={"status": response.status_code, "spans": {name: round(ms, 3) for name, ms in spans}})
+            if TRACE_SERVER_TIMING:
+                response.headers["Server-Timing"] = server_timing(spans, total_ms)
+    if "profile" in g:
+        response.headers["X-Profile-File"] = os.path.basename(finish_request_profile())
+    return response
+
+@app.teardown_request
+def discard_request_profile(exc):
+    # Unbehandelte Exception: after_request lief nicht, Profil trotzdem schreiben
+    finish_request_profile()
+
 @app.before_request
 def check_host_header():
-    # The Host header is available in request.headers['Host']
-    # The header value might include the port
-    # so we should split it to get only the hostname.
-    host_header = request.headers.get('Host')
-    
-    if host_header:
-        # Get the hostname part (strip port if present)
-        hostname = host_header.split(':')[0]
+    with tracer.span("host_check"):
+        # The Host header is available in request.headers['Host']
+        # The header value might include the port
+        # so we should split it to get only the hostname.
+        host_header = request.headers.get('Host')
+
+        # Management-Endpunkte werden per IP angesprochen, nicht über den WAF-Hostnamen
+        view = app.view_functions.get(request.endpoint)
+        if getattr(view, "management_endpoint", False) and is_management_request():
+            return
+
+        if host_header:
+            # Get the hostname part (strip port if present)
+            hostname = host_header.split(':')[0]
         
-        if hostname != ALLOWED_HOST:
-            # Equivalent to NGINX's return 444 (close connection), 
-            # we can return an immediate 400 or 403 response, or 
-            # simply abort with 404 to provide no useful info..
-            app.logger.warning(f"HOST_CHECK_FAILED: Missing Host header from {request.headers.get('X-Real-IP')}. Blocking.")
-            abort(403) # Return a 403 Forbidden response
+            if hostname != ALLOWED_HOST:
+                # Equivalent to NGINX's return 444 (close connection), 
+                # we can return an immediate 400 or 403 response, or 
+                # simply abort with 404 to provide no useful info..
+                app.logger.warning(f"HOST_CHECK_FAILED: Missing Host header from {request.headers.get('X-Real-IP')}. Blocking.")
+                abort(403) # Return a 403 Forbidden response
 
 # --- ROUTEN ---
 
 @app.route("/")
-@check_db_availability
+@check_db_availability(read=True)
 def index():
     if "user" in session:
         return redirect(url_for('dashboard'))
-    return render_template("index.html")
+    return render_page("index.html")
 
 @app.route("/auth")
-@check_db_availability
+@check_db_availability(read=True)
 def auth_choice():
-    return render_template("auth_choice.html")
+    return render_page("auth_choice.html")
+
+@app.route("/healthz")
+def healthz():
+    """Liefert nur den gecachten DB-Zustand, ohne selbst die DB anzufragen."""
+    db_health.ensure_started()
+    state = db_health.state()
+    ok = state["healthy"] is not False and state["breaker"]["state"] != "open"
+    return jsonify(status="ok" if ok else "degraded", db=state), 200 if ok else 503
+
+@app.route("/internal/stats")
+@management_only
+def internal_stats():
+    """Laufzeit-Statistiken dieses Worker-Prozesses (Pool-Größen, Wartezeiten)."""
+    return jsonify(pid=os.getpid(), db_pool=get_db_pool().stats(), db=db_health.state(),
+                   hash_pool=hash_pool.stats(), captcha_pool=captcha_pool.stats(),
+                   captcha_nonces=captcha_nonces.stats() if CAPTCHA_MODE == "token" else None,
+                   sessions=session_store.stats() if session_store is not None else None,
+                   log=file_handler.stats() if LOG_ASYNC else None,
+                   log_dedup=log_dedup.stats() if log_dedup is not None else None,
+                   username_filter=username_filter.stats() if username_filter is not None else None,
+                   page_cache=page_cache.stats() if PAGE_CACHE else None,
+                   rate_limit=rate_limiter.stats() if rate_limiter is not None else None,
+                   db_replicas=get_read_router().stats() if DB_REPLICA_HOSTS else None)
+
+@app.route("/internal/profile", methods=["POST"])
+@management_only
+def profile_sample():
+    """Startet den Stack-Sampler in diesem Worker (?seconds=N, Standard PROFILE_SAMPLE_SECONDS)."""
+    if profiler is None or not profiler.installed:
+        return jsonify(error="profiling disabled (PROFILING=1, gunicorn post_worker_init)"), 409
+    seconds = request.args.get("seconds", type=float)
+    if not profiler.start_sampling(seconds):
+        return jsonify(error="sampler already running", pid=os.getpid()), 409
+    return jsonify(pid=os.getpid(), seconds=min(seconds or PROFILE_SAMPLE_SECONDS, profiler.max_seconds),
+                   directory=PROFILE_DIR), 202
+
+@app.route("/internal/memory")
+@management_only
+def memory_stats():
+    """RSS-Verlauf dieses Workers, aktueller RSS aller Worker, tracemalloc-Status."""
+    return jsonify(memory_diag.stats())
+
+@app.route("/internal/memory/snapshot", methods=["POST"])
+@management_only
+def memory_snapshot():
+    """
+    Erster Aufruf startet tracemalloc (falls nicht schon per MEMORY_DIAG=1 aktiv), jeder
+    weitere liefert die Top-Allokationsstellen (?top=N) seit dem vorherigen Snapshot.
+    Snapshots gelten pro Worker: Aufrufe über dieselbe Keep-Alive-Verbindung schicken.
+    ?stop=1 beendet das Tracing.
+    """
+    if request.args.get("stop") == "1":
+        memory_diag.stop_tracing()
+        return jsonify(pid=os.getpid(), tracing=False)
+    return jsonify(pid=os.getpid(), **memory_diag.snapshot(top=request.args.get("top", 20, type=int)))
+
+@app.route("/metrics")
+@management_only
+def metrics_endpoint():
+    """Prometheus-Metriken aller Worker (nur mit METRICS_ENABLED=1)."""
+    if metrics is None:
+        abort(404)
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 # --- New Route to Serve the Image ---
 
 @app.route("/captcha/image")
+@rate_limited("captcha", methods=("GET",))
 def captcha_image():
-    # Generate random text (Using alphanumeric to avoid confusion)
-    # Using 'secrets' is cryptographically stronger than 'random'
-    image_text = secrets.token_hex(3).upper() # Generates ~6 chars
-    
-    # STORE SECURELY: 
-    # This saves the answer in ./flask_session/[session_id] on the SERVER.
-    # The client cannot see this value.
-    session["captcha_answer"] = image_text
+    # Take a pre-rendered image (or render inline if the pool is disabled/empty).
+    # Answers are generated with 'secrets' inside CaptchaPool.
+    if CAPTCHA_POOL_SIZE > 0:
+        image_text, png = captcha_pool.pop()
+    else:
+        image_text, png = captcha_pool.render()
     
-    # Generate image
-    image = ImageCaptcha(width=280, height=90)
-    data = image.generate(image_text)
+    response = Response(png, mimetype="image/png")
+    # Jedes Bild gehört zu genau einer Session bzw. einem Token: nie cachen
+    response.cache_control.no_store = True
+    if CAPTCHA_MODE == "token":
+        # STATELESS: the answer is only bound by an HMAC in the token cookie,
+        # nothing is written to the server-side session.
+        response.set_cookie(CAPTCHA_TOKEN_COOKIE, captcha_signer.issue(image_text), max_age=CAPTCHA_TOKEN_TTL,
+                            httponly=True, samesite="Lax")
+    else:
+        # STORE SECURELY: 
+        # This saves the answer in ./flask_session/[session_id] on the SERVER.
+        # The client cannot see this value.
+        session["captcha_answer"] = image_text
     
-    return send_file(data, mimetype="image/png")
+    return response
+
+PASSWORD_SPECIAL = "!@#$%^&*()_+-=[]{};:,.<>/?"
+
+def password_policy_error(username, password):
+    """Registrierungs-Richtlinie. Liefert die Fehlermeldung für das Formular oder None."""
+    if not username or not password:
+        return "You have to provide a username and password"
+    if len(password) < 12:
+        return "Password must have at least 12 characters"
+    if not any(c.islower() for c in password) or not any(c.isupper() for c in password):
+        return "Password must contain at least 1 upper and lower character"
+    if not any(c.isdigit() for c in password):
+        return "Password must contain at least 1 digit"
+    if not any(c in PASSWORD_SPECIAL for c in password):
+        return f"Password must contain at least 1 of these special character: {PASSWORD_SPECIAL}"
+    return None
 
 @app.route("/signup", methods=["GET", "POST"])
+@rate_limited("signup")
 def signup():
     if request.method == "POST":
         # --- DEFENSE LAYER 1: REPLAY PROTECTION ---
-        # Retrieve the answer and IMMEDIATELY remove it from the session.
-        # If the user reloads or an attacker replays the request, 'real_answer' will be None.
-        real_answer = session.pop("captcha_answer", None)
+        # The stored answer (session) or token (cookie) is consumed IMMEDIATELY.
+        # If the user reloads or an attacker replays the request, it is gone.
         user_answer = request.form.get("captcha_answer", "").upper()
+        with tracer.span("captcha"):
+            captcha_status = consume_captcha(user_answer)
 
         # --- DEFENSE LAYER 2: VALIDATION LOGIC ---
-        if not real_answer:
+        if captcha_status in (captcha_tokens.MISSING, captcha_tokens.REPLAYED):
             app.logger.warning(f"SECURITY: Replay attack or expired session detected from {request.headers.get('X-Real-IP')}")
             return render_template("signup.html", error="Session expired. Please reload the captcha.")
 
-        # Use constant time comparison to prevent timing attacks
-        if not secrets.compare_digest(real_answer, user_answer):
-            app.logger.debug(f"CAPTCHA_FAIL: Expected '{real_answer}', got '{user_answer}' from {request.headers.get('X-Real-IP')}")
+        if captcha_status != captcha_tokens.OK:
+            app.logger.debug(f"CAPTCHA_FAIL: Got '{user_answer}' from {request.headers.get('X-Real-IP')}")
             app.logger.info(f"CAPTCHA_FAIL: Incorrect code from {request.headers.get('X-Real-IP')}")
             return render_template("signup.html", error="Incorrect security code.")
 
@@ -213,85 +914,120 @@ def signup():
         
         username = request.form.get("username")
         password = request.form.get("password")
+        g.log_user = username
 
-        special = "!@#$%^&*()_+-=[]{};:,.<>/?"
+        policy_error = password_policy_error(username, password)
+        if policy_error:
+            return render_template("signup.html", error=policy_error)
 
-        has_digit = any(c.isdigit() for c in password)
-        has_upper = any(c.isupper() for c in password)
-        has_lower = any(c.islower() for c in password)
-        has_special = any(c in special for c in password)
-
-        if not username or not password:
-            return render_template("signup.html", error="You have to provide a username and password")
-        if len(password) < 12:
-            return render_template("signup.html", error="Password must have at least 12 characters")
-        if not has_lower or not has_upper:
-            return render_template("signup.html", error="Password must contain at least 1 upper and lower character")
-        if not has_digit:
-            return render_template("signup.html", error="Password must contain at least 1 digit")
-        if not has_special:
-            return render_template("signup.html", error="Password must contain at least 1 of these special character: !@#$%^&*()_+-=[]{};:,.<>/?")
+        # Vergebene Namen vor dem Hashen erkennen. Nur wenn der Filter den Namen
+        # für möglich hält, kostet das eine (billige) DB-Abfrage.
+        if username_may_exist(username):
+            try:
+                # Ein veraltetes Replica schadet hier nicht: dann greift die Unique-Constraint beim INSERT
+                conn = get_request_conn(read=True)
+                with tracer.span("db_query"), conn.cursor() as cur:
+                    cur.execute("SELECT 1 FROM users WHERE username=%s", (username,))
+                    taken = cur.fetchone() is not None
+            except Exception as e:
+                app.logger.error(f"DB_ERROR: {e}")
+                return render_template("signup.html", error="System error.")
+            if taken:
+                return render_template("signup.html", error="Username taken.")
 
         # Expensive Bcrypt operation (Only runs if human is verified)
-        pw_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        try:
+            with tracer.span("bcrypt_hash"):
+                pw_hash = hash_pool.hashpw(password.encode('utf-8'))
+        except HashPoolBusy:
+            return hash_pool_busy("signup.html")
 
         try:
-            conn = get_db_conn()
-            with conn.cursor() as cur:
+            conn = get_request_conn()
+            with tracer.span("db_query"), conn.cursor() as cur:
                 cur.execute("INSERT INTO users (username, password_hash) VALUES (%s, %s)", 
                             (username, pw_hash.decode('utf-8')))
+            if username_filter is not None:
+                username_filter.add(username)
             return redirect(url_for('signin'))
         except pymysql.err.IntegrityError:
+            if username_filter is not None:
+                username_filter.add(username)
             return render_template("signup.html", error="Username taken.")
         except Exception as e:
             app.logger.error(f"DB_ERROR: {e}")
             return render_template("signup.html", error="System error.")
-        finally:
-            if 'conn' in locals(): conn.close()
 
-    return render_template("signup.html")
+    return render_page("signup.html")
 
 
 @app.route("/signin", methods=["GET", "POST"])
-@check_db_availability
+@rate_limited("signin")
+@check_db_availability(read=True)
 def signin():
     if request.method == "POST":
         remote_addr = request.headers.get('X-Real-IP')
         
         # --- DEFENSE LAYER 1: CAPTCHA REPLAY PROTECTION ---
-        real_answer = session.pop("captcha_answer", None)
         user_answer = request.form.get("captcha_answer", "").upper()
+        with tracer.span("captcha"):
+            captcha_status = consume_captcha(user_answer)
 
-        if not real_answer:
+        if captcha_status in (captcha_tokens.MISSING, captcha_tokens.REPLAYED):
             app.logger.warning(f"SECURITY: Replay attack or expired session detected during signin from {remote_addr}")
             return render_template("signin.html", error="Session expired. Please reload the captcha.")
 
-        if not secrets.compare_digest(real_answer, user_answer):
+        if captcha_status != captcha_tokens.OK:
             app.logger.info(f"CAPTCHA_FAIL: Incorrect code during signin from {remote_addr}")
             return render_template("signin.html", error="Incorrect security code.")
 
         # --- DEFENSE LAYER 2: CREDENTIAL VALIDATION ---
         username = request.form.get("username", "").strip()
         password = request.form.get("password", "")
+        g.log_user = username
         
         if not username or not password:
             app.logger.info(f"SIGNIN_FAILED: Missing fields during attempt from {remote_addr}.")
             return render_template("signin.html", error="You have to provide a Username and Password")
 
         user = None
-        conn = None
+        # Laut Filter sicher unbekannte Namen brauchen keine DB-Abfrage - außer bei
+        # mehreren Knoten/Replicas: dann kann der Name gerade erst woanders
+        # registriert worden sein, also direkt am Primary nachsehen.
+        known = username_may_exist(username)
+        if known or not USERNAME_FILTER_AUTHORITATIVE:
+            try:
+                conn = get_request_conn(read=known)
+                with tracer.span("db_query"), conn.cursor() as cur:
+                    cur.execute("SELECT password_hash FROM users WHERE username=%s", (username,))
+                    user = cur.fetchone()
+                if user is None and request_reads_replica():
+                    # Gerade registriert und noch nicht repliziert? Am Primary nachsehen.
+                    conn = get_request_conn()
+                    with tracer.span("db_query"), conn.cursor() as cur:
+                        cur.execute("SELECT password_hash FROM users WHERE username=%s", (username,))
+                        user = cur.fetchone()
+            except Exception as e:
+                app.logger.error(f"SIGNIN_ERROR: Database error during signin for '{username}' from {remote_addr}: {e}")
+                return render_template("error_500.html", error_message="Error during login"), 500
+
+        # Prüfen, ob Benutzer existiert und Passwort übereinstimmt. Für unbekannte
+        # Benutzer läuft ein gleich teurer Dummy-Vergleich (kein Timing-Orakel).
         try:
-            conn = get_db_conn()
-            with conn.cursor() as cur:
-                cur.execute("SELECT password_hash FROM users WHERE username=%s", (username,))
-                user = cur.fetchone()
-            conn.close()
-        except Exception as e:
-            app.logger.error(f"SIGNIN_ERROR: Database error during signin for '{username}' from {remote_addr}: {e}")
-            return render_template("error_500.html", error_message="Error during login"), 500
+            with tracer.span("bcrypt_verify"):
+                if user:
+                    stored_hash = user["password_hash"].encode('utf-8')
+                    valid = hash_pool.checkpw(password.encode('utf-8'), stored_hash)
+                else:
+                    valid = hash_pool.checkpw_dummy(password.encode('utf-8'))
+        except HashPoolBusy:
+            return hash_pool_busy("signin.html")
 
-        # Prüfen, ob Benutzer existiert und Passwort übereinstimmt
-        if user and bcrypt.checkpw(password.encode('utf-8'), user["password_hash"].encode('utf-8')):
+        if valid:
+            if hash_pool.needs_rehash(stored_hash):
+                # Kosten weichen von BCRYPT_ROUNDS ab: im Hintergrund neu hashen
+                hash_pool.rehash_later(password.encode('utf-8'),
+                                       lambda new_hash: store_rehash(username, stored_hash, new_hash))
             session["user"] = username
             app.logger.info(f"SIGNIN_SUCCESS: User '{username}' logged in from {remote_addr}.")
             return redirect(url_for('dashboard'))
@@ -299,10 +1035,10 @@ def signin():
             app.logger.warning(f"SIGNIN_FAILED: Invalid credentials attempt for username '{username}' from {remote_addr}.")
             return render_template("signin.html", error="Invalid login credentials.")
 
-    return render_template("signin.html")
+    return render_page("signin.html")
 
 @app.route("/dashboard")
-@check_db_availability
+@check_db_availability(read=True)
 @login_required
 def dashboard():
     # Log successful access to a protected page after authentication
@@ -324,18 +1060,18 @@ def logout():
 @app.errorhandler(503)
 def service_unavailable_error(e):
     app.logger.critical(f"HTTP_ERROR: 503 Service Unavailable triggered at {request.path}.")
-    return render_template("error_init.html", error_message="Webserver currently not available"), 503
+    return render_page("error_init.html", 503, error_message=ERROR_UNAVAILABLE)
 
 @app.errorhandler(404)
 def page_not_found(e):
     app.logger.warning(f"HTTP_ERROR: 404 Not Found for URL {request.url} from {request.headers.get('X-Real-IP')}.")
-    return render_template("error_404.html"), 404
+    return render_page("error_404.html", 404)
 
 @app.errorhandler(500)
 def internal_server_error(e):
     # Flask logs the traceback automatically; here we log the final handler
     app.logger.error(f"HTTP_ERROR: 500 Internal Server Error triggered at {request.path}.")
-    return render_template("error_500.html", error_message="An internal server error has occurred."), 500
+    return render_page("error_500.html", 500, error_message=ERROR_INTERNAL)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,146 @@
+"""
+Pre-rendered CAPTCHA images.
+
+A producer thread per worker keeps a bounded buffer of (answer, png_bytes)
+pairs filled, using a single ImageCaptcha instance so fonts are loaded once.
+/captcha/image only pops a pair; a pair is removed when it is handed out and
+is therefore never served twice. If the buffer runs dry the caller renders
+inline and the miss is counted.
+
+The producer refills adaptively: it tracks the consumption rate (EWMA of
+pops counted per one-second window, so idle windows decay it) and keeps
+enough images buffered to cover `horizon` seconds of demand, never less
+than `min_fill` and never more than `capacity`.
+
+The captcha package (and with it PIL) is imported on first use, so importing
+the app stays cheap; preload() does it up front in the gunicorn master.
+"""
+import collections
+import os
+import secrets
+import threading
+import time
+
+RATE_WINDOW = 1.0  # seconds per consumption-rate sample
+RATE_ALPHA = 0.2  # EWMA weight of the newest window
+
+
+def _new_answer():
+    # Using 'secrets' is cryptographically stronger than 'random'
+    return secrets.token_hex(3).upper()
+
+
+class CaptchaPool:
+    def __init__(self, capacity=64, min_fill=8, horizon=5.0, width=280, height=90, answer_factory=_new_answer,
+                 on_render=None):
+        self.capacity = capacity
+        self.min_fill = min(min_fill, capacity)
+        self.horizon = horizon
+        self.answer_factory = answer_factory
+        self.on_render = on_render  # optional callback(seconds), e.g. for metrics
+
+        self._size = (width, height)
+        self._captcha = None
+        self._render_lock = threading.Lock()
+        self._buffer = collections.deque(maxlen=capacity)
+        self._cond = threading.Condition()
+        self._pid = None
+
+        # Consumption-rate estimate (pops per second), sampled per RATE_WINDOW
+        self._rate = 0.0
+        self._window_start = None
+        self._window_pops = 0
+
+        self.rendered = 0
+        self.render_seconds = 0.0
+        self.served = 0
+        self.misses = 0
+
+    def render(self):
+        """Renders one fresh (answer, png_bytes) pair."""
+        answer = self.answer_factory()
+        start = time.perf_counter()
+        with self._render_lock:
+            png = self._get_captcha().generate(answer).getvalue()
+        elapsed = time.perf_counter() - start
+        with self._cond:
+            self.rendered += 1
+            self.render_seconds += elapsed
+        if self.on_render is not None:
+            self.on_render(elapsed)
+        return answer, png
+
+    def _get_captcha(self):
+        if self._captcha is None:
+            from captcha.image import ImageCaptcha
+            self._captcha = ImageCaptcha(width=self._size[0], height=self._size[1])
+        return self._captcha
+
+    def preload(self):
+        """Imports PIL and loads the fonts now, e.g. in the gunicorn master so forked workers share them."""
+        with self._render_lock:
+            self._get_captcha().truefonts
+
+    def ensure_started(self):
+        # Threads do not survive fork(), so (re)start per worker process.
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._buffer.clear()
+            threading.Thread(target=self._produce, name="captcha-producer", daemon=True).start()
+
+    def _update_rate(self, now):
+        # Called with self._cond held. Closes every window that has ended since
+        # the last call; the ones after the first saw no pops and decay the rate.
+        if self._window_start is None:
+            self._window_start = now
+            return
+        windows = int((now - self._window_start) // RATE_WINDOW)
+        if windows < 1:
+            return
+        self._rate += RATE_ALPHA * (self._window_pops / RATE_WINDOW - self._rate)
+        self._rate *= (1 - RATE_ALPHA) ** (windows - 1)
+        self._window_start += windows * RATE_WINDOW
+        self._window_pops = 0
+
+    def _target(self):
+        self._update_rate(time.monotonic())
+        return int(min(self.capacity, max(self.min_fill, self._rate * self.horizon)))
+
+    def _produce(self):
+        while True:
+            with self._cond:
+                while len(self._buffer) >= self._target():
+                    self._cond.wait()
+            pair = self.render()
+            with self._cond:
+                self._buffer.append(pair)
+
+    def pop(self):
+        """Returns a pair that has never been handed out before."""
+        self.ensure_started()
+        with self._cond:
+            self._update_rate(time.monotonic())
+            self._window_pops += 1
+            self.served += 1
+            pair = self._buffer.popleft() if self._buffer else None
+            if pair is None:
+                self.misses += 1
+            self._cond.notify()
+        return pair if pair is not None else self.render()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "fill": len(self._buffer),
+                "target": self._target(),
+                "capacity": self.capacity,
+                "consume_rate": round(self._rate, 2),
+                "rendered": self.rendered,
+                "render_rate": round(self.rendered / self.render_seconds, 2) if self.render_seconds else 0.0,
+                "served": self.served,
+                "misses": self.misses,
+            }
@@ -0,0 +1,164 @@
+"""
+Stateless CAPTCHA tokens.
+
+Instead of storing the answer in the server-side session, /captcha/image
+hands the client a token that binds the answer with an HMAC:
+
+    token = b64url( nonce[8] | expires[4] | tag[8] | mac[16] )
+    tag   = HMAC-SHA256(key, "t" | nonce | expires)[:8]
+    mac   = HMAC-SHA256(key, "a" | nonce | expires | ANSWER)[:16]
+
+The answer itself is not part of the token. The tag rejects forged tokens
+before they touch the replay cache; on submit the MAC is recomputed with the
+user's answer. One-shot use (what session.pop gives the session mode) is
+enforced by NonceCache, a fixed-size table of used nonces in a shared-memory
+file, so a token cannot be replayed against another gunicorn worker either.
+Entries expire together with their token. The table fails closed: if every
+slot in a nonce's probe window still holds a live entry, the token is
+rejected instead of evicting a used nonce, so size it with slots_for().
+"""
+import base64
+import fcntl
+import hashlib
+import hmac
+import mmap
+import os
+import secrets
+import struct
+import time
+
+_HEADER = struct.Struct(">8sI")  # nonce, expiry (unix seconds)
+_TAG_LEN = 8
+_MAC_LEN = 16
+_TOKEN_LEN = _HEADER.size + _TAG_LEN + _MAC_LEN
+
+_SLOT = struct.Struct("<8sd")  # nonce, expiry
+
+OK = "ok"
+WRONG = "wrong"
+MISSING = "missing"  # no token, malformed, forged or expired
+REPLAYED = "replayed"
+
+
+def slots_for(ttl, max_rate, load=0.5):
+    """
+    Table size for max_rate submitted tokens per second (all workers of a node)
+    living ttl seconds, at the given load factor, rounded up to a power of two.
+    """
+    needed = max(int(ttl * max_rate / load), 1024)
+    return 1 << (needed - 1).bit_length()
+
+
+class NonceCache:
+    """Open-addressing table of used nonces, shared between processes via mmap."""
+
+    def __init__(self, path, slots=65536, probe=16):
+        self.path = path
+        self.slots = slots
+        self.probe = probe
+        self._pid = None
+        self._fd = None
+        self._map = None
+
+        # Per-worker counters, read via stats()
+        self.added = 0
+        self.replays = 0
+        self.full = 0
+
+    def _open(self):
+        # flock() locks belong to the open file description, which fork()
+        # shares - so every worker opens the file itself.
+        if self._pid == os.getpid():
+            return
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = self.slots * _SLOT.size
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+        self._fd = fd
+        self._map = mmap.mmap(fd, size)
+        self._pid = os.getpid()
+
+    def add(self, nonce, expires):
+        """
+        Marks nonce as used. Returns False if it was already used (replay) or
+        its probe window is full of live entries (fail closed: evicting one
+        would make that used token valid again).
+        """
+        self._open()
+        now = time.time()
+        start = int.from_bytes(hashlib.blake2b(nonce, digest_size=8).digest(), "little") % self.slots
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            free = None
+            for i in range(self.probe):
+                slot = (start + i) % self.slots
+                used, expiry = _SLOT.unpack_from(self._map, slot * _SLOT.size)
+                if expiry < now:
+                    # Never used or expired
+                    if free is None:
+                        free = slot
+                elif used == nonce:
+                    self.replays += 1
+                    return False
+            if free is None:
+                self.full += 1
+                return False
+            _SLOT.pack_into(self._map, free * _SLOT.size, nonce, expires)
+            self.added += 1
+            return True
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def stats(self):
+        return {
+            "slots": self.slots,
+            "probe": self.probe,
+            "added": self.added,
+            "replays": self.replays,
+            "full": self.full,
+        }
+
+
+class CaptchaTokenSigner:
+    def __init__(self, secret, nonce_cache, ttl=300):
+        if isinstance(secret, str):
+            secret = secret.encode("utf-8")
+        # Derive a dedicated key so CAPTCHA MACs never collide with session signatures
+        self._key = hmac.new(secret, b"captcha-token-v1", hashlib.sha256).digest()
+        self.nonce_cache = nonce_cache
+        self.ttl = ttl
+
+    def _tag(self, header):
+        return hmac.new(self._key, b"t" + header, hashlib.sha256).digest()[:_TAG_LEN]
+
+    def _mac(self, header, answer):
+        return hmac.new(self._key, b"a" + header + answer.upper().encode("utf-8"), hashlib.sha256).digest()[:_MAC_LEN]
+
+    def issue(self, answer):
+        header = _HEADER.pack(secrets.token_bytes(8), int(time.time()) + self.ttl)
+        raw = header + self._tag(header) + self._mac(header, answer)
+        return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+    def verify(self, token, answer):
+        """Consumes the token and returns OK, WRONG, MISSING or REPLAYED."""
+        if not token:
+            return MISSING
+        try:
+            raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        except (ValueError, TypeError):
+            return MISSING
+        if len(raw) != _TOKEN_LEN:
+            return MISSING
+        header, tag, mac = raw[:_HEADER.size], raw[_HEADER.size:-_MAC_LEN], raw[-_MAC_LEN:]
+        if not hmac.compare_digest(tag, self._tag(header)):
+            return MISSING
+        nonce, expires = _HEADER.unpack(header)
+        if expires < time.time():
+            return MISSING
+        # Burn the nonce before checking the answer: like session.pop, a token
+        # allows exactly one attempt, right or wrong.
+        if not self.nonce_cache.add(nonce, float(expires)):
+            return REPLAYED
+        if not hmac.compare_digest(mac, self._mac(header, answer or "")):
+            return WRONG
+        return OK
@@ -0,0 +1,151 @@
+"""
+Database health state for the webapp.
+
+A background thread per worker probes the database and caches the result
+for a short TTL. Probe results and request-path connection errors feed a
+circuit breaker, so that once the database is known to be down requests are
+answered at once instead of each one waiting for the connect timeout.
+
+Breaker states:
+    closed     - normal operation, failures are counted
+    open       - requests are rejected until reset_timeout has passed
+    half_open  - a limited number of probe requests are let through; one
+                 success closes the breaker, one failure opens it again
+"""
+import os
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=3, reset_timeout=10.0, half_open_max=1):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max = half_open_max
+
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._half_open_inflight = 0
+        self.rejected = 0
+
+    def allow_request(self):
+        """Returns True if the caller may talk to the database."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    return False
+                self.state = HALF_OPEN
+                self._half_open_inflight = 0
+            # HALF_OPEN: admit a bounded number of probe requests
+            if self._half_open_inflight < self.half_open_max:
+                self._half_open_inflight += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def release(self):
+        """
+        Gives back a half-open probe slot whose request ended without a verdict
+        (neither record_success nor record_failure). No-op in the other states.
+        """
+        with self._lock:
+            if self.state == HALF_OPEN and self._half_open_inflight > 0:
+                self._half_open_inflight -= 1
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._half_open_inflight = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self._half_open_inflight = 0
+
+    def snapshot(self):
+        with self._lock:
+            return {"state": self.state, "failures": self.failures, "rejected": self.rejected}
+
+
+class DBHealthMonitor:
+    """Runs probe() every interval seconds in a daemon thread and caches the result."""
+
+    def __init__(self, probe, breaker, interval=2.0, ttl=6.0, inconclusive=()):
+        self.probe = probe
+        self.breaker = breaker
+        self.interval = interval
+        self.ttl = ttl
+        # Exceptions that say nothing about the database itself (e.g. pool exhausted)
+        self.inconclusive = tuple(inconclusive)
+
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._healthy = None
+        self._checked_at = 0.0
+        self._latency = None
+        self._error = None
+
+    def ensure_started(self):
+        # Threads do not survive fork(), so (re)start per worker process.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="db-health", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self.check_now()
+            time.sleep(self.interval)
+
+    def check_now(self):
+        start = time.monotonic()
+        try:
+            self.probe()
+        except self.inconclusive:
+            # No verdict: do not leave a half-open slot stuck until the next real result
+            self.breaker.release()
+            return
+        except Exception as e:
+            self._update(False, time.monotonic() - start, str(e))
+            self.breaker.record_failure()
+        else:
+            self._update(True, time.monotonic() - start, None)
+            self.breaker.record_success()
+
+    def _update(self, healthy, latency, error):
+        with self._lock:
+            self._healthy = healthy
+            self._latency = latency
+            self._error = error
+            self._checked_at = time.monotonic()
+
+    def state(self):
+        """Cached health. 'healthy' is None if no probe result is younger than the TTL."""
+        with self._lock:
+            age = time.monotonic() - self._checked_at if self._checked_at else None
+            fresh = age is not None and age <= self.ttl
+            return {
+                "healthy": self._healthy if fresh else None,
+                "age": round(age, 3) if age is not None else None,
+                "latency": round(self._latency, 4) if self._latency is not None else None,
+                "error": self._error if fresh else None,
+                "breaker": self.breaker.snapshot(),
+            }
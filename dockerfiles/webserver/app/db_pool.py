@@ -0,0 +1,149 @@
+"""
+Bounded MariaDB connection pool for the webapp.
+
+Each gunicorn worker owns one pool. Connections are handed out LIFO so the
+hottest connection is reused first, checked with a cheap COM_PING before
+being returned to a caller (pre-ping) and closed once they are older than
+the recycle interval, well before MariaDB's wait_timeout drops them.
+"""
+import os
+import threading
+import time
+
+
+class PoolExhausted(Exception):
+    """Raised when no connection becomes free within the checkout timeout."""
+
+
+class ConnectionPool:
+    def __init__(self, connect, max_size=4, timeout=2.0, recycle=1800, pre_ping=True):
+        self._connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+
+        self._cond = threading.Condition()
+        self._idle = []  # stack of (conn, created_at)
+        self._created_at = {}  # id(conn) -> created_at for checked-out connections
+        self._size = 0
+        self._pid = os.getpid()
+
+        # Counters, read via stats()
+        self.connects = 0
+        self.reuses = 0
+        self.discards = 0
+        self.timeouts = 0
+
+    def _check_fork(self):
+        # A pool inherited through fork() shares sockets with the parent.
+        # Forget them (without sending COM_QUIT) and start empty.
+        if self._pid != os.getpid():
+            self._idle = []
+            self._created_at = {}
+            self._size = 0
+            self._pid = os.getpid()
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        """Returns a live connection, opening a new one if the pool has room."""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn = self._checkout(deadline)
+            if conn is None:
+                break
+            # Ping outside the lock: a DB that stops answering must only stall
+            # this caller (bounded by the socket read timeout), not the pool.
+            if self.pre_ping:
+                try:
+                    conn.ping(reconnect=False)
+                except Exception:
+                    with self._cond:
+                        self._created_at.pop(id(conn), None)
+                        self._discard_locked(conn)
+                        self._cond.notify()
+                    continue
+            with self._cond:
+                self.reuses += 1
+            return conn
+
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._created_at[id(conn)] = time.monotonic()
+            self.connects += 1
+        return conn
+
+    def _checkout(self, deadline):
+        """Pops an idle connection (marked checked out), or reserves a slot and returns None."""
+        with self._cond:
+            self._check_fork()
+            while True:
+                while self._idle:
+                    conn, created_at = self._idle.pop()
+                    if self.recycle and time.monotonic() - created_at > self.recycle:
+                        self._discard_locked(conn)
+                        continue
+                    self._created_at[id(conn)] = created_at
+                    return conn
+
+                if self._size < self.max_size:
+                    # Reserve the slot, then connect outside the lock so a slow
+                    # handshake does not block other threads returning connections.
+                    self._size += 1
+                    return None
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    self.timeouts += 1
+                    raise PoolExhausted(f"No database connection available within {self.timeout}s")
+
+    def release(self, conn, discard=False):
+        """Returns a connection to the pool. Broken connections should be discarded."""
+        with self._cond:
+            created_at = self._created_at.pop(id(conn), None)
+            if created_at is None:
+                # Checked out before a fork or never ours: just close it.
+                self._close(conn)
+                return
+            if discard or conn.open is False:
+                self._discard_locked(conn)
+            else:
+                self._idle.append((conn, created_at))
+            self._cond.notify()
+
+    def _discard_locked(self, conn):
+        self._close(conn)
+        self._size -= 1
+        self.discards += 1
+
+    def close_all(self):
+        with self._cond:
+            for conn, _ in self._idle:
+                self._discard_locked(conn)
+            self._idle = []
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": len(self._created_at),
+                "max_size": self.max_size,
+                "connects": self.connects,
+                "reuses": self.reuses,
+                "discards": self.discards,
+                "timeouts": self.timeouts,
+            }
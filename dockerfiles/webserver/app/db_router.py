@@ -0,0 +1,146 @@
+"""
+Read/write split between the MariaDB primary and its replicas.
+
+ReadRouter holds one ConnectionPool per replica. A background thread per
+worker asks every replica for its replication lag (SHOW REPLICA STATUS,
+Seconds_Behind_Master) every `interval` seconds. read_pool() returns the
+next usable replica round-robin; a replica is skipped when
+
+    - its lag is above max_lag, or replication is stopped (lag NULL),
+    - the lag query failed (replica down), or
+    - the last successful check is older than stale_after seconds.
+
+Without a usable replica read_pool() falls back to the primary pool, so
+reads keep working (with the primary's load) while replicas are behind or
+down. Writes always go to the primary.
+
+Replicas can miss rows written in the last `lag` seconds. Callers that
+must see their own writes (signin right after signup) re-check a negative
+result on the primary.
+"""
+import os
+import threading
+import time
+
+DEFAULT_PORT = 3306
+
+
+def split_host(address, default_port=DEFAULT_PORT):
+    """("host", port) from "host" or "host:port" (DB_HOST, DB_REPLICA_HOSTS entries)."""
+    host, _, port = address.partition(":")
+    return host, int(port or default_port)
+
+
+def replica_lag(conn):
+    """Seconds behind the primary, or None if replication is not running."""
+    with conn.cursor() as cur:
+        try:
+            cur.execute("SHOW REPLICA STATUS")
+        except Exception:
+            # MariaDB < 10.5.1 only knows the old name
+            cur.execute("SHOW SLAVE STATUS")
+        row = cur.fetchone()
+    if not row:
+        # Not configured as a replica (e.g. a standalone test server): nothing to lag behind
+        return 0
+    if row.get("Slave_SQL_Running", "Yes") != "Yes" or row.get("Slave_IO_Running", "Yes") != "Yes":
+        return None
+    return row.get("Seconds_Behind_Master")
+
+
+class _Replica:
+    __slots__ = ("name", "pool", "lag", "checked_at", "error", "reads")
+
+    def __init__(self, name, pool):
+        self.name = name
+        self.pool = pool
+        self.lag = None
+        self.checked_at = 0.0
+        self.error = "not checked yet"
+        self.reads = 0
+
+
+class ReadRouter:
+    def __init__(self, primary, replicas, max_lag=5.0, interval=2.0, stale_after=10.0, lag_query=replica_lag):
+        """primary: ConnectionPool; replicas: {name: ConnectionPool}."""
+        self.primary = primary
+        self.replicas = [_Replica(name, pool) for name, pool in replicas.items()]
+        self.max_lag = max_lag
+        self.interval = interval
+        self.stale_after = stale_after
+        self.lag_query = lag_query
+
+        self._lock = threading.Lock()
+        self._next = 0
+        self._pid = None
+        self.primary_fallbacks = 0
+
+    def ensure_started(self):
+        # Threads do not survive fork(), so (re)start per worker process.
+        if self._pid == os.getpid() or not self.replicas:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name="replica-lag", daemon=True).start()
+
+    def _run(self):
+        while True:
+            self.check_now()
+            time.sleep(self.interval)
+
+    def check_now(self):
+        for replica in self.replicas:
+            try:
+                conn = replica.pool.acquire()
+            except Exception as e:
+                lag, error = None, str(e)
+            else:
+                try:
+                    lag, error = self.lag_query(conn), None
+                    replica.pool.release(conn)
+                except Exception as e:
+                    replica.pool.release(conn, discard=True)
+                    lag, error = None, str(e)
+            with self._lock:
+                replica.lag = lag
+                replica.error = error if error else (None if lag is not None else "replication stopped")
+                replica.checked_at = time.monotonic()
+
+    def _usable(self, replica, now):
+        return (replica.error is None and replica.lag is not None and replica.lag <= self.max_lag
+                and now - replica.checked_at <= self.stale_after)
+
+    def read_pool(self):
+        """(name, pool) of the next usable replica, or ("primary", primary pool)."""
+        self.ensure_started()
+        now = time.monotonic()
+        with self._lock:
+            for offset in range(len(self.replicas)):
+                replica = self.replicas[(self._next + offset) % len(self.replicas)]
+                if self._usable(replica, now):
+                    self._next = (self._next + offset + 1) % len(self.replicas)
+                    replica.reads += 1
+                    return replica.name, replica.pool
+            if self.replicas:
+                self.primary_fallbacks += 1
+        return "primary", self.primary
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "max_lag": self.max_lag,
+                "primary_fallbacks": self.primary_fallbacks,
+                "replicas": {
+                    r.name: {
+                        "usable": self._usable(r, now),
+                        "lag": r.lag,
+                        "error": r.error,
+                        "checked_s_ago": round(now - r.checked_at, 1) if r.checked_at else None,
+                        "reads": r.reads,
+                        "pool": r.pool.stats(),
+                    } for r in self.replicas
+                },
+            }
@@ -0,0 +1,310 @@
+"""
+Bounded process pool for bcrypt.
+
+bcrypt is deliberately slow and holds the CPU for the whole call, so running
+it on the gunicorn worker stalls every other request that worker would
+serve. HashPool runs hashpw/checkpw in a small process pool and limits how
+many jobs may be queued or running at once. When that limit is reached,
+hashpw()/checkpw() fail immediately with HashPoolBusy so the caller can answer with a
+429 + Retry-After instead of letting latency pile up.
+
+Every job reports how long it waited in the queue and how long the hash
+itself took, which is what the pool has to be sized against.
+
+The work factor (rounds) is configuration. Hashes with a different cost are
+upgraded or downgraded after a successful login by rehash_later(), on a
+background thread, one at a time and only while no login job is queued or
+running. Rehash jobs do not take admission slots, so logins keep the full
+queue. Pick the cost for a host with the calibration command:
+
+    python hash_pool.py --target-ms 150
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+
+
+class HashPoolBusy(Exception):
+    """Raised when the pool's queue-depth limit is reached, a job times out or the pool broke."""
+
+
+# --- Executed in the pool processes ---
+
+def _hashpw(password, rounds):
+    start = time.perf_counter()
+    hashed = bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+    return hashed, time.perf_counter() - start
+
+
+def _checkpw(password, hashed):
+    start = time.perf_counter()
+    ok = bcrypt.checkpw(password, hashed)
+    return ok, time.perf_counter() - start
+
+
+class _Timing:
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "avg": round(self.total / self.count, 4) if self.count else 0.0,
+            "max": round(self.max, 4),
+        }
+
+
+class HashPool:
+    def __init__(self, workers=2, max_queue=4, timeout=10.0, rounds=12, start_method="forkserver"):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.rounds = rounds
+        self.start_method = start_method
+
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        # Admission control: jobs running in the pool + jobs waiting for a process
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._depth = 0
+        self._background = False  # a rehash job is in the pool
+        self._dummy_hash = None
+        self._rehash_executor = None
+        self._rehash_pid = None
+        self._rehash_pending = 0
+
+        self.rejected = 0
+        self.timeouts = 0
+        self.restarts = 0
+        self.rehashed = 0
+        self.rehash_skipped = 0
+        self.wait = {"hash": _Timing(), "check": _Timing()}
+        self.run = {"hash": _Timing(), "check": _Timing()}
+
+    def _get_executor(self):
+        # The executor is created lazily per worker process; a pool inherited
+        # through fork() would point at the parent's processes.
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = self._new_executor()
+                    self._slots = threading.BoundedSemaphore(self.workers + self.max_queue)
+                    self._depth = 0
+                    self._background = False
+                    self._pid = os.getpid()
+        return self._executor
+
+    def _new_executor(self):
+        ctx = multiprocessing.get_context(self.start_method)
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx)
+
+    def _replace_broken(self, executor):
+        # A pool process died (e.g. OOM kill): every pending future fails and the
+        # executor refuses new work, so start a fresh one. Slots of the failed
+        # jobs come back through their done callbacks.
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = self._new_executor()
+            self.restarts += 1
+        executor.shutdown(wait=False)
+
+    def _admit(self, background):
+        """Admits one job or raises HashPoolBusy. Returns the function that gives its place back."""
+        if background:
+            # Only into an idle pool and never more than one: a rehash may delay
+            # a login by one hash at most and never takes a login's slot.
+            with self._lock:
+                if self._depth or self._background:
+                    raise HashPoolBusy("bcrypt pool not idle")
+                self._background = True
+
+            def release():
+                with self._lock:
+                    self._background = False
+            return release
+
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HashPoolBusy(f"bcrypt queue full ({self.workers} workers + {self.max_queue} queued)")
+        with self._lock:
+            self._depth += 1
+
+        def release():
+            with self._lock:
+                self._depth -= 1
+            slots.release()
+        return release
+
+    def _submit(self, kind, fn, *args, background=False):
+        executor = self._get_executor()
+        release = self._admit(background)
+
+        def done(_future=None):
+            # The place is held until the job has actually left the pool process,
+            # not just until this caller stopped waiting for it.
+            release()
+
+        start = time.perf_counter()
+        try:
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            done()
+            self._replace_broken(executor)
+            raise HashPoolBusy("bcrypt pool restarted")
+        except BaseException:
+            done()
+            raise
+        future.add_done_callback(done)
+        try:
+            result, elapsed = future.result(timeout=self.timeout)
+        except FutureTimeout:
+            with self._lock:
+                self.timeouts += 1
+            raise HashPoolBusy(f"bcrypt job did not finish within {self.timeout}s")
+        except BrokenProcessPool:
+            self._replace_broken(executor)
+            raise HashPoolBusy("bcrypt pool restarted")
+        total = time.perf_counter() - start
+        with self._lock:
+            self.run[kind].add(elapsed)
+            self.wait[kind].add(max(total - elapsed, 0.0))
+        return result
+
+    def hashpw(self, password):
+        """bcrypt.hashpw(password, gensalt(rounds)) in the pool. Raises HashPoolBusy."""
+        return self._submit("hash", _hashpw, password, self.rounds)
+
+    def checkpw(self, password, hashed):
+        """bcrypt.checkpw(password, hashed) in the pool. Raises HashPoolBusy."""
+        return self._submit("check", _checkpw, password, hashed)
+
+    def checkpw_dummy(self, password):
+        """
+        checkpw against a fixed hash of the same cost, for unknown users: the
+        response takes as long as for a wrong password. Always returns False.
+        """
+        if self._dummy_hash is None:
+            self._dummy_hash = self.hashpw(b"unknown-user-dummy-password")
+        self.checkpw(password, self._dummy_hash)
+        return False
+
+    def needs_rehash(self, hashed):
+        """True if hashed (bytes, "$2b$<cost>$...") was made with a different cost than self.rounds."""
+        try:
+            return int(hashed.split(b"$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return False
+
+    def rehash_later(self, password, store):
+        """
+        Hashes password with the current cost on a background thread and calls
+        store(new_hash). Skipped (and retried at the next login) when a rehash
+        is already pending or any login job is queued or running; the job
+        takes no admission slot, so logins never get HashPoolBusy because
+        of it.
+        """
+        with self._lock:
+            if self._rehash_pid != os.getpid():
+                self._rehash_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bcrypt-rehash")
+                self._rehash_pid = os.getpid()
+                self._rehash_pending = 0
+            if self._rehash_pending >= self.max_queue:
+                self.rehash_skipped += 1
+                return
+            self._rehash_pending += 1
+        self._rehash_executor.submit(self._rehash, password, store)
+
+    def _rehash(self, password, store):
+        try:
+            new_hash = self._submit("hash", _hashpw, password, self.rounds, background=True)
+        except Exception:
+            # Busy, timed out or broken pool: the next login tries again
+            with self._lock:
+                self.rehash_skipped += 1
+            return
+        finally:
+            with self._lock:
+                self._rehash_pending -= 1
+        store(new_hash)
+        with self._lock:
+            self.rehashed += 1
+
+    def retry_after(self):
+        """Rough number of seconds until a queued job would get a process."""
+        with self._lock:
+            runs = [t.total / t.count for t in self.run.values() if t.count]
+        avg = max(runs) if runs else 0.25
+        return max(1, int(round(avg * (self.max_queue / max(self.workers, 1) + 1))))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "depth": self._depth,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "restarts": self.restarts,
+                "rounds": self.rounds,
+                "rehashed": self.rehashed,
+                "rehash_skipped": self.rehash_skipped,
+                "queue_wait": {k: v.as_dict() for k, v in self.wait.items()},
+                "hash_time": {k: v.as_dict() for k, v in self.run.items()},
+            }
+
+
+# --- Calibration ---
+
+def calibrate(target, min_rounds=10, max_rounds=16, samples=3):
+    """
+    Measures hashpw on this host for increasing costs. Returns (rounds, {rounds: seconds}):
+    the highest cost whose median stays within target seconds (at least min_rounds).
+    """
+    timings = {}
+    for rounds in range(min_rounds, max_rounds + 1):
+        timings[rounds] = statistics.median(_hashpw(b"calibration-password", rounds)[1] for _ in range(samples))
+        if timings[rounds] > target:
+            # Every further round doubles the time
+            break
+    fitting = [rounds for rounds, seconds in timings.items() if seconds <= target]
+    return (max(fitting) if fitting else min_rounds), timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pick a bcrypt cost for a target hashpw latency on this host.")
+    parser.add_argument("--target-ms", type=float, default=150, help="target latency per hash (default 150)")
+    parser.add_argument("--min-rounds", type=int, default=10, help="never recommend less than this (default 10)")
+    parser.add_argument("--samples", type=int, default=3, help="hashes measured per cost (median, default 3)")
+    args = parser.parse_args(argv)
+
+    rounds, timings = calibrate(args.target_ms / 1000, min_rounds=args.min_rounds, samples=args.samples)
+    for cost, seconds in timings.items():
+        print(f"cost {cost:2d}: {seconds * 1000:8.1f} ms")
+    if timings[rounds] > args.target_ms / 1000:
+        print(f"Warning: even cost {rounds} exceeds {args.target_ms:.0f} ms on this host.")
+    print(f"BCRYPT_ROUNDS={rounds}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+"""
+Non-blocking log pipeline for the webapp.
+
+BatchingFileHandler replaces the synchronous logging.FileHandler: emit()
+only puts the record into a bounded queue, and a writer thread per worker
+process formats and appends records to the log file in batches (up to
+batch_size records or every flush_interval seconds, whichever comes first).
+The formatter is the same, so every line looks exactly as before.
+
+When the queue is full the handler either drops the record ("drop") or
+waits up to block_timeout seconds for room ("block", dropping only after
+the timeout). Dropped records are counted, and the writer reports them in
+the log itself with a LOG_DROPPED line.
+
+JsonFormatter is the structured alternative to the text format: one JSON
+object per line with the event type (the "EVENT_NAME:" prefix of the
+message) and the request fields that RequestContextFilter attaches while
+the record is still on the request thread.
+
+DedupFilter collapses floods: per (event, client_ip) key only the first
+`budget` records of a window are written; the rest are counted and
+summarised in one "<EVENT>: ... suppressed" line with count, first/last
+timestamp and a few sample messages once the window closes.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+
+_EVENT_RE = re.compile(r"^([A-Z][A-Z0-9_]+):")
+CONTEXT_FIELDS = ("request_id", "client_ip", "method", "path", "user", "latency_ms")
+# Optional structured fields: dedup summaries and REQUEST_TRACE lines
+EXTRA_FIELDS = ("count", "first_seen", "last_seen", "samples", "status", "spans")
+
+
+def event_of(record):
+    """Event type of a record: explicit record.event or the "EVENT_NAME:" message prefix."""
+    event = getattr(record, "event", None)
+    if event is None:
+        match = _EVENT_RE.match(record.getMessage())
+        event = match.group(1) if match else None
+    return event
+
+
+class RequestContextFilter(logging.Filter):
+    """Copies request fields onto the record. Runs in the emitting thread, before queueing."""
+
+    def __init__(self, context):
+        super().__init__()
+        self.context = context
+
+    def filter(self, record):
+        if getattr(record, "aggregated", False):
+            # Summaries describe many requests, not the one currently running
+            return True
+        for key, value in self.context().items():
+            setattr(record, key, value)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def formatTime(self, record, datefmt=None):
+        ct = time.localtime(record.created)
+        return "%s.%03d%s" % (time.strftime("%Y-%m-%dT%H:%M:%S", ct), record.msecs, time.strftime("%z", ct))
+
+    def format(self, record):
+        doc = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "module": record.name,
+            "event": event_of(record),
+            "message": record.getMessage(),
+        }
+        for key in CONTEXT_FIELDS + EXTRA_FIELDS:
+            value = getattr(record, key, None)
+            if value is not None:
+                doc[key] = value
+        if record.exc_info:
+            doc["exc"] = self.formatException(record.exc_info)
+        return json.dumps(doc, separators=(",", ":"), ensure_ascii=False)
+
+
+class _Window:
+    __slots__ = ("start", "passed", "suppressed", "first", "last", "samples")
+
+    def __init__(self, now):
+        self.start = now
+        self.passed = 0
+        self.suppressed = 0
+        self.first = None
+        self.last = None
+        self.samples = []
+
+
+class DedupFilter(logging.Filter):
+    """
+    Rate-limits flood-prone events per (event, client_ip) and window.
+
+    budgets maps event type -> records written per key and window; other
+    events pass untouched. Once an event has event_budget distinct keys in
+    the current window (or max_keys keys are tracked in total), further
+    clients share the key (event, "*"), so a botnet with many addresses
+    cannot multiply the volume either. Summaries are handed to sink(), with
+    record.aggregated set so filters let them through.
+    """
+
+    def __init__(self, key_func, budgets, sink, window=10.0, event_budget=50, max_samples=3, max_keys=10000):
+        super().__init__()
+        self.key_func = key_func
+        self.budgets = budgets
+        self.sink = sink
+        self.window = window
+        self.event_budget = event_budget
+        self.max_samples = max_samples
+        self.max_keys = max_keys
+
+        self._lock = threading.Lock()
+        self._windows = {}
+        self._keys_per_event = {}
+        self._next_sweep = 0.0
+        self._pid = None
+
+        self.suppressed = 0
+        self.summaries = 0
+
+    def _ensure_sweeper(self):
+        # Idle keys (the attack stopped) still need their summary written.
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._windows = {}
+        self._keys_per_event = {}
+        threading.Thread(target=self._sweep_loop, name="log-dedup", daemon=True).start()
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self.window)
+            self.sweep()
+
+    def filter(self, record):
+        if getattr(record, "aggregated", False):
+            return True
+        event = event_of(record)
+        budget = self.budgets.get(event)
+        if budget is None:
+            return True
+        client_ip = self.key_func(record)
+        now = time.time()
+
+        with self._lock:
+            self._ensure_sweeper()
+            key = (event, client_ip)
+            window = self._windows.get(key)
+            if window is None:
+                if self._keys_per_event.get(event, 0) >= self.event_budget or len(self._windows) >= self.max_keys:
+                    key = (event, "*")
+                    window = self._windows.get(key)
+                if window is None:
+                    window = self._windows[key] = _Window(now)
+                    self._keys_per_event[event] = self._keys_per_event.get(event, 0) + 1
+            if window.passed < budget:
+                window.passed += 1
+                allow = True
+            else:
+                window.suppressed += 1
+                self.suppressed += 1
+                if window.first is None:
+                    window.first = now
+                window.last = now
+                if len(window.samples) < self.max_samples:
+                    sample = record.getMessage()
+                    if sample not in window.samples:
+                        window.samples.append(sample)
+                allow = False
+            sweep_due = now >= self._next_sweep
+        if sweep_due:
+            self.sweep(now)
+        return allow
+
+    def sweep(self, now=None):
+        """Closes expired windows and emits a summary for each one that suppressed records."""
+        now = now if now is not None else time.time()
+        done = []
+        with self._lock:
+            self._next_sweep = now + self.window / 4
+            for key, window in list(self._windows.items()):
+                if now - window.start >= self.window:
+                    del self._windows[key]
+                    self._keys_per_event[key[0]] -= 1
+                    if window.suppressed:
+                        done.append((key, window))
+        for (event, client_ip), window in done:
+            self.summaries += 1
+            self.sink(self._summary(event, client_ip, window))
+
+    def _summary(self, event, client_ip, window):
+        def ts(value):
+            return time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(value)) + ".%03d" % (value % 1 * 1000)
+        source = "multiple clients" if client_ip == "*" else client_ip
+        record = logging.makeLogRecord({
+            "name": "app", "levelno": logging.WARNING, "levelname": "WARNING",
+            "msg": (f"{event}: {window.suppressed} similar events from {source} suppressed "
+                    f"(first {ts(window.first)}, last {ts(window.last)}). Samples: {window.samples}"),
+        })
+        record.event = event
+        record.client_ip = client_ip
+        record.count = window.suppressed
+        record.first_seen = ts(window.first)
+        record.last_seen = ts(window.last)
+        record.samples = window.samples
+        record.aggregated = True
+        return record
+
+    def stats(self):
+        with self._lock:
+            return {"tracked_keys": len(self._windows), "suppressed": self.suppressed, "summaries": self.summaries}
+
+
+class BatchingFileHandler(logging.Handler):
+    def __init__(self, filename, max_queue=10000, batch_size=256, flush_interval=0.5,
+                 policy="drop", block_timeout=0.05):
+        super().__init__()
+        if policy not in ("drop", "block"):
+            raise ValueError(f"unknown queue policy {policy!r}")
+        self.filename = filename
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.block_timeout = block_timeout
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._start_lock = threading.Lock()
+        self._pid = None
+        self._stream = None
+        self._closed = False
+        # File I/O has its own lock: Handler.handle() takes the handler lock
+        # around emit() on the request threads, so the writer must never hold
+        # that one while it waits for the disk.
+        self._io_lock = threading.Lock()
+
+        self.dropped = 0
+        self._reported_dropped = 0
+        self.written = 0
+        self.batches = 0
+        atexit.register(self.close)
+
+    def _ensure_writer(self):
+        # Threads do not survive fork(), so (re)start per worker process.
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name="log-writer", daemon=True).start()
+
+    def emit(self, record):
+        if self._closed:
+            return
+        self._ensure_writer()
+        try:
+            if self.policy == "block":
+                self._queue.put(record, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch:
+                self._write(batch)
+
+    def _collect(self):
+        """Blocks for the first record, then gathers more until the batch is full or the interval ends."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        lines = []
+        for record in batch:
+            try:
+                lines.append(self.format(record))
+            except Exception:
+                self.handleError(record)
+        dropped = self.dropped
+        if dropped != self._reported_dropped:
+            lines.append(self.format(logging.makeLogRecord({
+                "name": "app", "levelno": logging.WARNING, "levelname": "WARNING",
+                "msg": f"LOG_DROPPED: {dropped - self._reported_dropped} log records dropped (queue full, policy={self.policy}).",
+            })))
+            self._reported_dropped = dropped
+        with self._io_lock:
+            try:
+                if self._stream is None:
+                    self._stream = open(self.filename, "a", encoding="utf-8")
+                self._stream.write("\n".join(lines) + "\n")
+                self._stream.flush()
+            except Exception:
+                self.handleError(batch[-1])
+        self.written += len(batch)
+        self.batches += 1
+
+    def flush(self):
+        """Writes everything that is currently queued, on the calling thread."""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._write(batch)
+
+    def close(self):
+        if not self._closed:
+            self.flush()
+            self._closed = True
+            with self._io_lock:
+                if self._stream is not None:
+                    self._stream.close()
+                    self._stream = None
+        super().close()
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "max_queue": self._queue.maxsize,
+            "dropped": self.dropped,
+            "written": self.written,
+            "batches": self.batches,
+            "policy": self.policy,
+        }
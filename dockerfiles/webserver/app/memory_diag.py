@@ -0,0 +1,173 @@
+"""
+Memory diagnostics per gunicorn worker.
+
+RSS history
+    A thread per worker reads the resident set size (/proc/self/statm)
+    every `interval` seconds and keeps the last `history` samples, so a
+    slow climb under sustained traffic is visible without an external
+    agent. sibling_rss() reads the current RSS of all workers of the same
+    master from /proc.
+
+tracemalloc snapshots
+    snapshot() starts tracing if it is not running yet (trace=True starts
+    it with the worker instead, so the first snapshot already covers the
+    warm-up). Each further call takes a snapshot and returns the top
+    allocation sites diffed against the previous one, i.e. what was
+    allocated and not freed between two calls. Tracing costs CPU and
+    memory itself; leave it off in normal operation.
+
+RSS-based recycling
+    should_recycle() turns True once the RSS is above the limit. gunicorn's
+    post_request hook then lets the worker finish its requests and exit,
+    and the master starts a fresh one (like max_requests, but driven by
+    memory). Each worker gets its own limit of limit * (1 + U(0, jitter))
+    so workers that grow at the same rate do not all restart at once.
+"""
+import collections
+import os
+import random
+import resource
+import threading
+import time
+import tracemalloc
+
+_PAGE_SIZE = resource.getpagesize()
+
+
+def rss_bytes(pid="self"):
+    try:
+        with open(f"/proc/{pid}/statm") as fh:
+            return int(fh.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        if pid != "self":
+            return None
+        # No /proc (e.g. macOS in development): peak instead of current RSS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class MemoryDiagnostics:
+    def __init__(self, interval=10.0, history=360, trace=False, trace_frames=10, rss_limit=None, jitter=0.1,
+                 logger=None):
+        """rss_limit in bytes (None: no recycling)."""
+        self.interval = interval
+        self.trace = trace
+        self.trace_frames = trace_frames
+        self.rss_limit = rss_limit
+        self.jitter = jitter
+        self.logger = logger
+        self._history_size = history
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._history = None
+        self._worker_limit = None
+        self._recycle = False
+        self._snapshot = None
+        self._snapshot_at = None
+
+    def ensure_started(self):
+        # Threads and tracemalloc state belong to the worker, not the master
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._history = collections.deque(maxlen=self._history_size)
+            self._snapshot = None
+            self._recycle = False
+            if self.rss_limit:
+                self._worker_limit = int(self.rss_limit * (1 + random.uniform(0, self.jitter)))
+            if self.trace and not tracemalloc.is_tracing():
+                tracemalloc.start(self.trace_frames)
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name="memory-diag", daemon=True).start()
+
+    def _run(self):
+        while True:
+            self.sample()
+            time.sleep(self.interval)
+
+    def sample(self):
+        rss = rss_bytes()
+        self._history.append((round(time.time(), 1), rss))
+        if self._worker_limit and rss > self._worker_limit and not self._recycle:
+            self._recycle = True
+            if self.logger is not None:
+                self.logger.warning(f"WORKER_RECYCLE: Worker {os.getpid()} RSS {rss / 2 ** 20:.1f} MiB above "
+                                    f"limit {self._worker_limit / 2 ** 20:.1f} MiB. Restarting after current requests.")
+        return rss
+
+    def should_recycle(self):
+        return self._recycle
+
+    # --- tracemalloc ---
+
+    def snapshot(self, top=20, key_type="lineno"):
+        """Starts tracing, or diffs a new snapshot against the previous one."""
+        self.ensure_started()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.trace_frames)
+            return {"tracing": True, "started": True, "diff": None}
+        snap = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ))
+        with self._lock:
+            previous, previous_at = self._snapshot, self._snapshot_at
+            self._snapshot, self._snapshot_at = snap, time.time()
+        if previous is None:
+            return {"tracing": True, "started": False, "diff": None}
+        stats = snap.compare_to(previous, key_type)[:top]
+        return {
+            "tracing": True,
+            "started": False,
+            "interval_s": round(self._snapshot_at - previous_at, 1),
+            "diff": [{
+                "site": str(stat.traceback[0]) if stat.traceback else "?",
+                "size_diff": stat.size_diff,
+                "count_diff": stat.count_diff,
+                "size": stat.size,
+                "count": stat.count,
+            } for stat in stats],
+        }
+
+    def stop_tracing(self):
+        tracemalloc.stop()
+        with self._lock:
+            self._snapshot = None
+
+    # --- Reporting ---
+
+    def sibling_rss(self):
+        """Current RSS of all workers of this gunicorn master ({pid: bytes})."""
+        ppid = os.getppid()
+        try:
+            with open(f"/proc/{ppid}/task/{ppid}/children") as fh:
+                pids = [int(p) for p in fh.read().split()]
+        except (OSError, ValueError):
+            pids = [os.getpid()]
+        result = {}
+        for pid in pids:
+            rss = rss_bytes(pid)
+            if rss is not None:
+                result[pid] = rss
+        return result
+
+    def stats(self):
+        self.ensure_started()
+        traced = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else None
+        return {
+            "pid": os.getpid(),
+            "rss_bytes": rss_bytes(),
+            "rss_limit_bytes": self._worker_limit,
+            "recycle_pending": self._recycle,
+            "rss_history": list(self._history),
+            "workers_rss_bytes": self.sibling_rss(),
+            "tracemalloc": {
+                "tracing": traced is not None,
+                "traced_bytes": traced[0] if traced else None,
+                "traced_peak_bytes": traced[1] if traced else None,
+                "snapshot_age_s": round(time.time() - self._snapshot_at, 1)
+                if self._snapshot is not None else None,
+            },
+        }
@@ -0,0 +1,214 @@
+"""
+Prometheus-style metrics, aggregated across gunicorn worker processes.
+
+Every worker records counters and histograms in plain in-process dicts (a
+dict update under a lock on the request path) and a background thread dumps
+them every flush_interval seconds to <directory>/<pid>.json. Whichever
+worker answers the scrape flushes its own state first and then merges the
+files of all workers, so the numbers do not depend on which worker the
+request lands on.
+
+Files of workers that are gone (restart, max_requests) are folded into
+<directory>/archive.json under an flock, so counters stay monotonic across
+worker restarts. Their last flush_interval seconds of data can be lost.
+
+The directory should live on tmpfs (/dev/shm) and be emptied when the
+server starts, like the PROMETHEUS_MULTIPROC_DIR of prometheus_client.
+"""
+import atexit
+import fcntl
+import json
+import math
+import os
+import threading
+import time
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_ARCHIVE = "archive.json"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs, extra=None):
+    items = list(pairs) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in items) + "}"
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    def __init__(self, directory, flush_interval=1.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._defs = {}          # name -> (type, help, buckets)
+        self._values = {}        # (name, labels) -> counter value | [bucket counts..., sum]
+        self._lock = threading.Lock()
+        self._pid = None
+
+    # --- Definition ---
+
+    def counter(self, name, help):
+        self._defs[name] = ("counter", help, None)
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        self._defs[name] = ("histogram", help, tuple(buckets))
+
+    # --- Recording (hot path) ---
+
+    def _ensure_started(self):
+        # Values recorded before fork() belong to the master, not to this worker.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._values = {}
+        os.makedirs(self.directory, exist_ok=True)
+        threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True).start()
+        atexit.register(self.flush)
+
+    def inc(self, name, labels=(), value=1):
+        self._ensure_started()
+        key = (name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def observe(self, name, value, labels=()):
+        self._ensure_started()
+        buckets = self._defs[name][2]
+        key = (name, labels)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0] * (len(buckets) + 1) + [0.0]
+            # Non-cumulative per bucket; the last count slot is +Inf
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    break
+            else:
+                index = len(buckets)
+            data[index] += 1
+            data[-1] += value
+
+    # --- Persistence ---
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def flush(self):
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            rows = [[name, [list(pair) for pair in labels], value if not isinstance(value, list) else list(value)]
+                    for (name, labels), value in self._values.items()]
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(rows, fh, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    # --- Scrape ---
+
+    @staticmethod
+    def _merge(total, rows):
+        for name, labels, value in rows:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            current = total.get(key)
+            if current is None:
+                total[key] = list(value) if isinstance(value, list) else value
+            elif isinstance(value, list):
+                if len(current) == len(value):
+                    for i, v in enumerate(value):
+                        current[i] += v
+            else:
+                total[key] = current + value
+
+    @staticmethod
+    def _alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def collect(self):
+        """Merged values of all workers, including the archive of exited ones."""
+        self._ensure_started()
+        self.flush()
+        total = {}
+        lock_fd = os.open(os.path.join(self.directory, ".lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            archive_path = os.path.join(self.directory, _ARCHIVE)
+            archive = {}
+            try:
+                with open(archive_path, encoding="utf-8") as fh:
+                    self._merge(archive, json.load(fh))
+            except (OSError, ValueError):
+                pass
+            archived = False
+            for entry in os.listdir(self.directory):
+                pid, _, ext = entry.partition(".")
+                if ext != "json" or not pid.isdigit():
+                    continue
+                path = os.path.join(self.directory, entry)
+                try:
+                    with open(path, encoding="utf-8") as fh:
+                        rows = json.load(fh)
+                except (OSError, ValueError):
+                    continue
+                if self._alive(int(pid)):
+                    self._merge(total, rows)
+                else:
+                    self._merge(archive, rows)
+                    os.unlink(path)
+                    archived = True
+            if archived:
+                tmp = archive_path + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as fh:
+                    json.dump([[name, [list(p) for p in labels], value] for (name, labels), value in archive.items()],
+                              fh, separators=(",", ":"))
+                os.replace(tmp, archive_path)
+        finally:
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
+            os.close(lock_fd)
+        self._merge(total, [[name, labels, value] for (name, labels), value in archive.items()])
+        return total
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        values = self.collect()
+        lines = []
+        for name, (kind, help, buckets) in self._defs.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for (metric, labels), value in sorted(values.items(), key=lambda item: item[0]):
+                if metric != name:
+                    continue
+                if kind == "counter":
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + (math.inf,), value[:-1]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels, ('le', _number(bound)))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(value[-1])}")
+                lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,75 @@
+"""
+Pre-rendered pages whose output does not depend on the request.
+
+index, auth_choice, the GET forms of signin/signup and the error pages are
+the same bytes for every visitor, but render_template() ran Jinja for each
+hit - during a DB outage or a 404 scan thousands of times per second.
+PageCache renders each (template, context) pair once and keeps
+
+    body        the HTML as bytes
+    etag        strong ETag (hash of the body)
+    gzip_body   gzip variant (None below gzip_min_size), deterministic
+                (mtime=0), so every worker produces the same bytes and ETag
+
+The gunicorn master warms the cache before forking (preload_app), the
+workers share the pages copy-on-write. Templates only change with a new
+image, so entries never expire. Pages that depend on the session or on
+form input (dashboard, signin/signup with an error) must not go through
+here.
+"""
+import gzip
+import hashlib
+import threading
+
+
+class Page:
+    __slots__ = ("body", "etag", "gzip_body", "gzip_etag")
+
+    def __init__(self, body, gzip_min_size, gzip_level):
+        self.body = body
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        if gzip_min_size is not None and len(body) >= gzip_min_size:
+            self.gzip_body = gzip.compress(body, compresslevel=gzip_level, mtime=0)
+            self.gzip_etag = f"{self.etag}-gz"
+        else:
+            self.gzip_body = None
+            self.gzip_etag = None
+
+
+class PageCache:
+    def __init__(self, render, gzip_min_size=256, gzip_level=9):
+        """render(template, **context) -> str; gzip_min_size=None disables the gzip variants."""
+        self.render = render
+        self.gzip_min_size = gzip_min_size
+        self.gzip_level = gzip_level
+        self._pages = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, template, **context):
+        key = (template, tuple(sorted(context.items())))
+        page = self._pages.get(key)
+        if page is not None:
+            self.hits += 1
+            return page
+        # Two threads may render the same page once each; the result is identical
+        page = Page(self.render(template, **context).encode("utf-8"), self.gzip_min_size, self.gzip_level)
+        with self._lock:
+            page = self._pages.setdefault(key, page)
+        self.misses += 1
+        return page
+
+    def warm(self, pages):
+        """pages: iterable of (template, context dict)."""
+        for template, context in pages:
+            self.get(template, **context)
+
+    def stats(self):
+        pages = list(self._pages.values())
+        return {
+            "pages": len(pages),
+            "bytes": sum(len(p.body) + len(p.gzip_body or b"") for p in pages),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
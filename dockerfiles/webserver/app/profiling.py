@@ -0,0 +1,150 @@
+"""
+On-demand CPU profiling of live gunicorn workers (PROFILING=1).
+
+Two ways in, both writing into one directory with worker pid and time in
+the file name:
+
+Per request (cProfile)
+    The app calls request_profile() for requests that carry the
+    profiling header from the management network; the returned profiler
+    covers only the thread serving that request and is written as
+    request-<pid>-<YYYYmmdd-HHMMSS>-<endpoint>.prof (pstats format, e.g.
+    `python -m pstats file` or snakeviz).
+
+Statistical sampler (collapsed stacks)
+    kill -USR2 <worker pid> (or POST /internal/profile) starts a
+    SIGPROF interval timer in that worker for `seconds`. Each tick, i.e.
+    every `interval` seconds of process CPU time, records the Python stack
+    of every thread. At the end the counts are written as
+    sample-<pid>-<YYYYmmdd-HHMMSS>.collapsed, one "thread;frame;frame N"
+    line per stack, which flamegraph.pl and speedscope read directly. As
+    the timer counts CPU time, a worker waiting for the DB collects no
+    samples; stacks are attributed per thread, so idle threads (the
+    gunicorn main loop, pool threads in wait()) show up as their own
+    towers next to the busy ones.
+
+Nothing is installed while PROFILING=0; with PROFILING=1 and no profile
+running the cost is one header lookup per request.
+"""
+import cProfile
+import os
+import signal
+import sys
+import threading
+import time
+
+
+def _stamp():
+    return time.strftime("%Y%m%d-%H%M%S")
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Profiler:
+    def __init__(self, directory, interval=0.005, default_seconds=30, max_seconds=300, logger=None):
+        self.directory = directory
+        self.interval = interval
+        self.default_seconds = default_seconds
+        self.max_seconds = max_seconds
+        self.logger = logger
+
+        # Reentrant: the SIGPROF handler may interrupt the main thread inside _stop()
+        self._lock = threading.RLock()
+        self._stacks = None
+        self._deadline = 0.0
+        self._started = 0.0
+        self._pid = None
+        # One cProfile at a time per worker (Python >= 3.12 allows only one active profiler)
+        self._request_lock = threading.Lock()
+
+    def _path(self, kind, suffix, extra=""):
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, f"{kind}-{os.getpid()}-{_stamp()}{extra}.{suffix}")
+
+    def _log(self, message):
+        if self.logger is not None:
+            self.logger.info(message)
+
+    # --- cProfile per request ---
+
+    def request_profile(self):
+        """Starts cProfile for the calling thread, or returns None if another request is being profiled."""
+        if not self._request_lock.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def finish_request_profile(self, profiler, endpoint):
+        profiler.disable()
+        self._request_lock.release()
+        path = self._path("request", "prof", f"-{endpoint or 'unmatched'}")
+        profiler.dump_stats(path)
+        self._log(f"PROFILE_WRITTEN: cProfile of request to {endpoint} -> {path}")
+        return path
+
+    # --- Sampler ---
+
+    def install_signal(self, signum=signal.SIGUSR2):
+        """Must run in the worker's main thread (gunicorn post_worker_init)."""
+        signal.signal(signal.SIGPROF, self._on_tick)
+        signal.signal(signum, lambda *_: self.start_sampling())
+        self._pid = os.getpid()
+
+    @property
+    def installed(self):
+        return self._pid == os.getpid()
+
+    @property
+    def sampling(self):
+        return self._stacks is not None
+
+    def start_sampling(self, seconds=None):
+        """Starts the sampler in this worker. Returns False if one is running already."""
+        seconds = min(float(seconds or self.default_seconds), self.max_seconds)
+        with self._lock:
+            if self._stacks is not None:
+                return False
+            self._stacks = {}
+            self._started = time.monotonic()
+            self._deadline = self._started + seconds
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        # An idle worker gets no SIGPROF ticks; make sure the file is written anyway
+        timer = threading.Timer(seconds + 1, self._stop)
+        timer.daemon = True
+        timer.start()
+        self._log(f"PROFILE_SAMPLING: worker {os.getpid()} samples for {seconds:.0f}s every {self.interval * 1000:.1f}ms CPU")
+        return True
+
+    def _on_tick(self, signum, frame):
+        stacks = self._stacks
+        if stacks is None:
+            return
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, top in sys._current_frames().items():
+            parts = []
+            while top is not None:
+                parts.append(_frame_name(top))
+                top = top.f_back
+            parts.append(names.get(ident, f"thread-{ident}"))
+            key = ";".join(reversed(parts))
+            stacks[key] = stacks.get(key, 0) + 1
+        if time.monotonic() >= self._deadline:
+            self._stop()
+
+    def _stop(self):
+        with self._lock:
+            stacks, self._stacks = self._stacks, None
+        if stacks is None:
+            return None
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        path = self._path("sample", "collapsed")
+        with open(path, "w") as fh:
+            for stack, count in sorted(stacks.items()):
+                fh.write(f"{stack} {count}\n")
+        self._log(f"PROFILE_WRITTEN: {sum(stacks.values())} samples in "
+                  f"{time.monotonic() - self._started:.1f}s from worker {os.getpid()} -> {path}")
+        return path
@@ -0,0 +1,147 @@
+"""
+Per-client token buckets shared by all workers of one node.
+
+The WAF only limits /signup (limit_req zone=signup_limit, ModSecurity
+100001-100004). This limiter is the second layer in the app itself: the
+routes ask hit(policy, client) before any DB access, bcrypt or CAPTCHA
+rendering and answer 429 when the bucket is empty.
+
+Every policy is `rate` tokens per second with room for `burst` tokens.
+Buckets live in an open-addressing table in a file on tmpfs that every
+worker maps (like the CAPTCHA nonce cache), so a client cannot multiply
+its budget by hitting different workers. A lookup probes at most `probe`
+slots under one flock, i.e. the decision is O(1). A slot whose bucket has
+refilled completely is equivalent to an absent one and gets reused; if
+the probe window is full, the bucket updated longest ago is evicted
+(that client starts with a full bucket again).
+
+The file header holds allowed/limited counters per policy, so stats() are
+node-wide like the WAF's own counts.
+"""
+import collections
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+
+Policy = collections.namedtuple("Policy", "rate burst")
+
+_MAGIC = b"RLBUCKT1"
+# key, tokens, updated (time.monotonic)
+_SLOT = struct.Struct("<16sdd")
+_COUNTERS = struct.Struct("<QQ")
+_EMPTY = bytes(16)
+
+
+def parse_policies(spec):
+    """"signin=2/10,signup=1/5" -> {"signin": Policy(2.0, 10), ...} (rate per second / burst)."""
+    policies = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.partition("=")
+        rate, _, burst = value.partition("/")
+        try:
+            policy = Policy(float(rate), int(burst or max(1, float(rate))))
+        except ValueError:
+            raise ValueError(f"rate limit policy {item!r}: expected name=rate/burst") from None
+        # rate 0 would divide by zero when computing Retry-After; burst 0 never admits anything
+        if not policy.rate > 0 or policy.burst < 1:
+            raise ValueError(f"rate limit policy {item!r}: rate must be > 0 and burst >= 1")
+        policies[name.strip()] = policy
+    return policies
+
+
+class RateLimiter:
+    def __init__(self, path, policies, slots=65536, probe=8):
+        """policies: {name: Policy}."""
+        self.path = path
+        self.policies = dict(policies)
+        self.slots = slots
+        self.probe = probe
+        self._index = {name: i for i, name in enumerate(sorted(self.policies))}
+        self._table_offset = len(_MAGIC) + 8 + len(self._index) * _COUNTERS.size
+        self._table_offset += -self._table_offset % 64
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self._map = None
+
+    def _open(self):
+        # flock() locks belong to the open file description, which fork()
+        # shares - so every worker opens the file itself.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            size = self._table_offset + self.slots * _SLOT.size
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                header = os.pread(fd, len(_MAGIC) + 8, 0)
+                if header != _MAGIC + struct.pack("<II", len(self._index), self.slots):
+                    # New file or different policies/size: start with empty buckets
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, size)
+                    os.pwrite(fd, _MAGIC + struct.pack("<II", len(self._index), self.slots), 0)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            self._fd = fd
+            self._map = mmap.mmap(fd, size)
+            self._pid = os.getpid()
+
+    def _count(self, policy, allowed):
+        offset = len(_MAGIC) + 8 + self._index[policy] * _COUNTERS.size
+        n_allowed, n_limited = _COUNTERS.unpack_from(self._map, offset)
+        if allowed:
+            n_allowed += 1
+        else:
+            n_limited += 1
+        _COUNTERS.pack_into(self._map, offset, n_allowed, n_limited)
+
+    def hit(self, policy, client):
+        """Takes one token from client's bucket. Returns (allowed, retry_after_seconds)."""
+        rate, burst = self.policies[policy]
+        self._open()
+        key = hashlib.blake2b(f"{policy}\0{client}".encode("utf-8"), digest_size=16).digest()
+        start = int.from_bytes(key[:8], "little") % self.slots
+        now = time.monotonic()
+        # flock serialises the processes, the thread lock the threads of one process
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                slot, tokens = None, float(burst)
+                free, oldest, oldest_updated = None, None, None
+                for i in range(self.probe):
+                    candidate = (start + i) % self.slots
+                    stored, stored_tokens, updated = _SLOT.unpack_from(self._map, self._table_offset + candidate * _SLOT.size)
+                    if stored == key:
+                        slot, tokens = candidate, min(float(burst), stored_tokens + (now - updated) * rate)
+                        break
+                    if stored == _EMPTY or stored_tokens + (now - updated) * rate >= burst:
+                        # Never used, or refilled completely (no different from a new bucket)
+                        if free is None:
+                            free = candidate
+                    elif oldest is None or updated < oldest_updated:
+                        oldest, oldest_updated = candidate, updated
+                if slot is None:
+                    slot = free if free is not None else oldest
+                allowed = tokens >= 1.0
+                if allowed:
+                    tokens -= 1.0
+                _SLOT.pack_into(self._map, self._table_offset + slot * _SLOT.size, key, tokens, now)
+                self._count(policy, allowed)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return allowed, 0.0 if allowed else (1.0 - tokens) / rate
+
+    def stats(self):
+        self._open()
+        result = {}
+        for name, (rate, burst) in self.policies.items():
+            allowed, limited = _COUNTERS.unpack_from(self._map, len(_MAGIC) + 8 + self._index[name] * _COUNTERS.size)
+            result[name] = {"rate": rate, "burst": burst, "allowed": allowed, "limited": limited}
+        return result
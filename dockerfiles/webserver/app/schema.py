@@ -0,0 +1,115 @@
+"""
+Database schema setup without the web stack.
+
+    python schema.py [--wait SECONDS]
+
+Only needs pymysql and the DB_* environment variables; Flask, PIL, the
+CAPTCHA fonts and the session setup are not imported. With --wait the
+command retries the connection until the database accepts it (replacing
+the netcat loop in the entrypoint). INIT_DB_* events go to stderr and to
+the webapp log file in the configured LOG_FORMAT, as they did when
+init_db() ran inside the app.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+import pymysql
+
+from db_router import split_host
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        username VARCHAR(50) UNIQUE NOT NULL,
+        password_hash VARCHAR(255) NOT NULL
+    )
+    """,
+)
+
+
+def connect(connect_timeout=3):
+    host, port = split_host(os.getenv("DB_HOST", "10.10.40.2"))
+    return pymysql.connect(host=host, port=port, user=os.getenv("DB_USER", "webuser"),
+                           password=os.getenv("DB_PASS", "webpass"), database=os.getenv("DB_NAME", "webapp"),
+                           autocommit=True, connect_timeout=connect_timeout)
+
+
+def init_db(connect, logger):
+    """Creates missing tables. connect() returns a new DB-API connection."""
+    logger.info("INIT_DB_START: Executing Database Schema Initialization.")
+    conn = None
+    try:
+        conn = connect()
+        with conn.cursor() as cur:
+            for statement in SCHEMA:
+                cur.execute(statement)
+        logger.info("INIT_DB_SUCCESS: Database schema successfully verified/created.")
+    except pymysql.err.OperationalError as e:
+        logger.critical(f"INIT_DB_FAILURE: Could not initialize database schema. Connection failed: {e}")
+        raise
+    except Exception as e:
+        logger.error(f"INIT_DB_FAILURE: An unexpected error occurred during DB schema initialization: {e}")
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+
+def wait_for_db(timeout, interval=2.0):
+    """Retries connect() until it succeeds or timeout seconds have passed. Returns the connection."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return connect()
+        except pymysql.err.OperationalError as e:
+            if time.monotonic() >= deadline:
+                raise
+            print(f"MariaDB not available ({e.args[0]}). Retrying in {interval:.0f} seconds...", file=sys.stderr)
+            time.sleep(interval)
+
+
+def _logger():
+    log_format = os.getenv("LOG_FORMAT", "text")
+    log_file = os.getenv("LOG_FILE", "/var/log/webapp.json" if log_format == "json" else "/var/log/webapp.log")
+    logger = logging.getLogger("app")
+    logger.setLevel(logging.INFO)
+    logger.addHandler(logging.StreamHandler())
+    try:
+        os.makedirs(os.path.dirname(log_file), exist_ok=True)
+        handler = logging.FileHandler(log_file)
+    except OSError as e:
+        print(f"Warning: Could not open {log_file}, logging to stderr only: {e}", file=sys.stderr)
+        return logger
+    if log_format == "json":
+        from log_pipeline import JsonFormatter
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(name)s - %(message)s'))
+    logger.addHandler(handler)
+    return logger
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create the webapp database schema.")
+    parser.add_argument("--wait", type=float, default=0, metavar="SECONDS",
+                        help="retry the connection for up to SECONDS before giving up")
+    args = parser.parse_args(argv)
+    logger = _logger()
+    try:
+        first = wait_for_db(args.wait)
+    except pymysql.err.OperationalError as e:
+        logger.critical(f"INIT_DB_FAILURE: Could not initialize database schema. Connection failed: {e}")
+        raise
+    # Reuse the connection that proved the DB is up for the schema statements
+    init_db(lambda: first, logger)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except pymysql.err.MySQLError:
+        sys.exit(1)
@@ -0,0 +1,149 @@
+"""
+Session backends for Flask-Session.
+
+The default "filesystem" backend stores one file per session under
+./flask_session, local to the container and never garbage-collected for
+abandoned anonymous sessions. This module adds two alternatives:
+
+    memory  - ShardedMemoryStore: per-process dict shards with TTL and LRU
+              eviction. Single node and single worker only (each gunicorn
+              worker has its own store); gunicorn.conf.py enforces one
+              worker for this backend.
+    redis   - any Redis-compatible server (Redis, Valkey, KeyDB, a local
+              stand-in) shared by all workers and backends.
+
+Both use Flask-Session's msgpack serializer and write lazily: an unmodified
+session is never written back, regardless of SESSION_REFRESH_EACH_REQUEST.
+The stored TTL is therefore counted from the last modification.
+
+TimedSessionInterface wraps any of the backends (including Flask-Session's
+own) and reports how long loading and saving a session took.
+"""
+import collections
+import threading
+import time
+import zlib
+
+from flask_session.base import ServerSideSessionInterface
+
+
+class ShardedMemoryStore:
+    """Bounded key/value store, split into shards that each have their own lock."""
+
+    def __init__(self, shards=16, max_entries=100000):
+        self.shards = [collections.OrderedDict() for _ in range(shards)]
+        self.locks = [threading.Lock() for _ in range(shards)]
+        self.per_shard = max(1, max_entries // shards)
+        self.evictions = 0
+        self.expirations = 0
+
+    def _shard(self, key):
+        index = zlib.crc32(key.encode("utf-8")) % len(self.shards)
+        return self.shards[index], self.locks[index]
+
+    def get(self, key):
+        shard, lock = self._shard(key)
+        with lock:
+            entry = shard.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del shard[key]
+                self.expirations += 1
+                return None
+            shard.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        shard, lock = self._shard(key)
+        now = time.monotonic()
+        with lock:
+            shard[key] = (now + ttl, value)
+            shard.move_to_end(key)
+            # Drop expired entries from the cold end, then enforce the size limit (LRU)
+            while shard:
+                oldest_key, (expires, _) = next(iter(shard.items()))
+                if expires < now and oldest_key != key:
+                    del shard[oldest_key]
+                    self.expirations += 1
+                elif len(shard) > self.per_shard:
+                    del shard[oldest_key]
+                    self.evictions += 1
+                else:
+                    break
+
+    def delete(self, key):
+        shard, lock = self._shard(key)
+        with lock:
+            shard.pop(key, None)
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+    def stats(self):
+        return {"entries": len(self), "evictions": self.evictions, "expirations": self.expirations}
+
+
+class LazyWriteMixin:
+    def should_set_storage(self, app, session):
+        # Only write modified sessions; unmodified ones keep their stored copy.
+        return session.modified
+
+
+class MemorySessionInterface(LazyWriteMixin, ServerSideSessionInterface):
+    ttl = True
+
+    def __init__(self, app, store, lifetime, key_prefix="session:", use_signer=False, permanent=False):
+        self.store = store
+        self.lifetime = lifetime
+        super().__init__(app, key_prefix, use_signer, permanent)
+
+    def _retrieve_session_data(self, store_id):
+        data = self.store.get(store_id)
+        return self.serializer.decode(data) if data is not None else None
+
+    def _delete_session(self, store_id):
+        self.store.delete(store_id)
+
+    def _upsert_session(self, session_lifetime, session, store_id):
+        self.store.set(store_id, self.serializer.encode(session), self.lifetime)
+
+
+def redis_session_interface(app, url, lifetime, key_prefix="session:", use_signer=False, permanent=False):
+    """RedisSessionInterface with lazy writes and a fixed storage TTL. Needs the redis package."""
+    import redis
+    from flask_session.redis import RedisSessionInterface
+
+    class LazyRedisSessionInterface(LazyWriteMixin, RedisSessionInterface):
+        def _upsert_session(self, session_lifetime, session, store_id):
+            self.client.set(name=store_id, value=self.serializer.encode(session), ex=lifetime)
+
+    client = redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+    return LazyRedisSessionInterface(app, client=client, key_prefix=key_prefix, use_signer=use_signer,
+                                     permanent=permanent)
+
+
+class TimedSessionInterface:
+    """Delegates to another session interface and calls observer(op, seconds) for load/save."""
+
+    def __init__(self, inner, observer):
+        self.inner = inner
+        self.observer = observer
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def open_session(self, app, request):
+        start = time.perf_counter()
+        try:
+            return self.inner.open_session(app, request)
+        finally:
+            self.observer("load", time.perf_counter() - start)
+
+    def save_session(self, app, session, response):
+        start = time.perf_counter()
+        try:
+            return self.inner.save_session(app, session, response)
+        finally:
+            self.observer("save", time.perf_counter() - start)
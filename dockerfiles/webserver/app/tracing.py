@@ -0,0 +1,98 @@
+"""
+Lightweight per-request timing spans.
+
+    with tracer.span("db_query"):
+        ...
+
+When tracing is disabled span() returns a shared no-op context manager, so
+the cost on the request path is one attribute check and an empty with
+block. When enabled, spans are collected per thread with the monotonic
+nanosecond clock and returned by end() for the summary line and the
+Server-Timing header.
+
+An optional observer(name, duration_ns) receives every finished span, also
+outside of requests and with the per-request collection turned off; the
+metrics exporter uses it to feed its histograms.
+"""
+import threading
+import time
+
+_local = threading.local()
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("name", "start", "observer")
+
+    def __init__(self, name, observer):
+        self.name = name
+        self.observer = observer
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter_ns() - self.start
+        spans = getattr(_local, "spans", None)
+        if spans is not None:
+            spans.append((self.name, duration))
+        if self.observer is not None:
+            self.observer(self.name, duration)
+        return False
+
+
+class Tracer:
+    def __init__(self, enabled=False, observer=None):
+        self.enabled = enabled
+        self.observer = observer
+        # Spans are measured if either consumer wants them
+        self.active = enabled or observer is not None
+
+    def begin(self):
+        if self.enabled:
+            _local.spans = []
+            _local.start = time.perf_counter_ns()
+
+    def span(self, name):
+        if not self.active:
+            return _NOOP
+        return _Span(name, self.observer)
+
+    def mark(self, name, start_ns):
+        """Records a span that was started elsewhere (e.g. by a signal handler)."""
+        duration = time.perf_counter_ns() - start_ns
+        spans = getattr(_local, "spans", None)
+        if spans is not None:
+            spans.append((name, duration))
+        if self.observer is not None:
+            self.observer(name, duration)
+
+    def end(self):
+        """Returns (total_ms, [(name, ms), ...]) for the current request and resets the collector."""
+        spans = getattr(_local, "spans", None)
+        if spans is None:
+            return None, []
+        total = (time.perf_counter_ns() - _local.start) / 1e6
+        _local.spans = None
+        return total, [(name, duration / 1e6) for name, duration in spans]
+
+
+def server_timing(spans, total_ms=None):
+    """Formats spans as a Server-Timing header value."""
+    parts = [f"{name};dur={ms:.3f}" for name, ms in spans]
+    if total_ms is not None:
+        parts.append(f"total;dur={total_ms:.3f}")
+    return ", ".join(parts)
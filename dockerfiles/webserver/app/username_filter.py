@@ -0,0 +1,193 @@
+"""
+Bloom filter of existing usernames, shared by the workers of one node.
+
+signup and signin ask might_contain() before doing expensive work:
+
+    False -> the name is definitely not in the users table
+    True  -> it may be (false-positive rate ~error_rate at capacity)
+
+The filter lives in a file on tmpfs that every worker maps, like the
+CAPTCHA nonce cache. It is filled from the users table by paging through
+`id > last_id` (fetch(last_id, limit) returns [(id, username), ...]), first
+completely and then incrementally every sync_interval seconds, so rows
+inserted through another node show up after at most one interval. Each
+pass starts `overlap` ids below last_id: auto-increment ids are not always
+committed (or replicated) in order, and re-adding a name is harmless (only
+rows above last_id are counted in items_added). Names added by this node
+are set immediately and counted once their row is synced. Until the first full pass is done
+the filter answers True for everything, i.e. the callers fall back to the
+database.
+
+Keys are normalised the way MariaDB's default *_general_ci collation
+compares (case and accents ignored, trailing spaces ignored); folding more
+than the database does only costs false positives, never false negatives.
+"""
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+import unicodedata
+
+_MAGIC = b"UNBLOOM1"
+# magic, bits, hashes, ready, last_id, items, synced_at
+_HEADER = struct.Struct("<8sQIIQQd")
+_HEADER_SIZE = 64
+
+
+def normalize(username):
+    decomposed = unicodedata.normalize("NFKD", username)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return stripped.casefold().rstrip(" ")
+
+
+class UsernameFilter:
+    def __init__(self, path, fetch, capacity=1000000, error_rate=0.01, sync_interval=5.0, page_size=10000,
+                 overlap=100):
+        self.path = path
+        self.fetch = fetch
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self.page_size = page_size
+        self.overlap = overlap
+        # Optimal size for `capacity` items at `error_rate`
+        self.bits = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2 / 8)) * 8
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self._map = None
+
+        # Per worker: how often the filter saved work
+        self.lookups = 0
+        self.negatives = 0
+        self.sync_errors = 0
+
+    # --- Shared file ---
+
+    def _open(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            size = _HEADER_SIZE + self.bits // 8
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                header = os.pread(fd, _HEADER.size, 0)
+                if len(header) < _HEADER.size or _HEADER.unpack(header)[:3] != (_MAGIC, self.bits, self.hashes):
+                    # New file or different sizing: start empty
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, size)
+                    os.pwrite(fd, _HEADER.pack(_MAGIC, self.bits, self.hashes, 0, 0, 0, 0.0), 0)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            self._fd = fd
+            self._map = mmap.mmap(fd, size)
+            self._pid = os.getpid()
+            threading.Thread(target=self._sync_loop, name="username-filter", daemon=True).start()
+
+    def _header(self):
+        return _HEADER.unpack_from(self._map, 0)
+
+    def _positions(self, username):
+        digest = hashlib.blake2b(normalize(username).encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    # --- Lookups / updates ---
+
+    def might_contain(self, username):
+        self._open()
+        self.lookups += 1
+        if not self._header()[3]:
+            return True
+        bits = self._map
+        for pos in self._positions(username):
+            if not bits[_HEADER_SIZE + (pos >> 3)] & (1 << (pos & 7)):
+                self.negatives += 1
+                return False
+        return True
+
+    def _add_many(self, usernames, last_id=None, ready=None, row_ids=()):
+        positions = [pos for name in usernames for pos in self._positions(name)]
+        # flock serialises the processes, the thread lock the threads of one process
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                bits = self._map
+                for pos in positions:
+                    bits[_HEADER_SIZE + (pos >> 3)] |= 1 << (pos & 7)
+                magic, nbits, hashes, is_ready, stored_id, items, synced_at = self._header()
+                # Checked under the lock: another worker may have synced the same rows
+                items += sum(1 for row_id in row_ids if row_id > stored_id)
+                if last_id is not None:
+                    stored_id = max(stored_id, last_id)
+                    synced_at = time.time()
+                if ready:
+                    is_ready = 1
+                _HEADER.pack_into(bits, 0, magic, nbits, hashes, is_ready, stored_id, items, synced_at)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def add(self, username):
+        self._open()
+        self._add_many([username])
+
+    # --- Sync from the users table ---
+
+    def ensure_started(self):
+        self._open()
+
+    def sync(self):
+        """Adds all rows with an id above the stored last_id. Marks the filter ready when done."""
+        self._open()
+        while True:
+            last_id = self._header()[4]
+            rows = self.fetch(max(0, last_id - self.overlap), self.page_size)
+            if not rows:
+                self._add_many([], last_id=last_id, ready=True)
+                return
+            row_ids = [row_id for row_id, _ in rows]
+            self._add_many([name for _, name in rows], last_id=max(row_ids), row_ids=row_ids)
+            if len(rows) < self.page_size:
+                self._add_many([], ready=True)
+                return
+
+    def _sync_loop(self):
+        while True:
+            try:
+                self.sync()
+            except Exception:
+                # DB unavailable: keep the current state, try again next interval
+                self.sync_errors += 1
+            time.sleep(self.sync_interval)
+
+    def stats(self):
+        self._open()
+        magic, nbits, hashes, ready, last_id, items, synced_at = self._header()
+        set_bits = int.from_bytes(self._map[_HEADER_SIZE:], "little").bit_count()
+        fill = set_bits / nbits
+        return {
+            "ready": bool(ready),
+            "items_added": items,
+            "capacity": self.capacity,
+            "memory_bytes": _HEADER_SIZE + nbits // 8,
+            "hashes": hashes,
+            "fill_ratio": round(fill, 4),
+            # Probability that an unknown name hits k set bits
+            "est_false_positive_rate": round(fill ** hashes, 6),
+            "design_false_positive_rate": self.error_rate,
+            "last_id": last_id,
+            "sync_age_s": round(time.time() - synced_at, 1) if synced_at else None,
+            "lookups": self.lookups,
+            "negatives": self.negatives,
+            "sync_errors": self.sync_errors,
+        }
@@ -9,20 +9,73 @@ MAX_RETRIES=30
 RETRY_INTERVAL=2
 count=0
 
-# --- 1. AIDE (HIDS) Initialization ---
-# Check if the AIDE database exists. If not, create it.
-# This is the "first-run" task you correctly identified.
-echo "AIDE database. Initializing..."
-echo "This may take a minute..."
-/usr/bin/aide --init > /dev/null
-echo "AIDE database initialized. Copying..."
-mv /var/lib/aide/aide.db.new /var/lib/aide/aide.db.gz
+# FAST_START=1 (Standard): AIDE-Baseline läuft parallel zum App-Start, statt
+# "sleep 20" wird nur gewartet, bis containerlab die Bind-Adressen gesetzt hat,
+# und das Schema legt `python schema.py` an (ohne Flask/PIL zu importieren).
+# Was die App dabei unter /app schreibt (__pycache__, flask_session), schließt
+# aide.conf aus - sonst hinge die Baseline vom Timing ab.
+# FAST_START=0: der bisherige sequenzielle Ablauf.
+FAST_START=${FAST_START:-1}
+WEB_BIND=${WEB_BIND:-10.10.10.4:80}
+MGMT_BIND=${MGMT_BIND:-10.10.60.3:8080}
+export WEB_BIND MGMT_BIND
+
+# --- Startup phase timing ---
+# Jede Phase schreibt eine STARTUP_PHASE-Zeile mit ihrer Dauer ins Container-Log.
+uptime_s() { cut -d' ' -f1 /proc/uptime; }
+STARTUP_BEGIN=$(uptime_s)
+phase_begin() { PHASE_NAME=$1; PHASE_BEGIN=$(uptime_s); }
+phase_end() {
+    echo "STARTUP_PHASE: $PHASE_NAME took $(awk -v a="$PHASE_BEGIN" -v b="$(uptime_s)" 'BEGIN { printf "%.2f", b - a }')s"
+}
 
-echo "Running baseline AIDE check..."
-/usr/bin/aide --check | jq -c . >> /var/log/aide.json || true
+# --- 1. AIDE (HIDS) Initialization ---
+aide_baseline() {
+    if [ "$FAST_START" = "1" ] && [ -s /var/lib/aide/aide.db.gz ]; then
+        # Vorhandene Baseline (im Image vorgebaut oder vom letzten Start) weiterverwenden
+        echo "AIDE baseline found, skipping --init."
+    else
+        echo "AIDE database. Initializing..."
+        echo "This may take a minute..."
+        /usr/bin/aide --init > /dev/null
+        echo "AIDE database initialized. Copying..."
+        mv /var/lib/aide/aide.db.new /var/lib/aide/aide.db.gz
+    fi
+
+    echo "Running baseline AIDE check..."
+    /usr/bin/aide --check | jq -c . >> /var/log/aide.json || true
+}
+
+phase_begin aide
+if [ "$FAST_START" = "1" ]; then
+    # Im Hintergrund: der Webserver wartet nicht auf die Baseline
+    ( aide_baseline; phase_end ) &
+else
+    aide_baseline
+    phase_end
+fi
 
+# --- Warten auf die Netzwerkkonfiguration ---
+# containerlab setzt die IP-Adressen erst nach dem Container-Start (exec in
+# topology.clab.yml). Gunicorn kann vorher nicht auf WEB_BIND/MGMT_BIND binden.
+phase_begin network
+if [ "$FAST_START" = "1" ]; then
+    for addr in "${WEB_BIND%:*}" "${MGMT_BIND%:*}"; do
+        waited=0
+        while ! ip -o addr show | grep -q " $addr/"; do
+            if [ $waited -ge 40 ]; then
+                echo "WARNING: $addr not assigned after 20s, continuing."
+                break
+            fi
+            sleep 0.5
+            waited=$((waited + 1))
+        done
+    done
+else
+    sleep 20
+fi
+phase_end
 
-sleep 20
 #--- SSHD Setup ---
 # --- 1. Host-Keys generieren (nur falls nötig) ---
 #    Wir prüfen nur noch auf die Keys. Die Konfig ist jetzt im Image.
@@ -60,30 +113,50 @@ echo "Starting Suricata... (Interface: eth0)"
 echo "--- Starting Gunicorn Only Web Server Setup ---"
 
 
-# --- 1. Wait for MariaDB ---
-echo "Waiting for MariaDB server at $DB_HOST:$DB_PORT..."
-
-# Use the netcat utility to check if the port is open
-while ! nc -z $DB_HOST $DB_PORT; do
-  if [ $count -ge $MAX_RETRIES ]; then
-    echo "🚨 MariaDB server still unavailable after $MAX_RETRIES attempts. Exiting."
-    exit 1
-  fi
-  echo "MariaDB not available. Retrying in $RETRY_INTERVAL seconds..."
-  sleep $RETRY_INTERVAL
-  count=$((count + 1))
-done
-
-echo "✅ MariaDB server is now available."
-
-# --- 2. Initialize Database ---
+# --- 1. Wait for MariaDB / 2. Initialize Database ---
 cd /app
-echo "Initializing Database..."
-# Execute the Python script to set up the database structure
-python -c "from app import init_db; init_db()"
+phase_begin database
+if [ "$FAST_START" = "1" ]; then
+    # schema.py wartet selbst auf die DB (Connect-Retries statt netcat)
+    echo "Waiting for MariaDB and initializing database schema..."
+    python schema.py --wait $((MAX_RETRIES * RETRY_INTERVAL)) || {
+        echo "🚨 MariaDB server still unavailable after $((MAX_RETRIES * RETRY_INTERVAL)) seconds. Exiting."
+        exit 1
+    }
+else
+    echo "Waiting for MariaDB server at $DB_HOST:$DB_PORT..."
+
+    # Use the netcat utility to check if the port is open
+    while ! nc -z $DB_HOST $DB_PORT; do
+      if [ $count -ge $MAX_RETRIES ]; then
+        echo "🚨 MariaDB server still unavailable after $MAX_RETRIES attempts. Exiting."
+        exit 1
+      fi
+      echo "MariaDB not available. Retrying in $RETRY_INTERVAL seconds..."
+      sleep $RETRY_INTERVAL
+      count=$((count + 1))
+    done
+
+    echo "✅ MariaDB server is now available."
+    echo "Initializing Database..."
+    python schema.py
+fi
+phase_end
 
 # --- 3. Start Gunicorn on port 80 (Foreground) ---
 echo "Starting Gunicorn (Backend) on port 80..."
+# Worker class, worker/thread counts and binds come from gunicorn.conf.py:
+# SERVER_MODE=gthread (default, preloaded threaded workers) or SERVER_MODE=sync
+# (previous setup: 2 sync workers). WEB_BIND/MGMT_BIND (exported above) are the
+# public listener and the second listener on the
+# management network for /internal/* endpoints.
+echo "STARTUP_PHASE: total before gunicorn $(awk -v a="$STARTUP_BEGIN" -v b="$(uptime_s)" 'BEGIN { printf "%.2f", b - a }')s"
+# Per-worker metric files (METRICS_ENABLED=1) must not survive a restart
+rm -rf "${METRICS_DIR:-/dev/shm/webapp-metrics}"
+# The username filter is rebuilt from the users table (the DB may have been reset)
+rm -f "${USERNAME_FILTER_FILE:-/dev/shm/webapp-usernames}"
+# Rate-limit buckets and counters start empty
+rm -f "${RATE_LIMIT_FILE:-/dev/shm/webapp-ratelimit}"
 # 'exec' replaces the current shell process with Gunicorn, ensuring Gunicorn is PID 1
 # and listening directly on the external port 80.
-exec gunicorn -b 10.10.10.4:80 app:app --workers 2 --timeout 120
+exec gunicorn -c gunicorn.conf.py app:app
@@ -0,0 +1,61 @@
+"""
+`docker` stand-in used by run_tests_parallel.py (kept small: it starts once per probe).
+
+`docker exec [-u USER] CONTAINER CMD...` is sent to the runner's exec
+session server (TEST_EXEC_SOCKET) and answered from a long-lived session;
+everything else, and every exec the server cannot take, is passed on to
+the real docker (TEST_REAL_DOCKER) unchanged.
+"""
+import json
+import os
+import socket
+import sys
+
+
+def parse_exec(args):
+    """(user, container, argv) for `exec [-u USER] CONTAINER CMD...`, None for anything else."""
+    if not args or args[0] != "exec":
+        return None
+    user, i = None, 1
+    while i < len(args) and args[i].startswith("-"):
+        opt = args[i]
+        if opt in ("-u", "--user") and i + 1 < len(args):
+            user, i = args[i + 1], i + 2
+        elif opt.startswith("--user="):
+            user, i = opt.split("=", 1)[1], i + 1
+        elif opt.startswith("-u") and len(opt) > 2:
+            user, i = opt[2:], i + 1
+        else:
+            # -i, -t, -e, -w, ... brauchen das echte docker exec
+            return None
+    if len(args) - i < 2:
+        return None
+    return user, args[i], args[i + 1:]
+
+
+def main(args):
+    real_docker = os.environ.get("TEST_REAL_DOCKER", "docker")
+    request = parse_exec(args)
+    path = os.environ.get("TEST_EXEC_SOCKET")
+    if request is not None and path:
+        user, container, argv = request
+        try:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(path)
+            sock.sendall(json.dumps({"user": user, "container": container, "argv": argv}).encode() + b"\n")
+            stream = sock.makefile("rb")
+            header = json.loads(stream.readline())
+        except (OSError, ValueError):
+            # Runner nicht erreichbar: Befehl wurde nicht ausgeführt
+            header = {"fallback": True}
+        if not header.get("fallback"):
+            sys.stdout.buffer.write(stream.read(header["stdout"]))
+            sys.stdout.buffer.flush()
+            sys.stderr.buffer.write(stream.read(header["stderr"]))
+            sys.stderr.buffer.flush()
+            sys.exit(header["rc"])
+    os.execvp(real_docker, ["docker"] + args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
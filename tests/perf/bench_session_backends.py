@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Session backend benchmark: filesystem vs. memory vs. redis.
+
+Fills each backend with N live sessions, then measures the webapp's two
+session costs through the real Flask-Session interface:
+
+    load  - open_session() for a random existing session id
+    save  - save_session() of a modified session (captcha answer set)
+
+Usage:
+    python3 tests/perf/bench_session_backends.py --sessions 10000 100000
+    python3 tests/perf/bench_session_backends.py --backends memory redis --redis-url redis://127.0.0.1:6379/0
+
+Needs flask, Flask-Session (and redis for the redis backend). The webapp
+module directory is put on sys.path, but app.py itself is not imported.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "dockerfiles", "webserver", "app")
+sys.path.insert(0, os.path.abspath(APP_DIR))
+
+from flask import Flask  # noqa: E402
+from flask_session import Session  # noqa: E402
+from session_backends import ShardedMemoryStore, MemorySessionInterface, redis_session_interface  # noqa: E402
+
+COOKIE = "session"
+TTL = 7200
+
+
+def make_app(backend, live, workdir, redis_url):
+    app = Flask(__name__)
+    app.secret_key = "bench"
+    app.config["SESSION_PERMANENT"] = False
+    if backend == "filesystem":
+        app.config["SESSION_TYPE"] = "filesystem"
+        app.config["SESSION_FILE_DIR"] = workdir
+        # cachelib prunes beyond SESSION_FILE_THRESHOLD (500); raise it so N sessions stay live
+        app.config["SESSION_FILE_THRESHOLD"] = live * 2
+        Session(app)
+    elif backend == "memory":
+        store = ShardedMemoryStore(max_entries=live * 2)
+        app.session_interface = MemorySessionInterface(app, store, TTL)
+    elif backend == "redis":
+        app.session_interface = redis_session_interface(app, redis_url, TTL)
+        app.session_interface.client.flushdb()
+    else:
+        raise SystemExit(f"unknown backend {backend}")
+    return app
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summary(samples):
+    return {
+        "mean_us": round(statistics.fmean(samples) * 1e6, 1),
+        "p50_us": round(percentile(samples, 0.50) * 1e6, 1),
+        "p99_us": round(percentile(samples, 0.99) * 1e6, 1),
+    }
+
+
+def run(backend, live, ops, redis_url):
+    workdir = tempfile.mkdtemp(prefix="bench-sessions-")
+    try:
+        app = make_app(backend, live, workdir, redis_url)
+        iface = app.session_interface
+        sids = []
+
+        # Populate N live sessions (what the captcha endpoint leaves behind)
+        start = time.perf_counter()
+        with app.test_request_context("/"):
+            for _ in range(live):
+                sess = iface.open_session(app, app.test_request_context("/").request)
+                sess["captcha_answer"] = "A1B2C3"
+                resp = app.response_class()
+                iface.save_session(app, sess, resp)
+                sids.append(sess.sid)
+        fill_seconds = time.perf_counter() - start
+
+        load, save = [], []
+        for _ in range(ops):
+            sid = random.choice(sids)
+            with app.test_request_context("/", headers={"Cookie": f"{COOKIE}={sid}"}) as ctx:
+                t0 = time.perf_counter()
+                sess = iface.open_session(app, ctx.request)
+                load.append(time.perf_counter() - t0)
+                assert sess.get("captcha_answer") == "A1B2C3", f"{backend}: session {sid} not found"
+
+                sess["captcha_answer"] = "D4E5F6"
+                resp = app.response_class()
+                t0 = time.perf_counter()
+                iface.save_session(app, sess, resp)
+                save.append(time.perf_counter() - t0)
+                sess["captcha_answer"] = "A1B2C3"
+                iface.save_session(app, sess, resp)
+
+        return {
+            "backend": backend,
+            "live_sessions": live,
+            "fill_seconds": round(fill_seconds, 2),
+            "load": summary(load),
+            "save": summary(save),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["filesystem", "memory", "redis"])
+    parser.add_argument("--sessions", nargs="+", type=int, default=[10000, 100000])
+    parser.add_argument("--ops", type=int, default=5000)
+    parser.add_argument("--redis-url", default="redis://127.0.0.1:6379/0")
+    args = parser.parse_args()
+
+    results = []
+    for live in args.sessions:
+        for backend in args.backends:
+            result = run(backend, live, args.ops, args.redis_url)
+            print(json.dumps(result), flush=True)
+            results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,517 @@
+#!/usr/bin/env python3
+"""
+Local load-test harness for the webapp - no containerlab, no MariaDB needed.
+
+Targets
+    --target inproc     drives app.app through its WSGI interface (Flask
+                        test client) inside this process
+    --target gunicorn   starts a local gunicorn with the real gunicorn.conf.py
+                        (wsgi_loadtest.py as entry point) and talks HTTP to it
+
+Database
+    default             SQLite stand-in for pymysql (stand_in_db.py) in a
+                        temporary directory, optional --db-latency-ms per
+                        statement
+    --db-host HOST      a throwaway MariaDB (credentials via --env DB_USER=..
+                        DB_PASS=.. DB_NAME=..); the schema is created, test
+                        users are named lt-<run>-<n> and are left in place
+
+CAPTCHA
+    The CAPTCHA pool of the app under test always renders the same answer
+    (wsgi_loadtest.py), so clients fetch /captcha/image like a browser and
+    then simply post that answer. Works with --captcha-mode session or token.
+
+Traffic
+    --mix signin=6,signup=1,dashboard=2,captcha=1 picks flows by weight:
+
+        captcha     GET /captcha/image
+        signup      GET /captcha/image, POST /signup (new user)
+        signin      GET /captcha/image, POST /signin (seeded user)
+        dashboard   GET /dashboard (signs in first if the virtual user is not)
+
+    closed loop (default): --users N virtual users, each starting its next
+        flow when the previous one finished (optionally paced to --rps flows
+        per second in total)
+    open loop (--open --rps R): flows arrive as a Poisson process at R per
+        second regardless of how fast the app answers, executed by up to
+        --users concurrent virtual users. Flow latency counts from the
+        scheduled arrival, so queueing in front of a slow app is included
+        (no coordinated omission). Arrivals that cannot start within
+        --max-lag seconds are counted as late and skipped.
+
+Output
+    One JSON document (stdout or --output): requests and flows per second,
+    and per route / per flow count, p50/p95/p99/max latency in ms, error
+    count and rate and the status codes. An error is any status other than
+    the expected one (200 for pages, 302 for signin/signup) or a failed
+    request.
+
+Examples
+    python3 tests/perf/loadtest/harness.py --duration 20 --users 16
+    python3 tests/perf/loadtest/harness.py --target gunicorn --open --rps 50 --db-latency-ms 2
+    python3 tests/perf/loadtest/harness.py --env SESSION_BACKEND=memory --env CAPTCHA_POOL_SIZE=0
+
+By default the app runs with BCRYPT_ROUNDS=4 and RATE_LIMIT=0 (all traffic
+comes from one machine); override with --env like any other app setting.
+"""
+import argparse
+import http.client
+import http.cookies
+import itertools
+import json
+import os
+import queue
+import random
+import secrets
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.abspath(os.path.join(HERE, "..", "..", "..", "dockerfiles", "webserver", "app"))
+
+HOST = "web.sun.dmz"
+ANSWER = "LOAD42"
+PASSWORD = "Load-Test-Passw0rd!"
+FLOWS = ("captcha", "signup", "signin", "dashboard")
+
+
+def percentile(ordered, p):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def parse_mix(spec):
+    mix = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, weight = item.partition("=")
+        if name not in FLOWS:
+            raise SystemExit(f"unknown flow {name!r} (known: {', '.join(FLOWS)})")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+# --- Results ---
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.flows = {}
+        self.late = 0
+
+    def _add(self, table, key, seconds, status, ok):
+        with self._lock:
+            entry = table.setdefault(key, {"latencies": [], "errors": 0, "status": {}})
+            entry["latencies"].append(seconds)
+            entry["errors"] += not ok
+            entry["status"][status] = entry["status"].get(status, 0) + 1
+
+    def request(self, route, seconds, status, ok):
+        self._add(self.requests, route, seconds, str(status), ok)
+
+    def flow(self, name, seconds, ok):
+        self._add(self.flows, name, seconds, "ok" if ok else "failed", ok)
+
+    @staticmethod
+    def _summarize(table, elapsed):
+        result = {}
+        for key, entry in sorted(table.items()):
+            ordered = sorted(entry["latencies"])
+            count = len(ordered)
+            result[key] = {
+                "count": count,
+                "per_s": round(count / elapsed, 1),
+                "p50_ms": round(percentile(ordered, 0.50) * 1000, 1),
+                "p95_ms": round(percentile(ordered, 0.95) * 1000, 1),
+                "p99_ms": round(percentile(ordered, 0.99) * 1000, 1),
+                "max_ms": round(ordered[-1] * 1000, 1),
+                "errors": entry["errors"],
+                "error_rate": round(entry["errors"] / count, 4),
+                "status": entry["status"],
+            }
+        return result
+
+    def summary(self, elapsed):
+        requests = sum(len(e["latencies"]) for e in self.requests.values())
+        flows = sum(len(e["latencies"]) for e in self.flows.values())
+        errors = sum(e["errors"] for e in self.requests.values())
+        return {
+            "duration_s": round(elapsed, 2),
+            "requests_per_s": round(requests / elapsed, 1),
+            "flows_per_s": round(flows / elapsed, 1),
+            "requests": requests,
+            "errors": errors,
+            "error_rate": round(errors / requests, 4) if requests else None,
+            "late_arrivals": self.late,
+            "routes": self._summarize(self.requests, elapsed),
+            "flows": self._summarize(self.flows, elapsed),
+        }
+
+
+# --- Clients (one per virtual user, each with its own cookies and client IP) ---
+
+class InprocClient:
+    def __init__(self, app, ip):
+        self.client = app.test_client()
+        self.headers = {"X-Real-IP": ip}
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data, headers=self.headers,
+                                    base_url=f"http://{HOST}")
+        body = response.get_data()
+        response.close()
+        return response.status_code, body
+
+
+class HttpClient:
+    def __init__(self, port, ip):
+        self.port = port
+        self.ip = ip
+        self.conn = None
+        self.cookies = {}
+
+    def _store_cookies(self, response):
+        for header in response.headers.get_all("Set-Cookie") or ():
+            cookie = http.cookies.SimpleCookie()
+            cookie.load(header)
+            for name, morsel in cookie.items():
+                if morsel["max-age"] == "0" or "1970" in morsel["expires"]:
+                    self.cookies.pop(name, None)
+                else:
+                    self.cookies[name] = morsel.value
+
+    def request(self, method, path, data=None):
+        headers = {"Host": HOST, "X-Real-IP": self.ip}
+        body = None
+        if data is not None:
+            body = urllib.parse.urlencode(data)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        if self.cookies:
+            headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=60)
+            try:
+                self.conn.request(method, path, body, headers)
+                response = self.conn.getresponse()
+                payload = response.read()
+                self._store_cookies(response)
+                return response.status, payload
+            except (http.client.HTTPException, OSError):
+                # Keep-alive connection closed by the server (e.g. worker restart): reconnect once
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+
+
+class VirtualUser:
+    def __init__(self, client, recorder, accounts, run_id):
+        self.client = client
+        self.recorder = recorder
+        self.accounts = accounts
+        self.run_id = run_id
+        self.signed_in = False
+
+    def _call(self, method, path, data=None, expect=200):
+        start = time.perf_counter()
+        try:
+            status, _ = self.client.request(method, path, data)
+        except Exception:
+            status = "exception"
+        self.recorder.request(f"{method} {path}", time.perf_counter() - start, status, status == expect)
+        return status == expect
+
+    def captcha(self):
+        return self._call("GET", "/captcha/image")
+
+    def signup(self):
+        name = f"lt-{self.run_id}-{next(self.accounts.counter)}"
+        if not self.captcha():
+            return False
+        ok = self._call("POST", "/signup", {"username": name, "password": PASSWORD, "captcha_answer": ANSWER}, 302)
+        if ok:
+            self.accounts.add(name)
+        return ok
+
+    def signin(self):
+        name = self.accounts.pick()
+        if name is None or not self.captcha():
+            return False
+        self.signed_in = self._call("POST", "/signin",
+                                    {"username": name, "password": PASSWORD, "captcha_answer": ANSWER}, 302)
+        return self.signed_in
+
+    def dashboard(self):
+        if not self.signed_in and not self.signin():
+            return False
+        return self._call("GET", "/dashboard")
+
+    def run_flow(self, name, started=None):
+        started = started if started is not None else time.perf_counter()
+        ok = getattr(self, name)()
+        self.recorder.flow(name, time.perf_counter() - started, ok)
+        return ok
+
+
+class Accounts:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.names = []
+        self.counter = itertools.count()
+
+    def add(self, name):
+        with self._lock:
+            self.names.append(name)
+
+    def pick(self):
+        with self._lock:
+            return random.choice(self.names) if self.names else None
+
+
+# --- Targets ---
+
+def app_environment(args, workdir):
+    env = {
+        "FLASK_SECRET": secrets.token_hex(16),
+        "BCRYPT_ROUNDS": "4",
+        "RATE_LIMIT": "0",
+        "CAPTCHA_MODE": args.captcha_mode,
+        "LOG_FILE": os.path.join(workdir, "webapp.log"),
+        "USERNAME_FILTER_FILE": os.path.join(workdir, "usernames"),
+        "CAPTCHA_NONCE_FILE": os.path.join(workdir, "captcha-nonces"),
+        "RATE_LIMIT_FILE": os.path.join(workdir, "ratelimit"),
+        "METRICS_DIR": os.path.join(workdir, "metrics"),
+        "PROFILE_DIR": os.path.join(workdir, "profiles"),
+        "LOADTEST_CAPTCHA_ANSWER": ANSWER,
+    }
+    if args.db_host:
+        env["DB_HOST"] = args.db_host
+    else:
+        env["LOADTEST_DB"] = os.path.join(workdir, "stand-in.sqlite")
+        env["LOADTEST_DB_LATENCY_MS"] = str(args.db_latency_ms)
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    return env
+
+
+def start_inproc(env, workdir):
+    os.environ.update(env)
+    # Filesystem sessions go to ./flask_session
+    os.chdir(workdir)
+    sys.path[:0] = [APP_DIR, HERE]
+    import wsgi_loadtest
+    app = wsgi_loadtest.app
+    if "LOADTEST_DB" not in env:
+        import logging
+        import schema
+        schema.init_db(schema.connect, logging.getLogger("loadtest"))
+    return (lambda ip: InprocClient(app, ip)), (lambda: None)
+
+
+def start_gunicorn(env, workdir, port):
+    env = dict(os.environ, **env, WEB_BIND=f"127.0.0.1:{port}", MGMT_BIND=f"127.0.0.1:{port + 1}")
+    if "LOADTEST_DB" not in env:
+        subprocess.run([sys.executable, os.path.join(APP_DIR, "schema.py"), "--wait", "30"], env=env, check=True)
+    log = open(os.path.join(workdir, "gunicorn.log"), "w")
+    proc = subprocess.Popen(["gunicorn", "-c", os.path.join(APP_DIR, "gunicorn.conf.py"),
+                             "--pythonpath", f"{APP_DIR},{HERE}", "wsgi_loadtest:app"],
+                            env=env, cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 60
+    while True:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/healthz", headers={"Host": HOST})
+            conn.getresponse().read()
+            conn.close()
+            break
+        except OSError:
+            if proc.poll() is not None or time.monotonic() > deadline:
+                proc.kill()
+                raise SystemExit(f"gunicorn did not come up, see {log.name}")
+            time.sleep(0.2)
+
+    def stop():
+        proc.terminate()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        log.close()
+
+    return (lambda ip: HttpClient(port, ip)), stop
+
+
+# --- Load generation ---
+
+def client_ip(n):
+    return f"10.{100 + n // 65536 % 100}.{n // 256 % 256}.{n % 256}"
+
+
+def seed(make_user, count, concurrency):
+    users = [make_user() for _ in range(max(1, min(count, concurrency)))]
+    todo = queue.Queue()
+    for _ in range(count):
+        todo.put(None)
+
+    def worker(user):
+        while True:
+            try:
+                todo.get_nowait()
+            except queue.Empty:
+                return
+            user.signup()
+
+    threads = [threading.Thread(target=worker, args=(user,)) for user in users]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def closed_loop(make_user, mix, users, duration, rps, think):
+    names, weights = zip(*mix)
+    deadline = time.monotonic() + duration
+    # Total rate split evenly over the users
+    interval = users / rps if rps else 0.0
+
+    def worker(n):
+        rng = random.Random(n)
+        user = make_user()
+        next_start = time.monotonic() + rng.uniform(0, interval)
+        while True:
+            if interval:
+                time.sleep(max(0.0, next_start - time.monotonic()))
+                next_start += interval
+            if time.monotonic() >= deadline:
+                return
+            user.run_flow(rng.choices(names, weights)[0])
+            if think:
+                time.sleep(think)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(users)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def open_loop(make_user, mix, users, duration, rps, max_lag, recorder):
+    names, weights = zip(*mix)
+    arrivals = queue.Queue()
+    done = threading.Event()
+
+    def worker():
+        user = make_user()
+        while True:
+            try:
+                scheduled, flow = arrivals.get(timeout=0.1)
+            except queue.Empty:
+                if done.is_set():
+                    return
+                continue
+            if time.perf_counter() - scheduled > max_lag:
+                with recorder._lock:
+                    recorder.late += 1
+                continue
+            user.run_flow(flow, started=scheduled)
+
+    threads = [threading.Thread(target=worker) for _ in range(users)]
+    for t in threads:
+        t.start()
+    rng = random.Random(0)
+    start = time.perf_counter()
+    at = start
+    while at < start + duration:
+        at += rng.expovariate(rps)
+        time.sleep(max(0.0, at - time.perf_counter()))
+        arrivals.put((at, rng.choices(names, weights)[0]))
+    done.set()
+    for t in threads:
+        t.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=("inproc", "gunicorn"), default="inproc")
+    parser.add_argument("--port", type=int, default=18080, help="gunicorn target: WEB_BIND port (+1 for MGMT_BIND)")
+    parser.add_argument("--mix", default="signin=6,signup=1,dashboard=2,captcha=1")
+    parser.add_argument("--users", type=int, default=16, help="virtual users (open loop: max concurrency)")
+    parser.add_argument("--open", action="store_true", help="open loop: Poisson arrivals at --rps")
+    parser.add_argument("--rps", type=float, default=0, help="flows per second (closed loop: optional pacing)")
+    parser.add_argument("--max-lag", type=float, default=5.0, help="open loop: skip arrivals later than this")
+    parser.add_argument("--think", type=float, default=0, help="closed loop: pause between flows (seconds)")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=50, help="users created before the run")
+    parser.add_argument("--captcha-mode", choices=("session", "token"), default="session")
+    parser.add_argument("--db-host", help="real MariaDB instead of the SQLite stand-in")
+    parser.add_argument("--db-latency-ms", type=float, default=0, help="stand-in: delay per statement")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra app setting")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary directory (logs, DB)")
+    args = parser.parse_args()
+    if args.open and not args.rps:
+        parser.error("--open needs --rps")
+    mix = parse_mix(args.mix)
+
+    workdir = tempfile.mkdtemp(prefix="webapp-loadtest-")
+    cwd = os.getcwd()
+    env = app_environment(args, workdir)
+    if args.target == "inproc":
+        make_client, stop = start_inproc(env, workdir)
+    else:
+        make_client, stop = start_gunicorn(env, workdir, args.port)
+
+    run_id = secrets.token_hex(3)
+    accounts = Accounts()
+    ips = itertools.count()
+    try:
+        setup = Recorder()
+        seed(lambda: VirtualUser(make_client(client_ip(next(ips))), setup, accounts, run_id), args.seed,
+             min(args.users, 8))
+        if args.seed and not accounts.names:
+            raise SystemExit(f"seeding failed: {json.dumps(setup.summary(1.0)['routes'])}")
+        seeded = len(accounts.names)
+
+        recorder = Recorder()
+        make_user = lambda: VirtualUser(make_client(client_ip(next(ips))), recorder, accounts, run_id)  # noqa: E731
+        started = time.perf_counter()
+        if args.open:
+            open_loop(make_user, mix, args.users, args.duration, args.rps, args.max_lag, recorder)
+        else:
+            closed_loop(make_user, mix, args.users, args.duration, args.rps, args.think)
+        report = recorder.summary(time.perf_counter() - started)
+    finally:
+        stop()
+        os.chdir(cwd)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = dict({
+        "target": args.target,
+        "mode": "open" if args.open else "closed",
+        "users": args.users,
+        "target_flows_per_s": args.rps or None,
+        "mix": dict(mix),
+        "captcha_mode": args.captcha_mode,
+        "db": args.db_host or f"sqlite stand-in, {args.db_latency_ms} ms/statement",
+        "seeded_users": seeded,
+        "workdir": workdir if args.keep else None,
+    }, **report)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+pymysql stand-in backed by SQLite, for load tests without MariaDB.
+
+install(path) replaces pymysql.connect, so the webapp's pool, health probe
+and queries run unchanged against an SQLite file. The file is shared by
+all processes (WAL mode), i.e. it works for the in-process harness and for
+a local gunicorn with several workers alike.
+
+What the webapp needs, and nothing more:
+
+    - %s placeholders, DictCursor rows (dicts), fetchone/fetchall
+    - IntegrityError for duplicate usernames as pymysql.err.IntegrityError
+    - usernames compared case-insensitively (MariaDB *_general_ci)
+    - SHOW REPLICA/SLAVE STATUS: no row (not a replica)
+    - ping(), open, close()
+
+`latency` adds a fixed delay to every statement and ping, as a stand-in
+for the network round trip to the DB host.
+"""
+import os
+import re
+import sqlite3
+import time
+
+import pymysql
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT UNIQUE NOT NULL COLLATE NOCASE,
+    password_hash TEXT NOT NULL
+)
+"""
+_NO_ROWS = re.compile(r"^\s*(SHOW\s+(REPLICA|SLAVE)\s+STATUS|CREATE\s+TABLE)", re.IGNORECASE)
+
+
+class Cursor:
+    def __init__(self, conn):
+        self._conn = conn
+        self._cur = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def execute(self, query, args=None):
+        self._conn._delay()
+        if _NO_ROWS.match(query):
+            # Schema is created by install(); replication status is empty
+            self._cur = None
+            return 0
+        try:
+            self._cur = self._conn._db.execute(query.replace("%s", "?"), tuple(args or ()))
+        except sqlite3.IntegrityError as e:
+            raise pymysql.err.IntegrityError(1062, str(e))
+        except sqlite3.OperationalError as e:
+            raise pymysql.err.OperationalError(2013, str(e))
+        return self._cur.rowcount
+
+    def _row(self, row):
+        return {col[0]: value for col, value in zip(self._cur.description, row)}
+
+    def fetchone(self):
+        if self._cur is None:
+            return None
+        row = self._cur.fetchone()
+        return self._row(row) if row is not None else None
+
+    def fetchall(self):
+        if self._cur is None:
+            return []
+        return [self._row(row) for row in self._cur.fetchall()]
+
+    def close(self):
+        self._cur = None
+
+
+class Connection:
+    def __init__(self, path, latency):
+        self._latency = latency
+        # The app's pool hands a connection to one thread at a time, but not always the same one
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self.open = True
+
+    def _delay(self):
+        if self._latency:
+            time.sleep(self._latency)
+
+    def cursor(self):
+        if not self.open:
+            raise pymysql.err.InterfaceError(0, "connection closed")
+        return Cursor(self)
+
+    def ping(self, reconnect=False):
+        if not self.open:
+            raise pymysql.err.OperationalError(2006, "connection closed")
+        self._delay()
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        if self.open:
+            self.open = False
+            self._db.close()
+
+
+def install(path, latency=0.0):
+    """Creates the schema in `path` and routes pymysql.connect() there."""
+    db = sqlite3.connect(path, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute(_SCHEMA)
+    db.close()
+    pymysql.connect = lambda **kwargs: Connection(path, latency)
+
+
+def install_from_env():
+    """install() from LOADTEST_DB / LOADTEST_DB_LATENCY_MS (set by the harness for gunicorn workers)."""
+    path = os.getenv("LOADTEST_DB")
+    if path:
+        install(path, float(os.getenv("LOADTEST_DB_LATENCY_MS", "0")) / 1000)
@@ -0,0 +1,24 @@
+"""
+WSGI entry point for load tests against a local gunicorn (started by harness.py)
+or the app instances of the scale-out test bed (tests/perf/scaleout/).
+
+Installs the SQLite stand-in (LOADTEST_DB) and a fixed CAPTCHA answer
+(LOADTEST_CAPTCHA_ANSWER) before the app serves anything, then exposes
+the unmodified Flask app:
+
+    gunicorn -c <app>/gunicorn.conf.py --pythonpath <app>,tests/perf/loadtest wsgi_loadtest:app
+
+Never use this module outside of a test: every CAPTCHA has the same answer.
+"""
+import os
+
+import stand_in_db
+
+stand_in_db.install_from_env()
+
+import app as webapp  # noqa: E402
+
+ANSWER = os.environ["LOADTEST_CAPTCHA_ANSWER"]
+webapp.captcha_pool.answer_factory = lambda: ANSWER
+
+app = webapp.app
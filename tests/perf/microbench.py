@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the webapp's per-request cost units, with baseline comparison.
+
+Each benchmark measures one unit on its own:
+
+    captcha.generate_280x90           ImageCaptcha(280, 90).generate()
+    bcrypt.hashpw.cost<N>             bcrypt.hashpw at every --bcrypt-costs factor
+    bcrypt.checkpw.cost<N>            bcrypt.checkpw of a matching password
+    session.filesystem.load / .save   the app's Flask-Session filesystem interface
+                                      (--sessions live sessions on disk)
+    db.get_db_conn                    app.get_db_conn() + close against DB_HOST
+                                      (skipped if no DB answers)
+    render.<template>                 render_template for every template
+    policy.<case>                     app.password_policy_error (signup checks)
+
+Method: --warmup calls, then the number of calls per round is calibrated
+so a round takes at least --min-round seconds; --rounds rounds give one
+sample (seconds per call) each. Reported are median, mean, stdev and min.
+
+Baseline: --save-baseline FILE stores all samples together with the
+Python version and machine. With --baseline FILE every benchmark is
+compared to it: a regression is a median more than --threshold (default
+10%) slower AND a one-sided Mann-Whitney U test with p < --alpha, so
+noise alone does not fail the run. Any regression -> exit status 1.
+Baselines only make sense on the machine they were recorded on.
+
+Usage:
+    python3 tests/perf/microbench.py --save-baseline /tmp/bench-base.json
+    python3 tests/perf/microbench.py --baseline /tmp/bench-base.json --threshold 0.15
+    python3 tests/perf/microbench.py --filter 'render|policy'
+
+app.py is imported with LOG_FILE and the session directory in a temporary
+directory; DB settings come from the usual DB_* variables.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "dockerfiles", "webserver", "app"))
+
+PASSWORD = "Bench-Passw0rd-123!"
+
+
+class Skip(Exception):
+    pass
+
+
+_app_module = None
+
+
+def webapp():
+    """Imports app.py once, with its files in a temporary directory."""
+    global _app_module
+    if _app_module is None:
+        workdir = tempfile.mkdtemp(prefix="microbench-")
+        os.environ.setdefault("LOG_FILE", os.path.join(workdir, "webapp.log"))
+        os.environ.setdefault("USERNAME_FILTER_FILE", os.path.join(workdir, "usernames"))
+        os.environ.setdefault("CAPTCHA_NONCE_FILE", os.path.join(workdir, "captcha-nonces"))
+        os.environ.setdefault("RATE_LIMIT_FILE", os.path.join(workdir, "ratelimit"))
+        # SESSION_FILE_DIR is ./flask_session, relative to the working directory for the whole run
+        os.chdir(workdir)
+        sys.path.insert(0, APP_DIR)
+        import app as module
+        _app_module = module
+        _app_module.workdir = workdir
+    return _app_module
+
+
+# --- Benchmarks: each returns a zero-argument callable (one unit of work) ---
+
+def bench_captcha(args):
+    from captcha.image import ImageCaptcha
+    captcha = ImageCaptcha(width=280, height=90)
+    answers = ["A1B2C3", "D4E5F6", "0F9E8D", "7C6B5A"]
+    state = {"i": 0}
+
+    def op():
+        state["i"] += 1
+        captcha.generate(answers[state["i"] % len(answers)]).getvalue()
+    return op
+
+
+def bench_bcrypt(cost, check):
+    def setup(args):
+        import bcrypt
+        password = PASSWORD.encode("utf-8")
+        if check:
+            hashed = bcrypt.hashpw(password, bcrypt.gensalt(rounds=cost))
+            return lambda: bcrypt.checkpw(password, hashed)
+        return lambda: bcrypt.hashpw(password, bcrypt.gensalt(rounds=cost))
+    return setup
+
+
+def _session_fixture(args):
+    module = webapp()
+    app, iface = module.app, module.app.session_interface
+    sids = []
+    with app.test_request_context("/") as ctx:
+        for _ in range(args.sessions):
+            sess = iface.open_session(app, ctx.request)
+            sess["captcha_answer"] = "A1B2C3"
+            iface.save_session(app, sess, app.response_class())
+            sids.append(sess.sid)
+    return app, iface, sids
+
+
+def bench_session(save):
+    def setup(args):
+        module = webapp()
+        if module.SESSION_BACKEND != "filesystem":
+            raise Skip(f"SESSION_BACKEND={module.SESSION_BACKEND}")
+        app, iface, sids = _session_fixture(args)
+        # Signed session id as the browser sends it
+        cookie = app.config.get("SESSION_COOKIE_NAME", "session")
+        state = {"i": 0}
+
+        def request_for(sid):
+            signed = iface._get_signer(app).sign(sid).decode() if iface.use_signer else sid
+            return app.test_request_context("/", headers={"Cookie": f"{cookie}={signed}"})
+
+        contexts = [request_for(sid) for sid in sids[:256]]
+
+        def load():
+            state["i"] += 1
+            ctx = contexts[state["i"] % len(contexts)]
+            return iface.open_session(app, ctx.request)
+
+        if not save:
+            return load
+        sessions = [iface.open_session(app, ctx.request) for ctx in contexts]
+
+        def store():
+            state["i"] += 1
+            sess = sessions[state["i"] % len(sessions)]
+            sess["captcha_answer"] = "D4E5F6" if state["i"] % 2 else "A1B2C3"
+            iface.save_session(app, sess, app.response_class())
+        return store
+    return setup
+
+
+def bench_db_connect(args):
+    module = webapp()
+    try:
+        module.get_db_conn().close()
+    except Exception as e:
+        raise Skip(f"no database at {module.DB_HOST}: {e}")
+
+    def op():
+        module.get_db_conn().close()
+    return op
+
+
+def bench_render(template, context):
+    def setup(args):
+        module = webapp()
+        ctx = module.app.test_request_context("/", base_url=f"http://{module.ALLOWED_HOST}")
+        ctx.push()
+        return lambda: module.render_template(template, **context)
+    return setup
+
+
+RENDER_CONTEXT = {
+    "dashboard.html": {"user": "benchmark-user"},
+    "error_500.html": {"error_message": "An internal server error has occurred."},
+    "error_init.html": {"error_message": "Webserver currently not available"},
+    "signin.html": {"error": "Invalid login credentials."},
+    "signup.html": {"error": "Username taken."},
+}
+
+POLICY_CASES = {
+    "valid": ("benchmark-user", PASSWORD),
+    "too_short": ("benchmark-user", "Short1!"),
+    # Worst case: every check scans the whole password and the last one fails
+    "no_special": ("benchmark-user", "AbcdefghijklmnopqrstuvwxyZ0123456789" * 2),
+}
+
+
+def bench_policy(username, password):
+    def setup(args):
+        check = webapp().password_policy_error
+        return lambda: check(username, password)
+    return setup
+
+
+def benchmarks(args):
+    yield "captcha.generate_280x90", bench_captcha
+    for cost in args.bcrypt_costs:
+        yield f"bcrypt.hashpw.cost{cost}", bench_bcrypt(cost, check=False)
+        yield f"bcrypt.checkpw.cost{cost}", bench_bcrypt(cost, check=True)
+    yield "session.filesystem.load", bench_session(save=False)
+    yield "session.filesystem.save", bench_session(save=True)
+    yield "db.get_db_conn", bench_db_connect
+    for template in sorted(os.listdir(os.path.join(APP_DIR, "templates"))):
+        yield f"render.{template.rsplit('.', 1)[0]}", bench_render(template, RENDER_CONTEXT.get(template, {}))
+    for case, (username, password) in POLICY_CASES.items():
+        yield f"policy.{case}", bench_policy(username, password)
+
+
+# --- Runner ---
+
+def measure(op, warmup, rounds, min_round):
+    for _ in range(warmup):
+        op()
+    # Calls per round so one round lasts at least min_round seconds
+    calls = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(calls):
+            op()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_round:
+            break
+        calls = max(calls * 2, int(calls * min_round / max(elapsed, 1e-9) * 1.2))
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(calls):
+            op()
+        samples.append((time.perf_counter() - start) / calls)
+    return calls, samples
+
+
+def mann_whitney_greater(current, baseline):
+    """One-sided p-value for "current tends to be larger than baseline" (normal approximation, ties averaged)."""
+    combined = sorted([(v, 0) for v in current] + [(v, 1) for v in baseline])
+    ranks = [0.0] * len(combined)
+    i = 0
+    while i < len(combined):
+        j = i
+        while j + 1 < len(combined) and combined[j + 1][0] == combined[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2 + 1
+        i = j + 1
+    n1, n2 = len(current), len(baseline)
+    r1 = sum(rank for rank, (_, group) in zip(ranks, combined) if group == 0)
+    u = r1 - n1 * (n1 + 1) / 2
+    mean = n1 * n2 / 2
+    sd = math.sqrt(n1 * n2 * (n1 + n2 + 1) / 12)
+    if sd == 0:
+        return 1.0
+    z = (u - mean - 0.5) / sd
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def compare(results, baseline, threshold, alpha):
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base is None or "samples" not in result:
+            continue
+        ratio = result["median_s"] / base["median_s"]
+        p_slower = mann_whitney_greater(result["samples"], base["samples"])
+        p_faster = mann_whitney_greater(base["samples"], result["samples"])
+        if ratio > 1 + threshold and p_slower < alpha:
+            verdict = "regression"
+        elif ratio < 1 - threshold and p_faster < alpha:
+            verdict = "improvement"
+        else:
+            verdict = "unchanged"
+        result["baseline_median_s"] = base["median_s"]
+        result["change"] = round(ratio - 1, 4)
+        result["p_value"] = round(min(p_slower, p_faster), 4)
+        result["verdict"] = verdict
+
+
+def fmt(seconds):
+    for unit, factor in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= factor:
+            return f"{seconds / factor:.2f}{unit}"
+    return f"{seconds / 1e-9:.0f}ns"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", help="only benchmarks whose name matches this regex")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--min-round", type=float, default=0.05, help="seconds per round (calibrated)")
+    parser.add_argument("--bcrypt-costs", type=lambda s: [int(c) for c in s.split(",")], default=[4, 10, 12])
+    parser.add_argument("--sessions", type=int, default=1000, help="live sessions for the session benchmarks")
+    parser.add_argument("--baseline", help="compare against this baseline file")
+    parser.add_argument("--save-baseline", metavar="FILE", help="write the results as new baseline")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown of the median (0.10 = 10%%)")
+    parser.add_argument("--alpha", type=float, default=0.05, help="significance level of the comparison")
+    parser.add_argument("--json", metavar="FILE", help="write the full results as JSON")
+    args = parser.parse_args()
+
+    selected = re.compile(args.filter) if args.filter else None
+    results = {}
+    cwd = os.getcwd()
+    try:
+        for name, setup in benchmarks(args):
+            if selected and not selected.search(name):
+                continue
+            try:
+                op = setup(args)
+            except Skip as e:
+                results[name] = {"skipped": str(e)}
+                print(f"{name:34} skipped: {e}", flush=True)
+                continue
+            calls, samples = measure(op, args.warmup, args.rounds, args.min_round)
+            results[name] = {
+                "median_s": statistics.median(samples),
+                "mean_s": statistics.fmean(samples),
+                "stdev_s": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+                "min_s": min(samples),
+                "calls_per_round": calls,
+                "samples": samples,
+            }
+            print(f"{name:34} median {fmt(results[name]['median_s']):>9}  min {fmt(min(samples)):>9}  "
+                  f"stdev {results[name]['stdev_s'] / results[name]['mean_s'] * 100:5.1f}%", flush=True)
+    finally:
+        os.chdir(cwd)
+        if _app_module is not None:
+            shutil.rmtree(_app_module.workdir, ignore_errors=True)
+
+    meta = {"python": platform.python_version(), "machine": platform.machine(), "node": platform.node(),
+            "cpus": os.cpu_count(), "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        if baseline.get("meta", {}).get("node") != meta["node"]:
+            print(f"warning: baseline recorded on {baseline.get('meta', {}).get('node')}, not on this machine")
+        compare(results, baseline, args.threshold, args.alpha)
+        print()
+        for name, result in results.items():
+            if "verdict" in result:
+                print(f"{name:34} {result['change'] * 100:+7.1f}%  p={result['p_value']:.3f}  {result['verdict']}")
+                if result["verdict"] == "regression":
+                    regressions.append(name)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as fh:
+            json.dump({"meta": meta, "results": results}, fh, indent=1)
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump({"meta": meta, "threshold": args.threshold, "results": results}, fh, indent=1)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold * 100:.0f}%: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
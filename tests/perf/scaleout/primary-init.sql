@@ -0,0 +1,14 @@
+-- Runs once on the first start of db-primary. Everything the replica needs
+-- (database, application user) is written to the binlog so the replica
+-- gets it through replication.
+SET SESSION sql_log_bin = 1;
+CREATE DATABASE IF NOT EXISTS webapp;
+CREATE USER IF NOT EXISTS 'webuser'@'%' IDENTIFIED BY 'webpass';
+GRANT ALL PRIVILEGES ON webapp.* TO 'webuser'@'%';
+-- SHOW REPLICA STATUS for the lag check on the replica
+GRANT SLAVE MONITOR ON *.* TO 'webuser'@'%';
+
+-- The replication account itself stays local to the primary
+SET SESSION sql_log_bin = 0;
+CREATE USER IF NOT EXISTS 'repl'@'%' IDENTIFIED BY 'replpass';
+GRANT REPLICATION SLAVE ON *.* TO 'repl'@'%';
@@ -0,0 +1,9 @@
+-- Runs once on the first start of db-replica: replicate db-primary from the
+-- beginning of its binlog (GTID), which includes primary-init.sql.
+CHANGE MASTER TO
+    MASTER_HOST = 'db-primary',
+    MASTER_USER = 'repl',
+    MASTER_PASSWORD = 'replpass',
+    MASTER_CONNECT_RETRY = 5,
+    MASTER_USE_GTID = slave_pos;
+START SLAVE;
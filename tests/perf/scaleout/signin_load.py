@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Signin load generator for the scale-out test bed (docker-compose.yml here).
+
+The app instances run with CAPTCHA_MODE=session behind the load-test WSGI
+entry point (tests/perf/loadtest/wsgi_loadtest.py), which gives every
+CAPTCHA the fixed answer LOADTEST_CAPTCHA_ANSWER. Each attempt therefore
+fetches /captcha/image first (storing the answer in the shared Redis
+session) and then posts the form with that answer, like a browser would.
+Only the POST is timed.
+
+    --seed N      first sign up N users loadtest-0 .. loadtest-N-1
+    then          POST /signin for --duration seconds from --concurrency
+                  keep-alive clients; --unknown of the attempts use names
+                  that do not exist (username filter / dummy checkpw path)
+
+Usage:
+    python3 tests/perf/scaleout/signin_load.py --url http://127.0.0.1:8080 --seed 200
+    python3 tests/perf/scaleout/signin_load.py --url http://127.0.0.1:8081
+
+Prints one JSON line: signins/s, POST latency percentiles and outcome counts.
+"""
+import argparse
+import http.client
+import json
+import random
+import sys
+import threading
+import time
+import urllib.parse
+from http.cookies import SimpleCookie
+
+ANSWER = "ABC123"  # LOADTEST_CAPTCHA_ANSWER in docker-compose.yml
+PASSWORD = "Load-Test-Passw0rd!"
+
+
+class Client:
+    def __init__(self, url):
+        parsed = urllib.parse.urlsplit(url)
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self.conn = None
+        self.cookies = {}
+
+    def post(self, path, fields):
+        """Loads a CAPTCHA into the session, then posts the form. Returns (status, body, seconds of the POST)."""
+        self.request("GET", "/captcha/image")
+        body = urllib.parse.urlencode(dict(fields, captcha_answer=ANSWER))
+        start = time.perf_counter()
+        status, data = self.request("POST", path, body, {"Content-Type": "application/x-www-form-urlencoded"})
+        return status, data, time.perf_counter() - start
+
+    def request(self, method, path, body=None, headers=None):
+        # Host is set by the WAF/nginx in front; needed when talking to an instance directly
+        headers = dict(headers or {}, Host="web.sun.dmz")
+        if self.cookies:
+            headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            try:
+                self.conn.request(method, path, body, headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                for header in response.headers.get_all("Set-Cookie") or ():
+                    for name, morsel in SimpleCookie(header).items():
+                        self.cookies[name] = morsel.value
+                return response.status, data
+            except (http.client.HTTPException, OSError):
+                # Server closed the keep-alive connection: reconnect once
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+
+
+def seed(url, count, concurrency):
+    names = [f"loadtest-{i}" for i in range(count)]
+    created = []
+
+    def worker(chunk):
+        client = Client(url)
+        for name in chunk:
+            try:
+                status, _, _ = client.post("/signup", {"username": name, "password": PASSWORD})
+            except (http.client.HTTPException, OSError):
+                continue
+            if status == 302:
+                created.append(name)
+
+    threads = [threading.Thread(target=worker, args=(names[i::concurrency],)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return len(created)
+
+
+def run(url, users, concurrency, duration, unknown):
+    latencies, outcomes = [], {}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker(seed_value):
+        rng = random.Random(seed_value)
+        client = Client(url)
+        mine, counts = [], {}
+        while time.monotonic() < deadline:
+            if rng.random() < unknown:
+                name, expect = f"nobody-{rng.randrange(10 ** 9)}", "rejected"
+            else:
+                name, expect = f"loadtest-{rng.randrange(users)}", "ok"
+            try:
+                status, data, seconds = client.post("/signin", {"username": name, "password": PASSWORD})
+            except (http.client.HTTPException, OSError):
+                counts["error"] = counts.get("error", 0) + 1
+                continue
+            mine.append(seconds)
+            if status == 302:
+                outcome = "ok"
+            elif status == 200 and b"Invalid login" in data:
+                outcome = "rejected"
+            else:
+                outcome = f"http_{status}"
+            if outcome != expect and not outcome.startswith("http_"):
+                outcome = f"unexpected_{outcome}"
+            counts[outcome] = counts.get(outcome, 0) + 1
+        with lock:
+            latencies.extend(mine)
+            for key, value in counts.items():
+                outcomes[key] = outcomes.get(key, 0) + value
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+
+    def pct(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 1) if latencies else None
+
+    return {
+        "url": url,
+        "concurrency": concurrency,
+        "signins_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "outcomes": outcomes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--seed", type=int, default=0, metavar="N", help="sign up N users first")
+    parser.add_argument("--users", type=int, default=200, help="number of seeded users to sign in as")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--unknown", type=float, default=0.2, help="share of attempts with unknown names")
+    args = parser.parse_args()
+
+    if args.seed:
+        created = seed(args.url, args.seed, min(args.concurrency, 8))
+        print(f"seeded {created}/{args.seed} users", file=sys.stderr)
+        # Give the replica a moment before the reads start
+        time.sleep(2)
+    print(json.dumps(run(args.url, args.users, args.concurrency, args.duration, args.unknown)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+"""
+Parallel runner for the shell test suites (tests/test_*.sh and tests/Advanced verification/*.sh).
+
+    python3 tests/run_tests_parallel.py                       # all suites, 4 at a time
+    python3 tests/run_tests_parallel.py -j 2 test_waf test_ssh
+    python3 tests/run_tests_parallel.py --junit results.xml --slowest 20
+
+Suites
+    Independent suites run concurrently, at most --jobs at a time. Suites
+    that send attack traffic through the WAF share the lock "waf" and never
+    overlap, since the WAF's rate limits and bans would make them fail each
+    other (see LOCKS).
+
+Exec sessions
+    The suites call `docker exec <container> <cmd>` for every single probe.
+    The runner puts a `docker` shim first in PATH: `docker exec [-u USER]
+    CONTAINER CMD...` is handed to the runner over a Unix socket and runs in
+    a long-lived `docker exec -i CONTAINER sh` session for that container
+    (and user), so a probe is one round trip on an open pipe instead of a
+    new exec. Every other docker call, and exec with other options (-i, -t,
+    -e, -w, ...), goes to the real docker unchanged. Sessions are pooled per
+    container, so concurrent suites do not queue behind each other. stdout
+    and stderr of a command come back complete but one after the other
+    (not interleaved). The shim itself is exec_shim.py. --no-exec-sessions
+    runs the plain docker commands.
+
+Results
+    Each check line a suite prints (ERFOLG/FEHLER, SUCCESS/FAILED,
+    BLOCKED/VULNERABLE, [PASS]/[FAIL]/[WARN]/[BLOCKED]/[SKIP]) becomes a test
+    case; its duration is the time since the previous check of the same
+    suite. A suite that exits non-zero without a failed check gets a failed
+    test case for its exit status. --junit writes JUnit XML, the summary
+    lists the slowest suites and checks.
+"""
+import argparse
+import json
+import os
+import queue
+import re
+import secrets
+import shlex
+import shutil
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+REQUIRED_CONTAINER = "clab-security_lab-attacker_1"
+
+# Suites that must not run at the same time (lock name -> suite names)
+LOCKS = {
+    "waf": {"test_waf", "test_web", "test_security_comprehensive"},
+}
+
+GREEN = "\033[0;32m"
+RED = "\033[0;31m"
+BLUE = "\033[0;34m"
+NC = "\033[0m"
+
+ANSI = re.compile(r"\x1b\[[0-9;]*m")
+# "Test 1.1: ... ERFOLG: ..." / "Testing ...: SUCCESS" (Ergebnis direkt nach dem echo -n des Tests)
+RESULT_WORD = re.compile(r"^(?P<name>.*?(?:\.\.\.|:))\s*(?P<status>ERFOLG|FEHLER|SUCCESS|FAILED|VULNERABLE|BLOCKED)\b(?P<detail>.*)$")
+# "  description   [PASS] ..." / "  [FAIL] description"
+RESULT_TAG = re.compile(r"^\s*(?P<name>.*?)\s*\[(?P<status>PASS|FAIL|WARN|BLOCKED|SKIP)\]\s*(?P<detail>.*)$")
+FAILED = {"FEHLER", "FAILED", "VULNERABLE", "FAIL"}
+
+# `docker` im PATH der Suites (siehe exec_shim.py)
+SHIM = """#!/bin/sh
+exec {python} -S {shim} "$@"
+"""
+
+
+# --- Exec sessions (runner side) ---
+
+class SessionUnavailable(Exception):
+    pass
+
+
+class ExecSession:
+    """One `docker exec -i CONTAINER sh`; runs one command at a time."""
+
+    def __init__(self, docker, container, user, timeout):
+        self.timeout = timeout
+        self.marker = "__EXEC_DONE_" + secrets.token_hex(8)
+        cmd = [docker, "exec", "-i"] + (["-u", user] if user else []) + [container, "sh"]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     stderr=subprocess.DEVNULL)
+        result = self.run(["true"], timeout=15)
+        if result is None or result[0] != 0:
+            self.close()
+            raise SessionUnavailable(f"no shell session in {container}")
+
+    def run(self, argv, timeout=None):
+        """(rc, stdout, stderr), or None if the session died."""
+        script = (f'o=$(mktemp) && e=$(mktemp) || exit 1; (exec {shlex.join(argv)}) </dev/null >"$o" 2>"$e"; '
+                  f'rc=$?; echo "{self.marker} $rc $(wc -c <"$o") $(wc -c <"$e")"; cat "$o" "$e"; rm -f "$o" "$e"\n')
+        timer = threading.Timer(timeout or self.timeout, self.proc.kill)
+        timer.start()
+        try:
+            self.proc.stdin.write(script.encode())
+            self.proc.stdin.flush()
+            while True:
+                line = self.proc.stdout.readline()
+                if not line:
+                    return None
+                if line.startswith(self.marker.encode()):
+                    break
+            rc, out_len, err_len = (int(v) for v in line.split()[1:4])
+            return rc, self.proc.stdout.read(out_len), self.proc.stdout.read(err_len)
+        except (OSError, ValueError):
+            return None
+        finally:
+            timer.cancel()
+
+    @property
+    def alive(self):
+        return self.proc.poll() is None
+
+    def close(self):
+        if self.alive:
+            self.proc.kill()
+        self.proc.wait()
+
+
+class SessionPool:
+    """Idle sessions per (container, user); at most `per_container` per key."""
+
+    def __init__(self, docker, per_container, timeout):
+        self.docker = docker
+        self.per_container = per_container
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._idle = {}
+        self._count = {}
+        self._unavailable = set()
+        self.calls = 0
+        self.fallbacks = 0
+        self.sessions_started = 0
+
+    def acquire(self, key):
+        with self._cond:
+            while True:
+                if key in self._unavailable:
+                    raise SessionUnavailable(key[0])
+                idle = self._idle.setdefault(key, [])
+                if idle:
+                    return idle.pop()
+                if self._count.get(key, 0) < self.per_container:
+                    self._count[key] = self._count.get(key, 0) + 1
+                    break
+                self._cond.wait()
+        try:
+            session = ExecSession(self.docker, key[0], key[1], self.timeout)
+        except Exception:
+            with self._cond:
+                self._count[key] -= 1
+                self._unavailable.add(key)
+                self._cond.notify_all()
+            raise SessionUnavailable(key[0])
+        with self._cond:
+            self.sessions_started += 1
+        return session
+
+    def release(self, key, session):
+        with self._cond:
+            if session.alive:
+                self._idle[key].append(session)
+            else:
+                session.close()
+                self._count[key] -= 1
+            self._cond.notify_all()
+
+    def run(self, container, user, argv):
+        key = (container, user)
+        try:
+            session = self.acquire(key)
+        except SessionUnavailable:
+            with self._cond:
+                self.fallbacks += 1
+            return None
+        try:
+            result = session.run(argv)
+        finally:
+            self.release(key, session)
+        with self._cond:
+            self.calls += 1
+        if result is None:
+            return 125, b"", f"exec session to {container} lost or timed out after {self.timeout:.0f}s\n".encode()
+        return result
+
+    def close(self):
+        with self._cond:
+            for sessions in self._idle.values():
+                for session in sessions:
+                    session.close()
+            self._idle.clear()
+
+
+class ExecHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request = json.loads(self.rfile.readline())
+        result = self.server.pool.run(request["container"], request["user"], request["argv"])
+        if result is None:
+            self.wfile.write(b'{"fallback": true}\n')
+            return
+        rc, out, err = result
+        self.wfile.write(json.dumps({"rc": rc, "stdout": len(out), "stderr": len(err)}).encode() + b"\n")
+        self.wfile.write(out)
+        self.wfile.write(err)
+
+
+class ExecServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+# --- Suites ---
+
+class Check:
+    def __init__(self, name, status, detail, duration):
+        self.name = name
+        self.status = status
+        self.detail = detail
+        self.duration = duration
+
+    @property
+    def failed(self):
+        return self.status in FAILED
+
+    @property
+    def skipped(self):
+        return self.status == "SKIP"
+
+
+class Suite:
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        self.locks = {lock for lock, members in LOCKS.items() if self.name in members}
+        self.checks = []
+        self.output = []
+        self.rc = None
+        self.duration = 0.0
+
+    def parse(self, line, since):
+        text = ANSI.sub("", line).rstrip()
+        match = RESULT_WORD.match(text) or RESULT_TAG.match(text)
+        if not match:
+            return False
+        name = match["name"].strip().rstrip(".:").strip()
+        detail = match["detail"].strip(" :-")
+        if not name:
+            # "[PASS] description - Details"
+            name, detail = detail.split(" - ", 1)[0], detail
+        self.checks.append(Check(name or f"check {len(self.checks) + 1}", match["status"], detail, since))
+        return True
+
+    def run(self, env):
+        start = last = time.monotonic()
+        proc = subprocess.Popen(["bash", self.path], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                stdin=subprocess.DEVNULL, env=env, cwd=os.path.dirname(self.path))
+        for raw in proc.stdout:
+            line = raw.decode("utf-8", "replace")
+            self.output.append(line)
+            now = time.monotonic()
+            if self.parse(line, now - last):
+                last = now
+        self.rc = proc.wait()
+        self.duration = time.monotonic() - start
+        if self.rc != 0 and not any(check.failed for check in self.checks):
+            self.checks.append(Check(f"{self.name} exit status", "FAILED", f"exit status {self.rc}",
+                                     time.monotonic() - last))
+
+    @property
+    def failed(self):
+        return self.rc != 0 or any(check.failed for check in self.checks)
+
+
+def discover(names):
+    paths = sorted(os.path.join(TEST_DIR, f) for f in os.listdir(TEST_DIR) if re.match(r"test_.*\.sh$", f))
+    advanced = os.path.join(TEST_DIR, "Advanced verification")
+    if os.path.isdir(advanced):
+        paths += sorted(os.path.join(advanced, f) for f in os.listdir(advanced) if f.endswith(".sh"))
+    suites = [Suite(p) for p in paths]
+    if names:
+        wanted = {os.path.splitext(os.path.basename(n))[0] for n in names}
+        unknown = wanted - {s.name for s in suites}
+        if unknown:
+            sys.exit(f"Unbekannte Suite(s): {', '.join(sorted(unknown))}")
+        suites = [s for s in suites if s.name in wanted]
+    return suites
+
+
+def run_suites(suites, jobs, env):
+    """Runs the suites with at most `jobs` at once and without two holders of the same lock."""
+    pending = list(suites)
+    running = set()
+    held = set()
+    done = queue.Queue()
+    print_lock = threading.Lock()
+
+    def worker(suite):
+        try:
+            suite.run(env)
+        finally:
+            done.put(suite)
+
+    def report(suite):
+        with print_lock:
+            color = RED if suite.failed else GREEN
+            status = "FEHLGESCHLAGEN" if suite.failed else "ERFOLGREICH"
+            print(f"{BLUE}=== {suite.name} ({suite.duration:.1f}s) ==={NC}")
+            sys.stdout.write("".join(suite.output))
+            print(f"{color}Status {suite.name}: {status}{NC}")
+            print("----------------------------------------", flush=True)
+
+    while pending or running:
+        for suite in list(pending):
+            if len(running) >= jobs:
+                break
+            if suite.locks & held:
+                continue
+            pending.remove(suite)
+            running.add(suite)
+            held |= suite.locks
+            threading.Thread(target=worker, args=(suite,), name=suite.name, daemon=True).start()
+        finished = done.get()
+        running.discard(finished)
+        held -= finished.locks
+        report(finished)
+
+
+def write_junit(suites, path):
+    root = ET.Element("testsuites", tests=str(sum(len(s.checks) for s in suites)),
+                      failures=str(sum(1 for s in suites for c in s.checks if c.failed)),
+                      time=f"{sum(s.duration for s in suites):.3f}")
+    for suite in suites:
+        element = ET.SubElement(root, "testsuite", name=suite.name, tests=str(len(suite.checks)),
+                                failures=str(sum(1 for c in suite.checks if c.failed)),
+                                skipped=str(sum(1 for c in suite.checks if c.skipped)),
+                                time=f"{suite.duration:.3f}")
+        for check in suite.checks:
+            case = ET.SubElement(element, "testcase", classname=suite.name, name=check.name,
+                                 time=f"{check.duration:.3f}")
+            if check.failed:
+                ET.SubElement(case, "failure", message=f"{check.status} {check.detail}".strip())
+            elif check.skipped:
+                ET.SubElement(case, "skipped", message=check.detail)
+        ET.SubElement(element, "system-out").text = ANSI.sub("", "".join(suite.output))
+    ET.indent(root)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    ET.ElementTree(root).write(path, encoding="utf-8", xml_declaration=True)
+
+
+def print_slowest(suites, count):
+    print(f"{BLUE}=== Langsamste Suites ==={NC}")
+    for suite in sorted(suites, key=lambda s: -s.duration):
+        print(f"{suite.duration:8.1f}s  {suite.name} ({len(suite.checks)} Checks)")
+    print(f"{BLUE}=== Langsamste Checks ==={NC}")
+    checks = sorted(((c, s) for s in suites for c in s.checks), key=lambda item: -item[0].duration)
+    for check, suite in checks[:count]:
+        print(f"{check.duration:8.2f}s  {suite.name}: {check.name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("suites", nargs="*", help="suite names (default: all), e.g. test_waf")
+    parser.add_argument("-j", "--jobs", type=int, default=4, help="suites running at the same time")
+    parser.add_argument("--junit", metavar="FILE", help="write JUnit XML")
+    parser.add_argument("--slowest", type=int, default=10, help="number of slowest checks to list")
+    parser.add_argument("--no-exec-sessions", action="store_true", help="one docker exec per probe (no shim)")
+    parser.add_argument("--sessions-per-container", type=int, default=4)
+    parser.add_argument("--exec-timeout", type=float, default=300, help="seconds per command in a session")
+    parser.add_argument("--skip-lab-check", action="store_true", help=f"do not require {REQUIRED_CONTAINER}")
+    args = parser.parse_args()
+
+    suites = discover(args.suites)
+    docker = shutil.which("docker")
+    if docker is None:
+        sys.exit("docker nicht gefunden.")
+    if not args.skip_lab_check:
+        names = subprocess.run([docker, "ps", "-f", f"name={REQUIRED_CONTAINER}", "--format", "{{.Names}}"],
+                               capture_output=True, text=True).stdout
+        if REQUIRED_CONTAINER not in names:
+            sys.exit(f"{RED}FEHLER{NC}: Das Containerlab scheint nicht zu laufen ({REQUIRED_CONTAINER} fehlt).")
+
+    env = dict(os.environ)
+    workdir = tempfile.mkdtemp(prefix="shell-tests-")
+    server = pool = None
+    if not args.no_exec_sessions:
+        pool = SessionPool(docker, args.sessions_per_container, args.exec_timeout)
+        socket_path = os.path.join(workdir, "exec.sock")
+        server = ExecServer(socket_path, ExecHandler)
+        server.pool = pool
+        threading.Thread(target=server.serve_forever, name="exec-server", daemon=True).start()
+        shim = os.path.join(workdir, "docker")
+        with open(shim, "w") as fh:
+            fh.write(SHIM.format(python=shlex.quote(sys.executable), shim=shlex.quote(os.path.join(TEST_DIR, "exec_shim.py"))))
+        os.chmod(shim, 0o755)
+        env.update(PATH=f"{workdir}{os.pathsep}{env.get('PATH', '')}", TEST_EXEC_SOCKET=socket_path,
+                   TEST_REAL_DOCKER=docker)
+
+    print(f"{BLUE}=== Starte {len(suites)} Suite(s), {args.jobs} parallel ==={NC}", flush=True)
+    start = time.monotonic()
+    try:
+        run_suites(suites, max(args.jobs, 1), env)
+    finally:
+        if server is not None:
+            server.shutdown()
+            pool.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+    elapsed = time.monotonic() - start
+
+    print_slowest(suites, args.slowest)
+    if pool is not None:
+        print(f"Exec-Sessions: {pool.calls} Aufrufe in {pool.sessions_started} Session(s), "
+              f"{pool.fallbacks} direkt über docker exec")
+    if args.junit:
+        write_junit(suites, args.junit)
+        print(f"JUnit-XML: {args.junit}")
+
+    failed = [s.name for s in suites if s.failed]
+    checks = sum(len(s.checks) for s in suites)
+    if failed:
+        print(f"{RED}=== {len(failed)} von {len(suites)} Suite(s) fehlgeschlagen ({', '.join(failed)}), "
+              f"{checks} Checks in {elapsed:.1f}s ==={NC}")
+        sys.exit(1)
+    print(f"{GREEN}=== Alle {len(suites)} Suites erfolgreich, {checks} Checks in {elapsed:.1f}s ==={NC}")
+
+
+if __name__ == "__main__":
+    main()
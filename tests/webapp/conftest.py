@@ -0,0 +1,209 @@
+"""
+In-process tests for the webapp (Flask test client, no containers).
+
+    python3 -m pytest tests/webapp
+    python3 -m pytest tests/webapp --timings-baseline timings.json
+
+The app is imported once per run with:
+
+    - the SQLite stand-in for pymysql from tests/perf/loadtest (stand_in_db.py),
+      emptied before every test
+    - a fixed CAPTCHA answer (ANSWER), rendered inline instead of from the pool
+    - server-side sessions in memory, bcrypt cost 4, no rate limit
+    - log file, CAPTCHA nonces and username filter in a temporary directory
+
+Timings: the duration of every test and of every request (by route) is
+recorded. The terminal summary lists the slowest tests and the request
+medians per route.
+
+    --timings-json FILE        write the timings as JSON
+    --timings-baseline FILE    compare against an earlier --timings-json
+    --timings-threshold 0.5    report tests more than 50% slower than the baseline
+    --timings-strict           ... and let the run fail because of them
+"""
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.abspath(os.path.join(HERE, "..", "..", "dockerfiles", "webserver", "app"))
+LOADTEST_DIR = os.path.abspath(os.path.join(HERE, "..", "perf", "loadtest"))
+
+ANSWER = "TEST42"
+HOST = "web.sun.dmz"
+CLIENT_IP = "10.10.10.99"
+PASSWORD = "Correct-Horse-42!"
+
+# Absolute floor for --timings-baseline, below this a slowdown is noise
+MIN_REGRESSION_S = 0.005
+
+_workdir = tempfile.mkdtemp(prefix="webapp-tests-")
+_db_path = os.path.join(_workdir, "users.db")
+for _name, _value in {
+    "LOG_FILE": os.path.join(_workdir, "webapp.log"),
+    "LOG_ASYNC": "0",
+    "SESSION_BACKEND": "memory",
+    "CAPTCHA_POOL_SIZE": "0",
+    "CAPTCHA_NONCE_FILE": os.path.join(_workdir, "captcha-nonces"),
+    "USERNAME_FILTER_FILE": os.path.join(_workdir, "usernames"),
+    "USERNAME_FILTER_SYNC": "0.2",
+    "RATE_LIMIT": "0",
+    "PAGE_CACHE": "1",
+    "BCRYPT_ROUNDS": "4",
+    "DB_HEALTH_INTERVAL": "0.5",
+}.items():
+    os.environ.setdefault(_name, _value)
+
+sys.path[:0] = [APP_DIR, LOADTEST_DIR]
+import stand_in_db  # noqa: E402
+
+stand_in_db.install(_db_path)
+
+import app as webapp  # noqa: E402
+
+webapp.captcha_pool.answer_factory = lambda: ANSWER
+
+
+# --- Fixtures ---
+
+@pytest.fixture
+def app():
+    db = sqlite3.connect(_db_path, isolation_level=None)
+    db.execute("DELETE FROM users")
+    db.close()
+    return webapp.app
+
+
+@pytest.fixture
+def client(app):
+    """Test client that talks to the app like the WAF does (Host header, X-Real-IP)."""
+    client = app.test_client()
+    client.environ_base["HTTP_X_REAL_IP"] = CLIENT_IP
+    return client
+
+
+@pytest.fixture(params=["session", "token"])
+def captcha_mode(request, monkeypatch):
+    """Runs a test with the CAPTCHA answer in the session and as signed token cookie."""
+    monkeypatch.setattr(webapp, "CAPTCHA_MODE", request.param)
+    return request.param
+
+
+def get(client, path, **kwargs):
+    kwargs.setdefault("base_url", f"http://{HOST}")
+    return client.get(path, **kwargs)
+
+
+def post(client, path, data, **kwargs):
+    kwargs.setdefault("base_url", f"http://{HOST}")
+    return client.post(path, data=data, **kwargs)
+
+
+def load_captcha(client):
+    resp = get(client, "/captcha/image")
+    assert resp.status_code == 200
+    assert resp.mimetype == "image/png"
+    return resp
+
+
+def signup(client, username, password=PASSWORD, answer=ANSWER):
+    load_captcha(client)
+    return post(client, "/signup", {"username": username, "password": password, "captcha_answer": answer})
+
+
+def signin(client, username, password=PASSWORD, answer=ANSWER):
+    load_captcha(client)
+    return post(client, "/signin", {"username": username, "password": password, "captcha_answer": answer})
+
+
+# --- Timings ---
+
+def pytest_addoption(parser):
+    group = parser.getgroup("timings", "webapp request timings")
+    group.addoption("--timings-json", metavar="FILE", help="write per-test and per-route timings as JSON")
+    group.addoption("--timings-baseline", metavar="FILE", help="compare test durations against an earlier --timings-json")
+    group.addoption("--timings-threshold", type=float, default=0.5, help="allowed slowdown vs. the baseline (0.5 = 50%%)")
+    group.addoption("--timings-strict", action="store_true", help="fail the run if a test is slower than allowed")
+
+
+class Timings:
+    def __init__(self):
+        self.tests = {}
+        self.routes = {}
+        self.regressions = []
+
+    def request_started(self, sender, **extra):
+        webapp.g.timings_start = time.perf_counter()
+
+    def request_finished(self, sender, response, **extra):
+        start = webapp.g.pop("timings_start", None)
+        if start is not None:
+            rule = webapp.request.url_rule
+            route = f"{webapp.request.method} {rule.rule if rule is not None else 'unmatched'}"
+            self.routes.setdefault(route, []).append(time.perf_counter() - start)
+
+    def compare(self, baseline, threshold):
+        for name, duration in self.tests.items():
+            before = baseline.get("tests", {}).get(name)
+            if before and duration > before * (1 + threshold) and duration - before > MIN_REGRESSION_S:
+                self.regressions.append((name, before, duration))
+
+    def as_dict(self):
+        return {
+            "tests": self.tests,
+            "routes": {route: {"count": len(samples), "median_s": statistics.median(samples), "max_s": max(samples)}
+                       for route, samples in sorted(self.routes.items())},
+        }
+
+
+_timings = Timings()
+
+
+def pytest_configure(config):
+    # Signals are sent for every request of the test client
+    from flask import request_finished, request_started
+    request_started.connect(_timings.request_started, webapp.app)
+    request_finished.connect(_timings.request_finished, webapp.app)
+
+
+def pytest_runtest_logreport(report):
+    if report.when == "call":
+        # file::test, independent of the rootdir pytest picked for this run
+        _timings.tests[report.nodeid.rsplit("/", 1)[-1]] = round(report.duration, 6)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    config = session.config
+    if config.getoption("timings_baseline"):
+        with open(config.getoption("timings_baseline")) as fh:
+            _timings.compare(json.load(fh), config.getoption("timings_threshold"))
+        if _timings.regressions and config.getoption("timings_strict") and exitstatus == 0:
+            session.exitstatus = 1
+    if config.getoption("timings_json"):
+        with open(config.getoption("timings_json"), "w") as fh:
+            json.dump(_timings.as_dict(), fh, indent=1)
+    shutil.rmtree(_workdir, ignore_errors=True)
+
+
+def pytest_terminal_summary(terminalreporter, exitstatus, config):
+    write = terminalreporter.write_line
+    terminalreporter.section("webapp timings")
+    for name, duration in sorted(_timings.tests.items(), key=lambda item: -item[1])[:10]:
+        write(f"{duration * 1000:9.1f}ms  {name}")
+    write("")
+    for route, stats in _timings.as_dict()["routes"].items():
+        write(f"{stats['median_s'] * 1000:9.2f}ms median  {stats['max_s'] * 1000:9.2f}ms max  "
+              f"{stats['count']:4d}x  {route}")
+    if _timings.regressions:
+        write("")
+        threshold = config.getoption("timings_threshold")
+        write(f"{len(_timings.regressions)} test(s) more than {threshold * 100:.0f}% slower than the baseline:", red=True)
+        for name, before, after in _timings.regressions:
+            write(f"  {name}: {before * 1000:.1f}ms -> {after * 1000:.1f}ms", red=True)
@@ -0,0 +1,82 @@
+import pytest
+
+from conftest import ANSWER, HOST, PASSWORD, load_captcha, post, signup
+
+import app as webapp
+
+EXPIRED = b"Session expired. Please reload the captcha."
+WRONG = b"Incorrect security code."
+
+
+def signup_form(username, answer=ANSWER):
+    return {"username": username, "password": PASSWORD, "captcha_answer": answer}
+
+
+def test_image_is_png(client, captcha_mode):
+    resp = load_captcha(client)
+    assert resp.data.startswith(b"\x89PNG")
+    assert ANSWER.encode() not in resp.data
+
+
+def test_image_is_not_cached(client, captcha_mode):
+    assert "no-store" in load_captcha(client).headers["Cache-Control"]
+
+
+def test_correct_answer_is_accepted(client, captcha_mode):
+    resp = signup(client, "alice")
+    assert resp.status_code == 302
+    assert resp.headers["Location"].endswith("/signin")
+
+
+def test_answer_is_case_insensitive(client, captcha_mode):
+    assert signup(client, "alice", answer=ANSWER.lower()).status_code == 302
+
+
+def test_answer_without_image_is_rejected(client, captcha_mode):
+    resp = post(client, "/signup", signup_form("alice"))
+    assert resp.status_code == 200
+    assert EXPIRED in resp.data
+
+
+def test_answer_cannot_be_replayed(client, captcha_mode):
+    assert signup(client, "alice").status_code == 302
+    resp = post(client, "/signup", signup_form("bob"))
+    assert EXPIRED in resp.data
+
+
+def test_wrong_answer_consumes_captcha(client, captcha_mode):
+    load_captcha(client)
+    assert WRONG in post(client, "/signup", signup_form("alice", answer="000000")).data
+    # Kein zweiter Versuch gegen dasselbe Bild
+    assert EXPIRED in post(client, "/signup", signup_form("alice")).data
+
+
+def test_signin_consumes_captcha(client, captcha_mode):
+    load_captcha(client)
+    post(client, "/signin", {"username": "alice", "password": PASSWORD, "captcha_answer": ANSWER})
+    resp = post(client, "/signin", {"username": "alice", "password": PASSWORD, "captcha_answer": ANSWER})
+    assert EXPIRED in resp.data
+
+
+def test_answer_is_not_in_session_cookie(client):
+    load_captcha(client)
+    cookie = client.get_cookie("session", domain=HOST)
+    assert cookie is not None
+    assert ANSWER not in cookie.value
+
+
+@pytest.mark.parametrize("captcha_mode", ["token"], indirect=True)
+def test_token_cannot_be_replayed_from_another_client(app, client, captcha_mode):
+    load_captcha(client)
+    token = client.get_cookie(webapp.CAPTCHA_TOKEN_COOKIE, domain=HOST).value
+    assert post(client, "/signup", signup_form("alice")).status_code == 302
+
+    attacker = app.test_client()
+    attacker.set_cookie(webapp.CAPTCHA_TOKEN_COOKIE, token, domain=HOST)
+    assert EXPIRED in post(attacker, "/signup", signup_form("mallory")).data
+
+
+@pytest.mark.parametrize("captcha_mode", ["token"], indirect=True)
+def test_token_is_cleared_after_use(client, captcha_mode):
+    signup(client, "alice")
+    assert client.get_cookie(webapp.CAPTCHA_TOKEN_COOKIE, domain=HOST) is None
@@ -0,0 +1,33 @@
+from conftest import get, webapp
+from db_health import HALF_OPEN, OPEN, CircuitBreaker
+
+
+def half_open_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    return breaker
+
+
+def test_release_frees_half_open_slot():
+    breaker = half_open_breaker()
+    assert breaker.allow_request()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow_request()
+    breaker.release()
+    assert breaker.allow_request()
+
+
+def test_pool_exhausted_does_not_block_half_open_breaker(client, monkeypatch):
+    breaker = half_open_breaker()
+    monkeypatch.setattr(webapp, "db_breaker", breaker)
+
+    def exhausted(read=False):
+        raise webapp.PoolExhausted("test")
+    monkeypatch.setattr(webapp, "get_request_conn", exhausted)
+    assert get(client, "/signin").status_code == 429
+    assert get(client, "/signin").status_code == 429
+    monkeypatch.undo()
+    monkeypatch.setattr(webapp, "db_breaker", breaker)
+    assert get(client, "/signin").status_code == 200
+    assert breaker.state == "closed"
@@ -0,0 +1,35 @@
+import pytest
+
+from conftest import get
+
+
+def test_allowed_host_is_served(client):
+    assert get(client, "/").status_code == 200
+
+
+def test_allowed_host_with_port_is_served(client):
+    assert get(client, "/", base_url="http://web.sun.dmz:8080").status_code == 200
+
+
+@pytest.mark.parametrize("host", ["10.10.10.3", "evil.example", "web.sun.dmz.evil.example", "sun.dmz"])
+def test_foreign_host_is_rejected(client, host):
+    assert get(client, "/", base_url=f"http://{host}").status_code == 403
+    assert get(client, "/signin", base_url=f"http://{host}").status_code == 403
+
+
+def test_management_endpoint_by_ip_from_management_network(client):
+    # 127.0.0.1 (Test-Client) liegt in MGMT_NETWORKS
+    resp = get(client, "/internal/stats", base_url="http://10.10.60.2:8081")
+    assert resp.status_code == 200
+    assert "db_pool" in resp.get_json()
+
+
+def test_management_endpoint_hidden_from_other_networks(client):
+    resp = get(client, "/internal/stats", environ_overrides={"REMOTE_ADDR": "10.10.30.5"})
+    assert resp.status_code == 404
+
+
+def test_management_endpoint_still_checks_host_from_other_networks(client):
+    resp = get(client, "/internal/stats", base_url="http://10.10.60.2:8081",
+               environ_overrides={"REMOTE_ADDR": "10.10.30.5"})
+    assert resp.status_code == 403
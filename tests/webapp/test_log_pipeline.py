@@ -0,0 +1,45 @@
+import logging
+import threading
+import time
+
+from log_pipeline import BatchingFileHandler
+
+
+class SlowStream:
+    """Log file stand-in whose write() blocks until released."""
+
+    def __init__(self):
+        self.writing = threading.Event()
+        self.unblock = threading.Event()
+        self.lines = []
+
+    def write(self, data):
+        self.writing.set()
+        self.unblock.wait(5)
+        self.lines.append(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_logging_does_not_wait_for_blocked_writer(tmp_path):
+    handler = BatchingFileHandler(str(tmp_path / "webapp.log"), flush_interval=0.01)
+    stream = handler._stream = SlowStream()
+    logger = logging.getLogger("test_log_pipeline")
+    logger.propagate = False
+    logger.addHandler(handler)
+    try:
+        logger.warning("first")
+        assert stream.writing.wait(5)
+        # The writer thread is now stuck in the file write
+        start = time.perf_counter()
+        logger.warning("second")
+        assert time.perf_counter() - start < 0.1
+    finally:
+        stream.unblock.set()
+        logger.removeHandler(handler)
+        handler.close()
+    assert "".join(stream.lines).splitlines() == ["first", "second"]
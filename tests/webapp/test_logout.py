@@ -0,0 +1,38 @@
+from conftest import ANSWER, HOST, PASSWORD, get, load_captcha, post, signin, signup
+
+
+def test_logout_ends_session(client):
+    signup(client, "alice")
+    signin(client, "alice")
+    assert get(client, "/dashboard").status_code == 200
+
+    resp = get(client, "/logout")
+    assert resp.status_code == 302
+    assert resp.headers["Location"].endswith("/")
+    assert get(client, "/dashboard").headers["Location"].endswith("/signin")
+
+
+def test_old_session_cookie_is_useless_after_logout(app, client):
+    signup(client, "alice")
+    signin(client, "alice")
+    cookie = client.get_cookie("session", domain=HOST).value
+    get(client, "/logout")
+
+    replay = app.test_client()
+    replay.set_cookie("session", cookie, domain=HOST)
+    resp = get(replay, "/dashboard")
+    assert resp.status_code == 302
+    assert resp.headers["Location"].endswith("/signin")
+
+
+def test_anonymous_logout(client):
+    resp = get(client, "/logout")
+    assert resp.status_code == 302
+    assert resp.headers["Location"].endswith("/")
+
+
+def test_logout_discards_pending_captcha(client):
+    load_captcha(client)
+    get(client, "/logout")
+    resp = post(client, "/signup", {"username": "alice", "password": PASSWORD, "captcha_answer": ANSWER})
+    assert b"Session expired" in resp.data
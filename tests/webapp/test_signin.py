@@ -0,0 +1,91 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+from db_pool import ConnectionPool
+
+from conftest import get, signin, signup, webapp
+
+INVALID = b"Invalid login credentials."
+
+
+@pytest.fixture
+def alice(client):
+    assert signup(client, "alice").status_code == 302
+    return "alice"
+
+
+def test_form_is_served(client):
+    assert get(client, "/signin").status_code == 200
+
+
+def test_signin_opens_dashboard(client, alice):
+    resp = signin(client, alice)
+    assert resp.status_code == 302
+    assert resp.headers["Location"].endswith("/dashboard")
+    resp = get(client, "/dashboard")
+    assert resp.status_code == 200
+    assert b"alice" in resp.data
+
+
+def test_index_redirects_signed_in_user(client, alice):
+    signin(client, alice)
+    resp = get(client, "/")
+    assert resp.status_code == 302
+    assert resp.headers["Location"].endswith("/dashboard")
+
+
+def test_wrong_password(client, alice):
+    resp = signin(client, alice, password="Wrong-Horse-42!")
+    assert resp.status_code == 200
+    assert INVALID in resp.data
+    assert get(client, "/dashboard").status_code == 302
+
+
+def test_unknown_user_gets_same_answer(client):
+    resp = signin(client, "nobody")
+    assert resp.status_code == 200
+    assert INVALID in resp.data
+
+
+@pytest.mark.parametrize("username, password", [("", "Correct-Horse-42!"), ("alice", ""), ("   ", "x")])
+def test_missing_fields(client, username, password):
+    resp = signin(client, username, password=password)
+    assert b"You have to provide a Username and Password" in resp.data
+
+
+def test_dashboard_requires_signin(client):
+    resp = get(client, "/dashboard")
+    assert resp.status_code == 302
+    assert resp.headers["Location"].endswith("/signin")
+
+
+def test_filter_miss_checks_primary_with_several_nodes(client, alice, monkeypatch):
+    # Another node registered the name and this node's filter has not synced yet
+    monkeypatch.setattr(webapp, "USERNAME_FILTER_AUTHORITATIVE", False)
+    monkeypatch.setattr(webapp, "username_may_exist", lambda username: False)
+    resp = signin(client, alice)
+    assert resp.status_code == 302
+    assert resp.headers["Location"].endswith("/dashboard")
+
+
+def test_signin_reads_from_replica_only(client, alice, monkeypatch):
+    replica = ConnectionPool(webapp.get_db_conn, max_size=2)
+    primary = webapp.get_db_pool()
+    checkouts = []
+    acquire = primary.acquire
+    monkeypatch.setattr(webapp, "DB_REPLICA_HOSTS", ["replica"])
+    monkeypatch.setattr(webapp, "USERNAME_FILTER_AUTHORITATIVE", False)
+    monkeypatch.setattr(webapp, "_read_router", SimpleNamespace(read_pool=lambda: ("replica", replica)))
+    # Only the request's own checkouts; the health prober uses the primary pool from its thread
+    request_thread = threading.current_thread()
+
+    def counting_acquire():
+        if threading.current_thread() is request_thread:
+            checkouts.append(1)
+        return acquire()
+    monkeypatch.setattr(primary, "acquire", counting_acquire)
+    resp = signin(client, alice)
+    assert resp.status_code == 302
+    assert checkouts == []
+    assert replica.stats()["connects"] == 1
@@ -0,0 +1,60 @@
+import sqlite3
+
+import pytest
+
+from conftest import _db_path, get, signup
+
+
+def stored_hash(username):
+    db = sqlite3.connect(_db_path)
+    try:
+        row = db.execute("SELECT password_hash FROM users WHERE username=?", (username,)).fetchone()
+    finally:
+        db.close()
+    return row[0] if row else None
+
+
+def test_form_is_served(client):
+    resp = get(client, "/signup")
+    assert resp.status_code == 200
+    assert b"captcha" in resp.data
+
+
+def test_signup_stores_bcrypt_hash(client):
+    resp = signup(client, "alice")
+    assert resp.status_code == 302
+    pw_hash = stored_hash("alice")
+    assert pw_hash.startswith("$2b$04$")
+
+
+@pytest.mark.parametrize("password, message", [
+    ("Sh0rt!pw", b"Password must have at least 12 characters"),
+    ("alllowercase-123", b"Password must contain at least 1 upper and lower character"),
+    ("ALLUPPERCASE-123", b"Password must contain at least 1 upper and lower character"),
+    ("No-Digits-Here!!", b"Password must contain at least 1 digit"),
+    ("NoSpecials12345x", b"Password must contain at least 1 of these special character"),
+])
+def test_password_policy(client, password, message):
+    resp = signup(client, "alice", password=password)
+    assert resp.status_code == 200
+    assert message in resp.data
+    assert stored_hash("alice") is None
+
+
+@pytest.mark.parametrize("username, password", [("", "Correct-Horse-42!"), ("alice", ""), ("alice", None)])
+def test_missing_fields(client, username, password):
+    resp = signup(client, username, password=password)
+    assert resp.status_code == 200
+    assert b"You have to provide a username and password" in resp.data
+
+
+def test_username_taken(client):
+    assert signup(client, "alice").status_code == 302
+    resp = signup(client, "alice")
+    assert resp.status_code == 200
+    assert b"Username taken." in resp.data
+
+
+def test_username_taken_ignores_case(client):
+    assert signup(client, "alice").status_code == 302
+    assert b"Username taken." in signup(client, "ALICE").data